@@ -537,6 +537,7 @@ class SiemController extends Controller
       'description' => 'required|string',
       'threshold' => 'nullable|integer|min:1',
       'time_window' => 'nullable|integer|min:1',
+      'group_by' => 'nullable|string|max:64',
     ]);
 
     $result = $this->siemService->saveRule($request->all());
@@ -208,9 +208,11 @@ class SiemService
   public function ingestLog(string $logEntry, string $source = 'api', ?array $metadata = null): ?array
   {
     try {
+      // wait: get the alerts back even when the SIEM queues ingestion
       $payload = [
         'log' => $logEntry,
         'source' => $source,
+        'wait' => true,
       ];
 
       if ($metadata) {
@@ -255,6 +257,7 @@ class SiemService
         ->post("{$this->baseUrl}/api/ingest/batch", [
           'logs' => $logs,
           'default_source' => $defaultSource,
+          'wait' => true,
         ]);
 
       if ($response->successful()) {
@@ -151,6 +151,16 @@ export function SiemRulesList({ rules, isLoading }: Props) {
                         </span>
                       </div>
                     )}
+                    {rule.group_by && (
+                      <div className="flex items-center gap-1">
+                        <span className="text-gray-500 dark:text-gray-400">
+                          Per:
+                        </span>
+                        <span className="font-medium text-gray-700 dark:text-gray-300">
+                          {rule.group_by}
+                        </span>
+                      </div>
+                    )}
                   </div>
                 </div>
               </div>
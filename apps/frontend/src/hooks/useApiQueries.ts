@@ -1628,6 +1628,7 @@ export interface SiemRule {
   description: string;
   threshold?: number;
   time_window?: number;
+  group_by?: string;
 }
 
 export interface SiemAlertDistribution {
@@ -7,11 +7,13 @@ SIEM_HOST="${SIEM_HOST:-0.0.0.0}"
 SIEM_WORKERS="${SIEM_WORKERS:-2}"
 SIEM_TIMEOUT="${SIEM_TIMEOUT:-120}"
 SIEM_SECRET_KEY="${SIEM_SECRET_KEY:-change-this-in-production}"
+SIEM_ANALYSIS_WORKERS="${SIEM_ANALYSIS_WORKERS:-0}"
 
 # Export environment variables for the application
 export SIEM_PORT
 export SIEM_HOST
 export SIEM_SECRET_KEY
+export SIEM_ANALYSIS_WORKERS
 
 # Create necessary directories
 mkdir -p /app/logs /app/uploads /app/reports /data
@@ -23,11 +25,18 @@ echo "========================================"
 echo "Host: ${SIEM_HOST}"
 echo "Port: ${SIEM_PORT}"
 echo "Workers: ${SIEM_WORKERS}"
+echo "Analysis Workers: ${SIEM_ANALYSIS_WORKERS}"
 echo "Timeout: ${SIEM_TIMEOUT}s"
 echo "TIP Model Enabled: ${SIEM_TIP_ENABLED:-true}"
 echo "TIP Model Dir: ${SIEM_TIP_MODEL_DIR:-/app/model}"
 echo "========================================"
 
+# Analysis processes (one per shard) take the CPU-bound work off the web workers
+if [ "${SIEM_ANALYSIS_WORKERS}" -gt 0 ]; then
+    echo "Starting ${SIEM_ANALYSIS_WORKERS} analysis workers"
+    python siem_tool.py --analysis-workers &
+fi
+
 # Start SIEM server with gunicorn and gevent for WebSocket support
 echo "Starting SIEM server on ${SIEM_HOST}:${SIEM_PORT}"
 exec gunicorn \
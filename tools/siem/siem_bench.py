@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Offline rule-replay benchmark for the SIEM analyzer
+Author: SimpleSIEM
+Version: 1.0.0
+
+Replays a log corpus (files, or lines from a seeded synthetic generator
+modeled on generate_sample_logs) straight through SIEMAnalyzer, with no HTTP
+or Socket.IO in the way, against a throwaway store. Reports lines/sec,
+alerts/sec, per-rule cost and the memory high-water mark, and compares the
+result with a baseline report:
+
+    python siem_bench.py --save-baseline bench_baseline.json
+    python siem_bench.py --baseline bench_baseline.json --max-regression 10
+    python siem_bench.py uploads/ --repeat 200 --rules candidate_rules.json
+
+The exit status is 1 when throughput fell more than --max-regression percent
+below the baseline.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TOOL_DIR = Path(__file__).resolve().parent
+
+# (weight, template) pairs; placeholders are filled from the pools below
+SYNTHETIC_TEMPLATES = (
+    (30, "User '{user}' logged in successfully from {ip}"),
+    (25, 'GET /{page} HTTP/1.1 200 {size} "Mozilla/5.0" from {ip}'),
+    (10, "Session closed for user '{user}' after {size} seconds"),
+    (6, "Failed login attempt for user '{user}' from IP {ip}"),
+    (5, "Authentication failure for user '{user}' from {ip}"),
+    (4, "Firewall blocked SQL injection attempt from {ip}: ' OR '1'='1"),
+    (3, "Port scan detected from {ip}"),
+    (3, "File upload attempted by '{user}': {page}.php"),
+    (3, "XSS attempt detected from {ip}: <script>alert('{user}')</script>"),
+    (3, "Admin accessed sensitive configuration file from {ip}"),
+    (3, 'GET /static/../../etc/passwd HTTP/1.1 404 {size} from {ip}'),
+    (3, "Brute force attack detected from {ip}"),
+    (2, "Command injection blocked from {ip}: ;whoami"),
+)
+SYNTHETIC_USERS = ('admin', 'root', 'john', 'alice', 'bob', 'svc_backup', 'guest', 'mallory')
+SYNTHETIC_PAGES = ('index.html', 'login', 'api/v1/orders', 'static/app.js', 'images/logo.png', 'search', 'cart')
+
+
+def synthetic_corpus(lines, seed=0):
+    """Deterministic list of (log_line, source) pairs"""
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in SYNTHETIC_TEMPLATES]
+    templates = rng.choices([template for _, template in SYNTHETIC_TEMPLATES], weights=weights, k=lines)
+    return [
+        (template.format(
+            user=rng.choice(SYNTHETIC_USERS),
+            ip=f"{rng.choice((10, 172, 192, 203))}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            page=rng.choice(SYNTHETIC_PAGES),
+            size=rng.randrange(1, 50000)
+        ), 'synthetic')
+        for template in templates
+    ]
+
+
+def file_corpus(paths):
+    """(log_line, source) pairs from files and directories (their files, sorted), source = file stem"""
+    files = []
+    for path in paths:
+        path = Path(path)
+        files.extend(sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path])
+    entries = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            entries.extend((line.rstrip('\r\n'), path.stem) for line in f if line.strip())
+    return entries
+
+
+def load_siem(db_path):
+    """Import siem_tool against a store at db_path, analyzing in-process.
+
+    Has to run before anything else imports siem_tool: the store path, log
+    directory and analysis pool are fixed at import. Raises RuntimeError if siem_tool
+    is already imported against another store.
+    """
+    loaded = sys.modules.get('siem_tool')
+    if loaded is not None:
+        if Path(loaded.DB_PATH) != Path(db_path):
+            raise RuntimeError(f"siem_tool is already imported against {loaded.DB_PATH}, not {db_path}")
+        return loaded
+    os.environ['SIEM_DB_PATH'] = str(db_path)
+    # The application log goes next to the store, not into the checkout
+    os.environ['SIEM_LOG_DIR'] = str(Path(db_path).parent / 'logs')
+    os.environ['SIEM_ANALYSIS_WORKERS'] = '0'
+    os.environ['SIEM_INGEST_QUEUE_SIZE'] = '0'
+    os.environ.setdefault('SIEM_ASYNC_MODE', 'threading')
+    if str(TOOL_DIR) not in sys.path:
+        sys.path.insert(0, str(TOOL_DIR))
+    import siem_tool
+    return siem_tool
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_benchmark(siem_tool, entries, rules=None, runs=3, mode='batch', chunk_size=None, top=10):
+    """Replay entries runs times and report the fastest run.
+
+    mode 'batch' feeds SIEMAnalyzer.analyze_batch chunk_size lines at a time
+    (SIEM_ANALYSIS_CHUNK_SIZE by default), 'line' feeds analyze_log_line.
+    Per-rule cost covers every run.
+    """
+    if rules is None:
+        rules = siem_tool.RULES
+    chunk_size = chunk_size or siem_tool.ANALYSIS_CHUNK_SIZE
+    profiler = siem_tool.RuleProfiler()
+    siem_tool.RULES = rules
+    siem_tool.RULE_ENGINE = siem_tool.RuleEngine(rules, profiler=profiler)
+    analyzer = siem_tool.SIEMAnalyzer(tip_model=siem_tool.TIP_MODEL)
+
+    rss_before = _max_rss_mb()
+    app_logger = logging.getLogger('SIEM-Tool')
+    level = app_logger.level
+    app_logger.setLevel(logging.ERROR)  # one log record per alert would dominate the timings
+    timings = []
+    try:
+        for _ in range(max(runs, 1)):
+            started = time.perf_counter()
+            alerts = 0
+            if mode == 'line':
+                for log_line, source in entries:
+                    alerts += len(analyzer.analyze_log_line(log_line, source) or ())
+            else:
+                for start in range(0, len(entries), chunk_size):
+                    alerts += len(analyzer.analyze_batch(entries[start:start + chunk_size]))
+            timings.append((time.perf_counter() - started, alerts))
+    finally:
+        app_logger.setLevel(level)
+    rss_after = _max_rss_mb()
+
+    seconds, alerts = min(timings)
+    metrics = profiler.snapshot(rules, shared=False)
+    rule_seconds = sum(row['total_ms'] for row in metrics['rules']) or 1
+    return {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'mode': mode,
+        'chunk_size': chunk_size if mode == 'batch' else 1,
+        'runs': len(timings),
+        'rules_version': siem_tool.RULE_ENGINE.version,
+        'rules': len(rules),
+        'tip_available': bool(siem_tool.TIP_MODEL.available),
+        'lines': len(entries),
+        'alerts': alerts,
+        'seconds': round(seconds, 4),
+        'run_seconds': [round(run_seconds, 4) for run_seconds, _ in timings],
+        'lines_per_sec': round(len(entries) / seconds, 1) if seconds else 0.0,
+        'alerts_per_sec': round(alerts / seconds, 1) if seconds else 0.0,
+        'memory': {
+            'max_rss_mb': rss_after,
+            'rss_growth_mb': round(rss_after - rss_before, 1) if rss_after is not None else None
+        },
+        'rule_cost': [
+            {
+                'id': row['id'],
+                'evaluations': row['evaluations'],
+                'matches': row['matches'],
+                'total_ms': row['total_ms'],
+                'avg_us': row['avg_us'],
+                'p99_us': row['p99_us'],
+                'share': round(row['total_ms'] / rule_seconds, 4)
+            }
+            for row in metrics['rules'][:top]
+        ]
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Check report against baseline; returns (ok, messages).
+
+    Fails only on throughput (lines/sec) more than max_regression percent
+    below the baseline; corpus, rule or alert count differences are noted.
+    """
+    messages = []
+    for key in ('corpus', 'lines', 'mode', 'rules_version', 'alerts'):
+        if key in baseline and baseline[key] != report.get(key):
+            messages.append(f"note: {key} differs from baseline ({baseline[key]} -> {report[key]})")
+    reference = baseline.get('lines_per_sec') or 0
+    if not reference:
+        messages.append('note: baseline has no lines_per_sec; nothing to compare')
+        return True, messages
+    change = (report['lines_per_sec'] - reference) / reference * 100
+    ok = change >= -max_regression
+    messages.append(
+        f"{'ok' if ok else 'REGRESSION'}: {report['lines_per_sec']:.0f} lines/s vs baseline {reference:.0f} "
+        f"({change:+.1f}%, allowed -{max_regression:g}%)"
+    )
+    return ok, messages
+
+
+def format_report(report):
+    memory = report['memory']
+    lines = [
+        f"{report['lines']} lines, {report['runs']} run(s), {report['mode']} mode, "
+        f"rules {report['rules_version']} ({report['rules']} rules)",
+        f"best run: {report['seconds']:.3f}s  {report['lines_per_sec']:.0f} lines/s  "
+        f"{report['alerts_per_sec']:.0f} alerts/s ({report['alerts']} alerts)",
+        f"memory high-water: {memory['max_rss_mb']} MB (+{memory['rss_growth_mb']} MB during replay)",
+        '',
+        f"{'rule':<12}{'evaluations':>12}{'matches':>10}{'total ms':>11}{'avg us':>9}{'p99 us':>9}{'share':>8}",
+    ]
+    for row in report['rule_cost']:
+        lines.append(
+            f"{row['id']:<12}{row['evaluations']:>12}{row['matches']:>10}{row['total_ms']:>11.2f}"
+            f"{row['avg_us']:>9.2f}{row['p99_us']:>9.2f}{row['share']:>8.1%}"
+        )
+    return '\n'.join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Replay a log corpus through the SIEM analyzer and measure it')
+    parser.add_argument('corpus', nargs='*',
+                        help='log files or directories to replay (default: a synthetic corpus)')
+    parser.add_argument('--synthetic', type=int, default=50000, metavar='LINES',
+                        help='lines of synthetic corpus when no files are given (default: 50000)')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic corpus seed (default: 0)')
+    parser.add_argument('--repeat', type=int, default=1, help='replay the corpus this many times per run')
+    parser.add_argument('--runs', type=int, default=3, help='timed runs; the fastest is reported (default: 3)')
+    parser.add_argument('--mode', choices=('batch', 'line'), default='batch',
+                        help='analyze_batch chunks or analyze_log_line per line (default: batch)')
+    parser.add_argument('--chunk-size', type=int, help='lines per analyze_batch call (default: SIEM_ANALYSIS_CHUNK_SIZE)')
+    parser.add_argument('--rules', help='rules.json to benchmark instead of the installed one')
+    parser.add_argument('--top', type=int, default=10, help='rules listed in the per-rule cost table (default: 10)')
+    parser.add_argument('--baseline', help='baseline report to compare against')
+    parser.add_argument('--max-regression', type=float, default=10.0, metavar='PERCENT',
+                        help='allowed throughput drop against the baseline (default: 10)')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write this report as the new baseline')
+    parser.add_argument('--json', metavar='PATH', help='write the full report as JSON')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.corpus:
+        entries = file_corpus(args.corpus)
+        corpus_name = ', '.join(args.corpus)
+    else:
+        entries = synthetic_corpus(args.synthetic, args.seed)
+        corpus_name = f"synthetic:{args.synthetic}:{args.seed}"
+    entries = entries * max(args.repeat, 1)
+    if not entries:
+        print('Corpus is empty', file=sys.stderr)
+        return 2
+    rules = None
+    if args.rules:
+        with open(args.rules) as f:
+            rules = json.load(f)['rules']
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix='siem-bench-') as workdir:
+        # Called in-process after siem_tool was imported: benchmark that instance
+        siem_tool = sys.modules.get('siem_tool') or load_siem(Path(workdir) / 'bench.db')
+        report = run_benchmark(
+            siem_tool, entries, rules=rules, runs=args.runs, mode=args.mode, chunk_size=args.chunk_size, top=args.top
+        )
+    report['corpus'] = corpus_name
+    print(format_report(report))
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if baseline is None:
+        return 0
+    ok, messages = compare(report, baseline, args.max_regression)
+    print()
+    print('\n'.join(messages))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
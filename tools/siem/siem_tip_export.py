@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+TIP model exporter for the SIEM's lightweight inference runtime
+Author: SimpleSIEM
+Version: 1.0.0
+
+Converts the trained TIP model (cicids2017_model.h5 with scaler.pkl and
+label_encoder.pkl, which need TensorFlow and scikit-learn to load) into the
+bundle siem_tool.TIPModel runs with NumPy alone: one .npy file per weight
+array plus manifest.json, in <model_dir>/runtime. With --onnx the bundle also
+carries model.onnx (needs tf2onnx) for ONNX Runtime. The export is then
+verified by running both the Keras model and the bundle over the same rows:
+
+    python siem_tip_export.py
+    python siem_tip_export.py --model-dir ../TIP_Model/model --onnx
+    python siem_tip_export.py --verify-only --samples flows.csv --tolerance 1e-4
+
+The exit status is 1 when the bundle's predictions differ from the Keras
+model's by more than --tolerance.
+"""
+
+import os
+import sys
+import json
+import shutil
+import pickle
+import hashlib
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+TOOL_DIR = Path(__file__).resolve().parent
+
+# Keras layers that do nothing at inference time on 2-D input
+PASSTHROUGH_LAYERS = {'InputLayer', 'Dropout', 'Flatten', 'GaussianNoise', 'GaussianDropout', 'AlphaDropout'}
+
+
+def _activation_name(activation):
+    return activation if isinstance(activation, str) else getattr(activation, '__name__', str(activation))
+
+
+def layer_spec(layer, activations):
+    """(spec, arrays) describing one Keras layer, or None for layers to skip.
+
+    Raises ValueError for layers the runtime cannot evaluate.
+    """
+    kind = type(layer).__name__
+    config = layer.get_config()
+    weights = layer.get_weights()
+    if kind in PASSTHROUGH_LAYERS:
+        return None
+    if kind == 'Dense':
+        spec = {'type': 'dense', 'activation': _activation_name(config.get('activation', 'linear'))}
+        arrays = {'kernel': weights[0]}
+        if config.get('use_bias', True):
+            arrays['bias'] = weights[1]
+    elif kind == 'Activation':
+        spec, arrays = {'type': 'activation', 'activation': _activation_name(config['activation'])}, {}
+    elif kind == 'ReLU' and not config.get('max_value') and not config.get('negative_slope') \
+            and not config.get('threshold'):
+        spec, arrays = {'type': 'activation', 'activation': 'relu'}, {}
+    elif kind == 'Softmax' and config.get('axis', -1) in (-1, [-1]):
+        spec, arrays = {'type': 'activation', 'activation': 'softmax'}, {}
+    elif kind == 'BatchNormalization':
+        weights = list(weights)
+        gamma = weights.pop(0) if config.get('scale', True) else None
+        beta = weights.pop(0) if config.get('center', True) else None
+        mean, variance = weights
+        spec = {'type': 'batch_norm', 'epsilon': float(config.get('epsilon', 1e-3))}
+        arrays = {
+            'gamma': gamma if gamma is not None else mean * 0 + 1,
+            'beta': beta if beta is not None else mean * 0,
+            'mean': mean,
+            'variance': variance,
+        }
+    else:
+        raise ValueError(f"layer {layer.name!r}: {kind} is not supported by the runtime")
+    if spec.get('activation', 'linear') not in activations:
+        raise ValueError(f"layer {layer.name!r}: activation {spec['activation']!r} is not supported by the runtime")
+    return spec, arrays
+
+
+def scaler_spec(scaler, np, n_features):
+    """(spec, arrays) for a fitted StandardScaler or MinMaxScaler"""
+    kind = type(scaler).__name__
+    if kind == 'StandardScaler':
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+        return {'kind': 'standard'}, {'mean': mean, 'scale': scale}
+    if kind == 'MinMaxScaler':
+        return {'kind': 'minmax'}, {'scale': scaler.scale_, 'min': scaler.min_}
+    raise ValueError(f"{kind} is not supported by the runtime; expected StandardScaler or MinMaxScaler")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_bundle(out_dir, features, scaler, layers, labels, source=None, onnx_file=None):
+    """Write a runtime bundle to out_dir, replacing any bundle already there.
+
+    scaler is (spec, arrays) and layers a list of them, as scaler_spec and
+    layer_spec return; network weights are stored as float32 (what Keras
+    computes in), scaler arrays as float64. onnx_file is copied in when given.
+    """
+    import numpy as np
+    out_dir = Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f".{out_dir.name}.", dir=out_dir.parent))
+    try:
+        def save(name, array, dtype):
+            np.save(staging / name, np.ascontiguousarray(array, dtype=dtype))
+            return name
+
+        scaler_kind, scaler_arrays = scaler
+        manifest = {
+            'format': 1,
+            'exported_at': datetime.now().isoformat(),
+            'source': source or {},
+            'features': list(features),
+            'scaler': dict(scaler_kind, arrays={
+                key: save(f"scaler_{key}.npy", value, np.float64) for key, value in scaler_arrays.items()
+            }),
+            'layers': [
+                dict(spec, arrays={
+                    key: save(f"layer{index}_{key}.npy", value, np.float32) for key, value in arrays.items()
+                })
+                for index, (spec, arrays) in enumerate(layers)
+            ],
+            'labels': [str(label) for label in labels],
+            'onnx': None,
+        }
+        if onnx_file is not None:
+            shutil.copyfile(onnx_file, staging / 'model.onnx')
+            manifest['onnx'] = 'model.onnx'
+        (staging / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+        if out_dir.exists():
+            shutil.rmtree(out_dir)
+        os.replace(staging, out_dir)
+    finally:
+        if staging.exists():
+            shutil.rmtree(staging)
+    return manifest
+
+
+def export(siem_tool, model_dir, out_dir, onnx=False):
+    """Convert the Keras model in model_dir into a runtime bundle in out_dir"""
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    model_path, scaler_path, label_path = (model_dir / name for name in siem_tool.TIP_MODEL_FILES)
+    model = load_model(model_path)
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    with open(label_path, 'rb') as f:
+        label_encoder = pickle.load(f)
+
+    features = siem_tool.TIP_FEATURES
+    layers = [spec for spec in (layer_spec(layer, siem_tool.TIP_ACTIVATIONS) for layer in model.layers) if spec]
+    source = {path.name: _sha256(path) for path in (model_path, scaler_path, label_path)}
+
+    with tempfile.TemporaryDirectory() as scratch:
+        onnx_file = None
+        if onnx:
+            import tf2onnx
+            onnx_file = Path(scratch) / 'model.onnx'
+            signature = [tf.TensorSpec((None, len(features)), tf.float32, name='features')]
+            tf2onnx.convert.from_keras(model, input_signature=signature, output_path=str(onnx_file))
+        return write_bundle(
+            out_dir, features, scaler_spec(scaler, np, len(features)), layers,
+            label_encoder.classes_, source=source, onnx_file=onnx_file
+        )
+
+
+def sample_rows(out_dir, count, seed=0):
+    """count synthetic raw feature rows spread over the range a bundle's scaler was fitted on"""
+    import numpy as np
+    manifest = json.loads((Path(out_dir) / 'manifest.json').read_text(encoding='utf-8'))
+    arrays = {key: np.load(Path(out_dir) / name) for key, name in manifest['scaler']['arrays'].items()}
+    rng = np.random.default_rng(seed)
+    width = len(manifest['features'])
+    if manifest['scaler']['kind'] == 'standard':
+        return rng.standard_normal((count, width)) * arrays['scale'] + arrays['mean']
+    return (rng.uniform(0, 1, (count, width)) - arrays['min']) / arrays['scale']
+
+
+def csv_rows(siem_tool, path, limit):
+    """Feature rows from a CICIDS-style CSV with every TIP feature column"""
+    import csv
+    import numpy as np
+    model = siem_tool.TIPModel()
+    rows = []
+    with open(path, newline='', encoding='utf-8', errors='ignore') as f:
+        reader = csv.reader(f)
+        columns = model.feature_columns(next(reader, None) or [])
+        if columns is None:
+            raise ValueError(f"{path} does not have every TIP feature column")
+        for record in reader:
+            try:
+                rows.append([float(record[index]) for index in columns])
+            except (ValueError, IndexError):
+                continue
+            if len(rows) >= limit:
+                break
+    matrix = np.asarray(rows, dtype=np.float64).reshape(-1, len(columns))
+    return matrix[np.isfinite(matrix).all(axis=1)]
+
+
+def compare(reference, candidate, rows, tolerance):
+    """How closely two runtimes agree over the same raw rows.
+
+    A label mismatch only counts when the reference's top two probabilities
+    are further apart than tolerance (otherwise either label is a tie).
+    """
+    import numpy as np
+    expected = np.asarray(reference.forward(reference.transform(rows)), dtype=np.float64).reshape(len(rows), -1)
+    actual = np.asarray(candidate.forward(candidate.transform(rows)), dtype=np.float64).reshape(len(rows), -1)
+    if expected.shape != actual.shape:
+        return {'rows': len(rows), 'ok': False, 'error': f"output shapes differ: {expected.shape} vs {actual.shape}"}
+    diff = np.abs(expected - actual)
+    top = np.sort(expected, axis=1)
+    margin = top[:, -1] - top[:, -2] if expected.shape[1] > 1 else np.full(len(rows), np.inf)
+    mismatched = (expected.argmax(axis=1) != actual.argmax(axis=1)) & (margin > tolerance)
+    return {
+        'rows': len(rows),
+        'max_abs_diff': float(diff.max()) if diff.size else 0.0,
+        'mean_abs_diff': float(diff.mean()) if diff.size else 0.0,
+        'label_mismatches': int(mismatched.sum()),
+        'tolerance': tolerance,
+        'ok': bool(diff.size == 0 or diff.max() <= tolerance) and not mismatched.any(),
+    }
+
+
+def verify(siem_tool, model_dir, out_dir, rows=2000, samples=None, tolerance=1e-4, seed=0):
+    """Compare the Keras model with the bundle's NumPy (and ONNX, if present) runtimes"""
+    reference = siem_tool._KerasTIPRuntime(model_dir)
+    bundle = siem_tool._NumpyTIPRuntime(out_dir)
+    matrix = csv_rows(siem_tool, samples, rows) if samples else sample_rows(out_dir, rows, seed)
+    report = {'numpy': compare(reference, bundle, matrix, tolerance)}
+    if bundle.manifest.get('onnx'):
+        try:
+            report['onnx'] = compare(reference, siem_tool._OnnxTIPRuntime(out_dir), matrix, tolerance)
+        except ImportError as exc:
+            report['onnx'] = {'ok': True, 'skipped': f"onnxruntime unavailable: {exc}"}
+    return report
+
+
+def build_parser():
+    default_dir = os.environ.get('SIEM_TIP_MODEL_DIR') or str(TOOL_DIR / '..' / 'TIP_Model' / 'model')
+    parser = argparse.ArgumentParser(description="Export the TIP model for the SIEM's NumPy/ONNX runtime")
+    parser.add_argument('--model-dir', default=default_dir, help='directory with the .h5 model and pickles')
+    parser.add_argument('--out', help='bundle directory (default: <model-dir>/runtime)')
+    parser.add_argument('--onnx', action='store_true', help='also export model.onnx (needs tf2onnx)')
+    parser.add_argument('--verify-only', action='store_true', help='verify an existing bundle without exporting')
+    parser.add_argument('--no-verify', action='store_true', help='skip comparing the bundle with the Keras model')
+    parser.add_argument('--samples', help='CSV of flows to verify with (default: synthetic rows)')
+    parser.add_argument('--rows', type=int, default=2000, help='rows to verify with (default 2000)')
+    parser.add_argument('--tolerance', type=float, default=1e-4,
+                        help='largest allowed probability difference (default 1e-4)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sys.path.insert(0, str(TOOL_DIR))
+    from siem_bench import load_siem
+
+    model_dir = Path(args.model_dir).resolve()
+    with tempfile.TemporaryDirectory() as scratch:
+        siem_tool = load_siem(Path(scratch) / 'export.db')
+        out_dir = Path(args.out).resolve() if args.out else model_dir / siem_tool.TIP_RUNTIME_DIR
+        if not args.verify_only:
+            manifest = export(siem_tool, model_dir, out_dir, onnx=args.onnx)
+            print(f"Exported {len(manifest['layers'])} layers, {len(manifest['labels'])} labels to {out_dir}")
+        if args.no_verify:
+            return 0
+        report = verify(siem_tool, model_dir, out_dir, args.rows, args.samples, args.tolerance, args.seed)
+    print(json.dumps(report, indent=2))
+    return 0 if all(result['ok'] for result in report.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,24 +7,55 @@ Version: 1.0.0
 
 import os
 import re
+import math
+import uuid
+import zlib
+import argparse
+import multiprocessing
+import select
+import struct
+import ctypes
+import ctypes.util
 import json
 import time
 import threading
+import queue
 import csv
 import pickle
+import hashlib
+import ipaddress
+import bisect
+import heapq
+import sqlite3
+from array import array
 from pathlib import Path
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import defaultdict, deque, OrderedDict, namedtuple
 from flask import Flask, request, render_template_string, jsonify, send_from_directory
 from flask_socketio import SocketIO, emit
 import logging
 
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+try:
+    import regex as timeout_regex  # optional: enforces SIEM_RULE_TIMEOUT_MS
+except ImportError:
+    timeout_regex = None
+
+BASE_DIR = Path(__file__).resolve().parent
+LOG_DIR = Path(os.environ.get('SIEM_LOG_DIR', str(BASE_DIR / 'logs')))
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('logs/siem.log'),
+        logging.FileHandler(LOG_DIR / 'siem.log'),
         logging.StreamHandler()
     ]
 )
@@ -34,32 +65,980 @@ logger = logging.getLogger('SIEM-Tool')
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SIEM_SECRET_KEY', 'your-secret-key-here-change-in-production')
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('SIEM_MAX_UPLOAD_MB', '16')) * 1024 * 1024
 
 # Use gevent for production, threading for development
 async_mode = os.environ.get('SIEM_ASYNC_MODE', 'gevent')
 socketio = SocketIO(app, async_mode=async_mode, cors_allowed_origins="*")
 
-BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / app.config['UPLOAD_FOLDER']
-LOG_DIR = BASE_DIR / 'logs'
 REPORT_DIR = BASE_DIR / 'reports'
 
 # Create necessary directories
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-LOG_DIR.mkdir(parents=True, exist_ok=True)
 REPORT_DIR.mkdir(parents=True, exist_ok=True)
 
 # Load detection rules
 with open(BASE_DIR / 'rules.json', 'r') as f:
     RULES = json.load(f)['rules']
 
-# In-memory storage for alerts and logs
-alerts = []
-log_entries = []
-event_store = defaultdict(deque)
-alert_history = []
+DB_PATH = Path(os.environ.get('SIEM_DB_PATH', str(BASE_DIR / 'data' / 'siem.db')))
+LOG_RETENTION_DAYS = int(os.environ.get('SIEM_LOG_RETENTION_DAYS', '7'))
+ALERT_RETENTION_DAYS = int(os.environ.get('SIEM_ALERT_RETENTION_DAYS', '30'))
+# Seconds repeats of an alert are folded into the first one (0 disables)
+ALERT_AGGREGATE_WINDOW = float(os.environ.get('SIEM_ALERT_AGGREGATE_WINDOW', '300'))
+SEARCH_MAX_LIMIT = 1000
+# Rule set versions kept in the store
+RULE_SET_HISTORY = 50
+
+# Alert rollup granularities: bucket key format (local time) and days kept
+ROLLUP_GRANULARITIES = {
+    'minute': ('%Y-%m-%d %H:%M', 2),
+    'hour': ('%Y-%m-%d %H:00', 35),
+    'day': ('%Y-%m-%d', 400),
+}
+# Trend periods: look-back window and the rollup granularity that answers it
+TREND_PERIODS = {
+    '1h': (timedelta(hours=1), 'minute'),
+    '6h': (timedelta(hours=6), 'hour'),
+    '24h': (timedelta(hours=24), 'hour'),
+    '7d': (timedelta(days=7), 'day'),
+    '30d': (timedelta(days=30), 'day'),
+}
+
+_PARTITION_GLOB = '_[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]'
+_SEARCH_IP_RE = re.compile(r'(?<![\w.])\d{1,3}(?:\.\d{1,3}){3}(?!\w|\.\d)')
+_SEARCH_TERM_RE = re.compile(_SEARCH_IP_RE.pattern + r'|\w+')
+_SEARCH_USER_HINTS = ('user', 'account', 'for ')
+_SEARCH_USER_RES = (
+    re.compile(r"""\b(?:user(?:name)?|account)\b["']?\s*[=:]?\s*["']?([\w.@-]+)""", re.I),
+    re.compile(r'\bfor (?:invalid user )?([\w.@-]+) from\b', re.I),
+)
+
+
+def _search_terms(text):
+    """Index/query terms of a text: whole IPv4 addresses plus lower-cased words"""
+    return set(_SEARCH_TERM_RE.findall(text.lower()))
+
+
+def _search_user_terms(text):
+    lowered = text.lower()
+    if not any(hint in lowered for hint in _SEARCH_USER_HINTS):
+        return set()
+    return {f"user:{match.lower()}" for regex in _SEARCH_USER_RES for match in regex.findall(text)}
+
+
+def _search_source_term(source):
+    return 'src:' + re.sub(r'[^\w.:@-]', '_', str(source).lower())
+
+
+# Position in a tailed file up to which its lines are stored. The head hash
+# covers the first head_length bytes, so a file replaced or rewritten in
+# place under the same inode is not mistaken for the one checkpointed.
+TailCheckpoint = namedtuple('TailCheckpoint', 'path inode offset head_length head_hash')
+TAIL_HEAD_BYTES = 1024
+
+
+class _StoreTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+_FINGERPRINT_VARIABLE = re.compile(r'0x[0-9a-f]+|\b[0-9a-f]{8,}\b|\d+', re.IGNORECASE)
+
+
+def _alert_aggregate_key(alert):
+    """Alerts with the same key are repeats: rule, source and the line with numbers masked"""
+    fingerprint = _FINGERPRINT_VARIABLE.sub('#', ' '.join(str(alert.get('log_entry', '')).split()))
+    digest = hashlib.sha1(fingerprint.encode('utf-8', errors='replace')).hexdigest()
+    return f"{alert['rule_id']}|{alert['source']}|{digest}"
+
+
+class SIEMStore:
+    """SQLite (WAL) storage for logs and alerts shared by every worker process.
+
+    Logs and alerts live in one table per local day (logs_YYYYMMDD,
+    alerts_YYYYMMDD), so retention drops whole partitions instead of deleting
+    rows. Lifetime totals are rolled up into the counters table and survive
+    retention. Each thread gets its own connection.
+
+    Every log partition has a contentless FTS5 index (logs_YYYYMMDD_terms)
+    filled at ingest with the line's words, IP addresses, usernames and
+    source, keyed by the log row id.
+
+    Alert counts are also rolled up per minute, hour and day by severity,
+    rule and source (alert_rollups) as alerts are stored, so trends are
+    read from a handful of buckets instead of the alerts themselves.
+
+    Alert ids come from a store-wide counter, so they are unique and
+    increasing across processes and restarts. alert_ids maps each id to its
+    partition for direct lookups, and every alert partition has a partial
+    index of its unacknowledged alerts, counted in 'alerts:unacked'.
+
+    Repeats of an alert (same rule, source and line fingerprint, see
+    _alert_aggregate_key) within aggregate_window seconds of its first
+    occurrence update that alert's count and last_seen in place instead of
+    storing another one; alert_aggregates maps each open key to its alert.
+    """
+
+    def __init__(self, path, log_retention_days=LOG_RETENTION_DAYS, alert_retention_days=ALERT_RETENTION_DAYS,
+                 aggregate_window=ALERT_AGGREGATE_WINDOW):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.log_retention_days = log_retention_days
+        self.alert_retention_days = alert_retention_days
+        self.aggregate_window = aggregate_window
+        self._local = threading.local()
+        self._partitions = set()
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS alert_rollups ('
+                'granularity TEXT NOT NULL, bucket TEXT NOT NULL, severity TEXT NOT NULL, rule_id TEXT NOT NULL, '
+                'source TEXT NOT NULL, count INTEGER NOT NULL, '
+                'PRIMARY KEY (granularity, bucket, severity, rule_id, source)) WITHOUT ROWID'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tail_checkpoints ('
+                'path TEXT PRIMARY KEY, inode INTEGER NOT NULL, offset INTEGER NOT NULL, '
+                'head_length INTEGER NOT NULL, head_hash TEXT NOT NULL, updated REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ingest_queue ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, shard INTEGER NOT NULL, ticket TEXT NOT NULL, '
+                'payload TEXT NOT NULL, created REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)'
+            )
+            self._add_column(conn, 'ingest_queue', 'attempts', 'INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS ingest_queue_shard ON ingest_queue (shard, seq)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ingest_results ('
+                'seq INTEGER PRIMARY KEY, ticket TEXT NOT NULL, alerts TEXT NOT NULL, created REAL NOT NULL, '
+                'error TEXT)'
+            )
+            self._add_column(conn, 'ingest_results', 'error', 'TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS ingest_results_ticket ON ingest_results (ticket)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ingest_dead_letters ('
+                'seq INTEGER PRIMARY KEY, shard INTEGER NOT NULL, ticket TEXT NOT NULL, payload TEXT NOT NULL, '
+                'error TEXT NOT NULL, attempts INTEGER NOT NULL, created REAL NOT NULL, failed REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS threshold_events (rule_id TEXT NOT NULL, key TEXT NOT NULL, ts REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS threshold_events_key ON threshold_events (rule_id, key, ts)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rule_metrics (process TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pipeline_metrics ('
+                'process TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS upload_results ('
+                'content_hash TEXT NOT NULL, source TEXT NOT NULL, rules_version TEXT NOT NULL, '
+                'model_version TEXT NOT NULL, run TEXT NOT NULL, alerts TEXT NOT NULL, created REAL NOT NULL, '
+                'PRIMARY KEY (content_hash, source, rules_version, model_version))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS upload_results_created ON upload_results (created)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS alert_aggregates ('
+                'key TEXT PRIMARY KEY, alert_id TEXT NOT NULL, partition TEXT NOT NULL, first_seen REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS alert_aggregates_first_seen ON alert_aggregates (first_seen)')
+            index_alerts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alert_ids'"
+            ).fetchone() is None
+            conn.execute('CREATE TABLE IF NOT EXISTS alert_ids (id TEXT PRIMARY KEY, partition TEXT NOT NULL) WITHOUT ROWID')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rule_sets (version INTEGER PRIMARY KEY, rules TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS alert_ids_partition ON alert_ids (partition)')
+        self.search_indexed = self._fts5_available()
+        if not self.search_indexed:
+            logger.warning("SQLite FTS5 unavailable; log search falls back to scanning")
+        if index_alerts:
+            self._index_stored_alerts()
+        self.enforce_retention()
+
+    @staticmethod
+    def _add_column(conn, table, column, definition):
+        """Add a column that stores created by older versions lack"""
+        if column not in {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def _index_stored_alerts(self):
+        """Register alerts stored before alert_ids existed"""
+        with self._transaction() as conn:
+            unacked = 0
+            for name in self._partition_names('alerts'):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_unacked ON {name} (seq) WHERE acknowledged = 0')
+                conn.execute(f"INSERT OR IGNORE INTO alert_ids (id, partition) SELECT id, '{name}' FROM {name}")
+                unacked += conn.execute(f'SELECT COUNT(*) FROM {name} WHERE acknowledged = 0').fetchone()[0]
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('alerts:unacked', ?) "
+                'ON CONFLICT(name) DO UPDATE SET value = excluded.value',
+                (unacked,)
+            )
+
+    def _fts5_available(self):
+        try:
+            self._connection().execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+            self._connection().execute('DROP TABLE temp.fts5_probe')
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _StoreTransaction(self._connection())
+
+    @staticmethod
+    def _day(ts):
+        return datetime.fromtimestamp(ts).strftime('%Y%m%d')
+
+    def _ensure_partition(self, conn, kind, day):
+        name = f"{kind}_{day}"
+        if name in self._partitions:
+            return name
+        if kind == 'logs':
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} ('
+                'id INTEGER PRIMARY KEY, ts REAL NOT NULL, source TEXT NOT NULL, message TEXT NOT NULL)'
+            )
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_ts ON {name} (ts)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_source ON {name} (source, ts)')
+            if self.search_indexed:
+                conn.execute(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {name}_terms USING fts5('
+                    "terms, content='', detail=none, columnsize=0, tokenize=\"unicode61 tokenchars '.:@-_'\")"
+                )
+        else:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} ('
+                'seq INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, ts REAL NOT NULL, rule_id TEXT NOT NULL, '
+                'severity TEXT NOT NULL, source TEXT NOT NULL, acknowledged INTEGER NOT NULL DEFAULT 0, '
+                'data TEXT NOT NULL)'
+            )
+            for column in ('ts', 'source', 'severity', 'rule_id'):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_{column} ON {name} ({column}, ts)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_unacked ON {name} (seq) WHERE acknowledged = 0')
+        self._partitions.add(name)
+        return name
+
+    def _partition_names(self, kind, since=None, until=None, newest_first=True):
+        rows = self._connection().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?", (kind + _PARTITION_GLOB,)
+        ).fetchall()
+        names = sorted((row[0] for row in rows), reverse=newest_first)
+        if since is not None:
+            first = f"{kind}_{self._day(since)}"
+            names = [name for name in names if name >= first]
+        if until is not None:
+            last = f"{kind}_{self._day(until)}"
+            names = [name for name in names if name <= last]
+        return names
+
+    def enforce_retention(self):
+        """Drop log and alert partitions older than their retention window and expire old rollups"""
+        now = time.time()
+        dropped = []
+        for kind, days in (('logs', self.log_retention_days), ('alerts', self.alert_retention_days)):
+            if days <= 0:
+                continue
+            oldest = f"{kind}_{self._day(now - days * 86400)}"
+            dropped.extend(name for name in self._partition_names(kind) if name < oldest)
+        with self._transaction() as conn:
+            for name in dropped:
+                if name.startswith('alerts_'):
+                    unacked = conn.execute(f'SELECT COUNT(*) FROM {name} WHERE acknowledged = 0').fetchone()[0]
+                    self._add_counter(conn, 'alerts:unacked', -unacked)
+                    conn.execute('DELETE FROM alert_ids WHERE partition = ?', (name,))
+                conn.execute(f'DROP TABLE IF EXISTS {name}_terms')
+                conn.execute(f'DROP TABLE IF EXISTS {name}')
+            if self.log_retention_days > 0:
+                conn.execute(
+                    'DELETE FROM ingest_dead_letters WHERE failed < ?', (now - self.log_retention_days * 86400,)
+                )
+            for granularity, (bucket_format, days) in ROLLUP_GRANULARITIES.items():
+                oldest = datetime.fromtimestamp(now - days * 86400).strftime(bucket_format)
+                conn.execute(
+                    'DELETE FROM alert_rollups WHERE granularity = ? AND bucket < ?', (granularity, oldest)
+                )
+        if dropped:
+            self._partitions.difference_update(dropped)
+            logger.info("Dropped expired partitions: %s", ', '.join(dropped))
+        return dropped
+
+    def append(self, timestamp, log_lines, sources, new_alerts=(), checkpoint=None, queue_item=None):
+        """Store a batch of log lines and alerts in one transaction.
+
+        Alerts get their ids here, from a counter shared by every worker.
+        Repeated alerts are aggregated here too: each new alert gets count,
+        first_seen and last_seen, and a repeat of one still open (by any
+        process) is folded into it instead.
+        A tailed file's checkpoint, when given, commits in the same
+        transaction, so the lines it covers are stored exactly once; so does
+        taking a (seq, ticket) batch off the ingest queue and posting its
+        alerts for the submitter.
+
+        Returns (the store-wide number of the batch's last log line, or None
+        without lines; see log_count) and the alerts as stored, one per
+        aggregate: the new ones (the dicts passed in, now with ids) and
+        copies of the earlier ones they updated.
+        """
+        ts = timestamp.timestamp()
+        day = self._day(ts)
+        new_day = f"logs_{day}" not in self._partitions
+        increments = defaultdict(int)
+        last_log = None
+        stored_alerts = []
+        with self._transaction() as conn:
+            if log_lines:
+                last_log = conn.execute(
+                    "INSERT INTO counters (name, value) VALUES ('logs', ?) "
+                    'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value RETURNING value',
+                    (len(log_lines),)
+                ).fetchone()[0]
+                logs_table = self._ensure_partition(conn, 'logs', day)
+                # The write lock is held, so the next ids are known up front
+                first_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {logs_table}').fetchone()[0]
+                conn.executemany(
+                    f'INSERT INTO {logs_table} (id, ts, source, message) VALUES (?, ?, ?, ?)',
+                    [(first_id + offset, ts, str(source), line)
+                     for offset, (line, source) in enumerate(zip(log_lines, sources))]
+                )
+                if self.search_indexed:
+                    conn.executemany(
+                        f'INSERT INTO {logs_table}_terms (rowid, terms) VALUES (?, ?)',
+                        [(first_id + offset, ' '.join(
+                            _search_terms(line) | _search_user_terms(line) | {_search_source_term(source)}
+                        )) for offset, (line, source) in enumerate(zip(log_lines, sources))]
+                    )
+            if new_alerts:
+                alerts_table = self._ensure_partition(conn, 'alerts', day)
+                # Rollups count every occurrence, aggregated or not
+                rollup = defaultdict(int)
+                groups = OrderedDict()
+                for position, alert in enumerate(new_alerts):
+                    rollup[(alert['severity'], alert['rule_id'], str(alert['source']))] += 1
+                    key = _alert_aggregate_key(alert) if self.aggregate_window > 0 else position
+                    groups.setdefault(key, []).append(alert)
+
+                fresh = []
+                for key, group in groups.items():
+                    updated = None
+                    if self.aggregate_window > 0:
+                        updated = self._update_aggregate(conn, key, len(group), ts, group[-1]['timestamp'])
+                    if updated is not None:
+                        increments['alert_repeats'] += len(group)
+                        stored_alerts.append(updated)
+                        continue
+                    alert = group[0]
+                    alert['count'] = len(group)
+                    alert['first_seen'] = alert['timestamp']
+                    alert['last_seen'] = group[-1]['timestamp']
+                    increments['alert_repeats'] += len(group) - 1
+                    fresh.append((key, alert))
+                    stored_alerts.append(alert)
+
+                if fresh:
+                    last_id = conn.execute(
+                        "INSERT INTO counters (name, value) VALUES ('alerts', ?) "
+                        'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value RETURNING value',
+                        (len(fresh),)
+                    ).fetchone()[0]
+                    first_id = last_id - len(fresh) + 1
+                    rows = []
+                    for offset, (_, alert) in enumerate(fresh):
+                        alert['id'] = f"ALERT-{first_id + offset:06d}"
+                        increments[f"alerts:{alert['severity']}"] += 1
+                        rows.append((alert['id'], ts, alert['rule_id'], alert['severity'], str(alert['source']),
+                                     json.dumps(alert)))
+                    increments['alerts:unacked'] += len(fresh)
+                    conn.executemany(
+                        f'INSERT INTO {alerts_table} (id, ts, rule_id, severity, source, data) VALUES (?, ?, ?, ?, ?, ?)',
+                        rows
+                    )
+                    conn.executemany(
+                        'INSERT INTO alert_ids (id, partition) VALUES (?, ?)',
+                        [(alert['id'], alerts_table) for _, alert in fresh]
+                    )
+                    if self.aggregate_window > 0:
+                        conn.execute('DELETE FROM alert_aggregates WHERE first_seen < ?', (ts - self.aggregate_window,))
+                        conn.executemany(
+                            'INSERT OR REPLACE INTO alert_aggregates (key, alert_id, partition, first_seen) '
+                            'VALUES (?, ?, ?, ?)',
+                            [(key, alert['id'], alerts_table, ts) for key, alert in fresh]
+                        )
+                conn.executemany(
+                    'INSERT INTO alert_rollups (granularity, bucket, severity, rule_id, source, count) '
+                    'VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT DO UPDATE SET count = count + excluded.count',
+                    [(granularity, timestamp.strftime(bucket_format), *key, count)
+                     for granularity, (bucket_format, _) in ROLLUP_GRANULARITIES.items()
+                     for key, count in rollup.items()]
+                )
+            if increments:
+                conn.executemany(
+                    'INSERT INTO counters (name, value) VALUES (?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                    list(increments.items())
+                )
+            if checkpoint is not None:
+                self._save_checkpoint(conn, checkpoint)
+            if queue_item is not None:
+                seq, ticket = queue_item
+                conn.execute('DELETE FROM ingest_queue WHERE seq = ?', (seq,))
+                conn.execute(
+                    'INSERT INTO ingest_results (seq, ticket, alerts, created) VALUES (?, ?, ?, ?)',
+                    (seq, ticket, json.dumps(stored_alerts), time.time())
+                )
+        if new_day and log_lines:
+            self.enforce_retention()
+        return last_log, stored_alerts
+
+    def _update_aggregate(self, conn, key, count, ts, last_seen):
+        """Fold count repeats into the open, unacknowledged alert for key; the updated alert or None"""
+        row = conn.execute(
+            'SELECT alert_id, partition FROM alert_aggregates WHERE key = ? AND first_seen >= ?',
+            (key, ts - self.aggregate_window)
+        ).fetchone()
+        if row is None:
+            return None
+        alert_id, partition = row
+        try:
+            row = conn.execute(
+                f"UPDATE {partition} SET data = json_set(data, '$.count', "
+                "COALESCE(json_extract(data, '$.count'), 1) + ?, '$.last_seen', ?) "
+                'WHERE id = ? AND acknowledged = 0 RETURNING data',
+                (count, last_seen, alert_id)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # The partition was dropped by retention
+            return None
+        return self._load_alert(row[0], False) if row else None
+
+    @staticmethod
+    def _add_counter(conn, name, delta):
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, delta)
+        )
+
+    @staticmethod
+    def _alert_partition(conn, alert_id):
+        row = conn.execute('SELECT partition FROM alert_ids WHERE id = ?', (str(alert_id),)).fetchone()
+        return row[0] if row else None
+
+    def get_alert(self, alert_id):
+        """The alert with this id, or None"""
+        conn = self._connection()
+        name = self._alert_partition(conn, alert_id)
+        if name is None:
+            return None
+        row = conn.execute(f'SELECT data, acknowledged FROM {name} WHERE id = ?', (str(alert_id),)).fetchone()
+        return self._load_alert(*row) if row else None
+
+    def acknowledge_alert(self, alert_id):
+        """Mark an alert acknowledged; returns the alert or None"""
+        alerts = self.acknowledge_alerts([alert_id])
+        return alerts[0] if alerts else None
+
+    def acknowledge_alerts(self, alert_ids):
+        """Mark alerts acknowledged by id; returns the ones that exist, in the order given"""
+        found = []
+        newly = 0
+        with self._transaction() as conn:
+            for alert_id in alert_ids:
+                name = self._alert_partition(conn, alert_id)
+                if name is None:
+                    continue
+                row = conn.execute(f'SELECT data, acknowledged FROM {name} WHERE id = ?', (str(alert_id),)).fetchone()
+                if row is None:
+                    continue
+                if not row[1]:
+                    conn.execute(f'UPDATE {name} SET acknowledged = 1 WHERE id = ?', (str(alert_id),))
+                    newly += 1
+                found.append(self._load_alert(row[0], True))
+            if newly:
+                self._add_counter(conn, 'alerts:unacked', -newly)
+        return found
+
+    @staticmethod
+    def _alert_filters(severity=None, rule_id=None, source=None, since=None, until=None):
+        clauses = []
+        params = []
+        for column, value in (('severity', severity), ('rule_id', rule_id), ('source', source)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(str(value))
+        if since is not None:
+            clauses.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('ts <= ?')
+            params.append(until)
+        return clauses, params
+
+    def acknowledge_matching(self, severity=None, rule_id=None, source=None, since=None, until=None):
+        """Acknowledge every unacknowledged alert matching the filters; returns how many"""
+        clauses, params = self._alert_filters(severity, rule_id, source, since, until)
+        where = ' AND '.join(['acknowledged = 0'] + clauses)
+        changed = 0
+        with self._transaction() as conn:
+            for name in self._partition_names('alerts', since=since, until=until):
+                changed += conn.execute(f'UPDATE {name} SET acknowledged = 1 WHERE {where}', params).rowcount
+            if changed:
+                self._add_counter(conn, 'alerts:unacked', -changed)
+        return changed
+
+    def list_alerts(self, acknowledged=None, severity=None, rule_id=None, source=None, since=None, until=None,
+                    limit=100, before=None):
+        """One page of alerts, newest first; returns (alerts, id to pass as before for the next page).
+
+        acknowledged=False reads each partition's unacknowledged index, so
+        listing what is still open costs the page size, however many alerts
+        have been acknowledged. before is an alert id from a previous page.
+        """
+        conn = self._connection()
+        clauses, params = self._alert_filters(severity, rule_id, source, since, until)
+        if acknowledged is not None:
+            clauses.append('acknowledged = 1' if acknowledged else 'acknowledged = 0')
+        names = self._partition_names('alerts', since=since, until=until)
+        before_seq = None
+        if before:
+            cursor = self._alert_partition(conn, before)
+            if cursor is None:
+                return [], None
+            names = [name for name in names if name <= cursor]
+            before_seq = (cursor, conn.execute(f'SELECT seq FROM {cursor} WHERE id = ?', (str(before),)).fetchone()[0])
+
+        rows = []
+        for name in names:
+            remaining = limit - len(rows)
+            if remaining <= 0:
+                break
+            where = list(clauses)
+            page_params = list(params)
+            if before_seq and before_seq[0] == name:
+                where.append('seq < ?')
+                page_params.append(before_seq[1])
+            rows.extend(conn.execute(
+                f"SELECT data, acknowledged FROM {name} WHERE {' AND '.join(where) or '1'} ORDER BY seq DESC LIMIT ?",
+                (*page_params, remaining)
+            ).fetchall())
+        alerts = [self._load_alert(*row) for row in rows]
+        return alerts, (alerts[-1]['id'] if len(alerts) == limit else None)
+
+    @staticmethod
+    def format_log(ts, source, message):
+        return f"[{datetime.fromtimestamp(ts)}] {source}: {message}"
+
+    @staticmethod
+    def _load_alert(data, acknowledged):
+        alert = json.loads(data)
+        alert['acknowledged'] = bool(acknowledged)
+        return alert
+
+    def recent_logs(self, limit=100):
+        """The newest log lines, oldest first, formatted like the live feed"""
+        conn = self._connection()
+        rows = []
+        for name in self._partition_names('logs'):
+            remaining = limit - len(rows)
+            if remaining <= 0:
+                break
+            rows.extend(conn.execute(
+                f'SELECT ts, source, message FROM {name} ORDER BY id DESC LIMIT ?', (remaining,)
+            ).fetchall())
+        return [self.format_log(*row) for row in reversed(rows)]
+
+    def search_logs(self, query='', source=None, ip=None, user=None, since=None, until=None,
+                    limit=100, offset=0, newest_first=False):
+        """Search stored log lines; returns (total matches, one page of formatted lines).
+
+        Query words, IPs and usernames must all occur in a line (token match,
+        looked up in the per-day FTS5 index); source is an exact match. since
+        and until (epoch seconds) prune whole day partitions first and then
+        the row id range inside each remaining partition. Queries without an
+        indexable token, or stores without FTS5, fall back to a substring scan.
+        """
+        conn = self._connection()
+        terms = _search_terms(query) if query else set()
+        if ip:
+            terms.add(str(ip).lower())
+        if user:
+            terms.add(f"user:{str(user).lower()}")
+        scan_query = query.lower() if query and not terms else None
+        if source:
+            terms.add(_search_source_term(source))
+        use_index = self.search_indexed and bool(terms)
+        if not self.search_indexed:
+            scan_query = query.lower() if query else None
+        order = 'DESC' if newest_first else 'ASC'
+
+        total = 0
+        pages = []
+        for name in self._partition_names('logs', since=since, until=until, newest_first=newest_first):
+            if use_index:
+                bounds = self._id_range(conn, name, since, until)
+                if bounds is None:
+                    continue
+                match = ' '.join(f'"{term}"' for term in sorted(terms))
+                where = f'{name}_terms MATCH ? AND rowid BETWEEN ? AND ?'
+                params = (match, *bounds)
+                count_sql = f'SELECT COUNT(*) FROM {name}_terms WHERE {where}'
+                page_sql = (f'SELECT l.ts, l.source, l.message FROM {name} l JOIN ('
+                            f'SELECT rowid AS id FROM {name}_terms WHERE {where} ORDER BY rowid {order} LIMIT ? OFFSET ?'
+                            f') m ON l.id = m.id ORDER BY l.id {order}')
+            else:
+                clauses = []
+                params = []
+                if since is not None:
+                    clauses.append('ts >= ?')
+                    params.append(since)
+                if until is not None:
+                    clauses.append('ts <= ?')
+                    params.append(until)
+                if source:
+                    clauses.append('source = ?')
+                    params.append(str(source))
+                if scan_query:
+                    clauses.append("instr(lower(source || ': ' || message), ?) > 0")
+                    params.append(scan_query)
+                if not self.search_indexed:
+                    # No index: ip/user filters become substring checks
+                    for value in (ip, user):
+                        if value:
+                            clauses.append('instr(lower(message), ?) > 0')
+                            params.append(str(value).lower())
+                where = ' AND '.join(clauses) or '1'
+                params = tuple(params)
+                count_sql = f'SELECT COUNT(*) FROM {name} WHERE {where}'
+                page_sql = f'SELECT ts, source, message FROM {name} WHERE {where} ORDER BY id {order} LIMIT ? OFFSET ?'
+
+            matched = conn.execute(count_sql, params).fetchone()[0]
+            skip = max(offset - total, 0)
+            wanted = limit - sum(len(page) for page in pages)
+            total += matched
+            if matched > skip and wanted > 0:
+                rows = conn.execute(page_sql, (*params, wanted, skip)).fetchall()
+                pages.append([self.format_log(*row) for row in rows])
+        return total, [line for page in pages for line in page]
+
+    @staticmethod
+    def _id_range(conn, name, since, until):
+        """The row id range of a log partition within [since, until], via the ts index"""
+        low, high = 0, 2 ** 63 - 1
+        if since is not None:
+            row = conn.execute(f'SELECT id FROM {name} WHERE ts >= ? ORDER BY ts, id LIMIT 1', (since,)).fetchone()
+            if row is None:
+                return None
+            low = row[0]
+        if until is not None:
+            row = conn.execute(
+                f'SELECT id FROM {name} WHERE ts <= ? ORDER BY ts DESC, id DESC LIMIT 1', (until,)
+            ).fetchone()
+            if row is None:
+                return None
+            high = row[0]
+        if low > high:
+            return None
+        return low, high
+
+    def recent_alerts(self, limit=100):
+        """The newest alerts, oldest first"""
+        conn = self._connection()
+        rows = []
+        for name in self._partition_names('alerts'):
+            remaining = limit - len(rows)
+            if remaining <= 0:
+                break
+            rows.extend(conn.execute(
+                f'SELECT data, acknowledged FROM {name} ORDER BY seq DESC LIMIT ?', (remaining,)
+            ).fetchall())
+        return [self._load_alert(*row) for row in reversed(rows)]
+
+    def alert_trends(self, since, granularity, rule_id=None, source=None):
+        """(bucket, severity, count) rows from the alert rollups.
+
+        The bucket containing since is included whole.
+        """
+        bucket_format = ROLLUP_GRANULARITIES[granularity][0]
+        clauses = ['granularity = ?', 'bucket >= ?']
+        params = [granularity, since.strftime(bucket_format)]
+        if rule_id:
+            clauses.append('rule_id = ?')
+            params.append(rule_id)
+        if source:
+            clauses.append('source = ?')
+            params.append(source)
+        return self._connection().execute(
+            f"SELECT bucket, severity, SUM(count) FROM alert_rollups WHERE {' AND '.join(clauses)} "
+            'GROUP BY bucket, severity ORDER BY bucket',
+            params
+        ).fetchall()
+
+    def counters(self):
+        return dict(self._connection().execute('SELECT name, value FROM counters').fetchall())
+
+    def log_count(self):
+        """Log lines stored so far, by every process; the number of the newest line"""
+        row = self._connection().execute("SELECT value FROM counters WHERE name = 'logs'").fetchone()
+        return row[0] if row else 0
+
+    def tail_checkpoint(self, path):
+        """TailCheckpoint saved for a tailed file, or None"""
+        row = self._connection().execute(
+            'SELECT path, inode, offset, head_length, head_hash FROM tail_checkpoints WHERE path = ?', (str(path),)
+        ).fetchone()
+        return TailCheckpoint(*row) if row else None
+
+    def save_tail_checkpoint(self, checkpoint):
+        with self._transaction() as conn:
+            self._save_checkpoint(conn, checkpoint)
+
+    def enqueue(self, ticket, batches, checkpoint=None):
+        """Queue (shard, payload) batches for the analysis workers, with an optional tail checkpoint"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO ingest_queue (shard, ticket, payload, created) VALUES (?, ?, ?, ?)',
+                [(shard, ticket, payload, now) for shard, payload in batches]
+            )
+            if checkpoint is not None:
+                self._save_checkpoint(conn, checkpoint)
+
+    def dequeue(self, shard, limit):
+        """The oldest queued (seq, ticket, payload) batches of a shard; they leave the queue in append()"""
+        return self._connection().execute(
+            'SELECT seq, ticket, payload FROM ingest_queue WHERE shard = ? ORDER BY seq LIMIT ?', (shard, limit)
+        ).fetchall()
+
+    def fail_queued(self, seq, ticket, error, max_attempts):
+        """Count a failed attempt at a queued batch and return the attempts so far.
+
+        The batch stays queued for another attempt until max_attempts; then it
+        moves, raw lines and all, to ingest_dead_letters and its error is posted
+        as the batch's result.
+        """
+        with self._transaction() as conn:
+            conn.execute('UPDATE ingest_queue SET attempts = attempts + 1 WHERE seq = ?', (seq,))
+            row = conn.execute(
+                'SELECT shard, payload, created, attempts FROM ingest_queue WHERE seq = ?', (seq,)
+            ).fetchone()
+            if row is None:
+                return 0
+            shard, payload, created, attempts = row
+            if attempts >= max_attempts:
+                now = time.time()
+                conn.execute(
+                    'INSERT OR REPLACE INTO ingest_dead_letters '
+                    '(seq, shard, ticket, payload, error, attempts, created, failed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (seq, shard, ticket, payload, error, attempts, created, now)
+                )
+                conn.execute('DELETE FROM ingest_queue WHERE seq = ?', (seq,))
+                conn.execute(
+                    'INSERT INTO ingest_results (seq, ticket, alerts, created, error) VALUES (?, ?, ?, ?, ?)',
+                    (seq, ticket, '[]', now, error)
+                )
+        return attempts
+
+    def dead_letter_count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM ingest_dead_letters').fetchone()[0]
+
+    def take_results(self, ticket, expected):
+        """(alerts, error) posted for each batch of a ticket, once at least expected are done (else None).
+
+        error is None for analyzed batches and the failure for dead-lettered ones.
+        """
+        conn = self._connection()
+        # Poll with a plain read so waiting submitters never hold the write lock
+        done = conn.execute('SELECT COUNT(*) FROM ingest_results WHERE ticket = ?', (ticket,)).fetchone()[0]
+        if done < expected:
+            return None
+        rows = conn.execute(
+            'SELECT alerts, error FROM ingest_results WHERE ticket = ? ORDER BY seq', (ticket,)
+        ).fetchall()
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM ingest_results WHERE ticket = ?', (ticket,))
+        return [(json.loads(alerts), error) for alerts, error in rows]
+
+    def queue_depth(self):
+        """Queued batches and their age in seconds per shard"""
+        rows = self._connection().execute(
+            'SELECT shard, COUNT(*), MIN(created) FROM ingest_queue GROUP BY shard'
+        ).fetchall()
+        now = time.time()
+        return {shard: {'batches': count, 'lag_seconds': round(now - oldest, 3)} for shard, count, oldest in rows}
+
+    def threshold_hit(self, rule_id, key, threshold, window_start, now, count=1):
+        """ThresholdTracker.hit() on windows kept in the database, shared by every process"""
+        with self._transaction() as conn:
+            conn.execute(
+                'DELETE FROM threshold_events WHERE rule_id = ? AND key = ? AND ts < ?', (rule_id, key, window_start)
+            )
+            seen = conn.execute(
+                'SELECT COUNT(*) FROM threshold_events WHERE rule_id = ? AND key = ?', (rule_id, key)
+            ).fetchone()[0]
+            conn.executemany(
+                'INSERT INTO threshold_events (rule_id, key, ts) VALUES (?, ?, ?)',
+                [(rule_id, key, now)] * min(count, threshold)
+            )
+            conn.execute(
+                'DELETE FROM threshold_events WHERE rule_id = ? AND key = ? AND rowid NOT IN ('
+                'SELECT rowid FROM threshold_events WHERE rule_id = ? AND key = ? ORDER BY ts DESC, rowid DESC LIMIT ?)',
+                (rule_id, key, rule_id, key, threshold)
+            )
+        return max(count - max(threshold - seen - 1, 0), 0)
+
+    def expire_analysis_state(self, results_before, thresholds_before):
+        """Drop results nobody collected and threshold events outside every window"""
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM ingest_results WHERE created < ?', (results_before,))
+            conn.execute('DELETE FROM threshold_events WHERE ts < ?', (thresholds_before,))
+
+    def save_rule_metrics(self, process, report):
+        """Publish one process's rule profiler counters, dropping reports a day old"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO rule_metrics (process, data, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(process) DO UPDATE SET data = excluded.data, updated = excluded.updated',
+                (process, json.dumps(report), now)
+            )
+            conn.execute('DELETE FROM rule_metrics WHERE updated < ?', (now - 86400,))
+
+    def rule_metrics(self, since):
+        """Rule profiler reports published since an epoch timestamp"""
+        rows = self._connection().execute('SELECT data FROM rule_metrics WHERE updated >= ?', (since,)).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def save_pipeline_metrics(self, process, report):
+        """Publish one process's PipelineMetrics report, dropping reports a day old"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO pipeline_metrics (process, data, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(process) DO UPDATE SET data = excluded.data, updated = excluded.updated',
+                (process, json.dumps(report), now)
+            )
+            conn.execute('DELETE FROM pipeline_metrics WHERE updated < ?', (now - 86400,))
+
+    def pipeline_metrics(self, since):
+        """PipelineMetrics reports published since an epoch timestamp"""
+        rows = self._connection().execute(
+            'SELECT data FROM pipeline_metrics WHERE updated >= ?', (since,)
+        ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def cached_upload(self, key):
+        """(run, alerts) of an earlier upload analyzed under the same UploadKey, or None"""
+        row = self._connection().execute(
+            'SELECT run, alerts FROM upload_results '
+            'WHERE content_hash = ? AND source = ? AND rules_version = ? AND model_version = ?',
+            key
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), json.loads(row[1])
+
+    def cache_upload(self, key, run, alerts, keep):
+        """Remember an upload's result, keeping the newest keep entries.
+
+        Entries for the same content under other rule or model versions can
+        never be hit again and are dropped.
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                'DELETE FROM upload_results WHERE content_hash = ? AND source = ? '
+                'AND (rules_version != ? OR model_version != ?)',
+                key
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO upload_results '
+                '(content_hash, source, rules_version, model_version, run, alerts, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (*key, json.dumps(run), json.dumps(alerts, default=str), time.time())
+            )
+            conn.execute(
+                'DELETE FROM upload_results WHERE rowid NOT IN '
+                '(SELECT rowid FROM upload_results ORDER BY created DESC LIMIT ?)',
+                (keep,)
+            )
+
+    def rules_version(self):
+        """The newest rule set version (0 before any is published)"""
+        return self._connection().execute('SELECT COALESCE(MAX(version), 0) FROM rule_sets').fetchone()[0]
+
+    def rule_set(self):
+        """(version, rules, created) of the newest rule set, or (0, None, 0.0)"""
+        row = self._connection().execute(
+            'SELECT version, rules, created FROM rule_sets ORDER BY version DESC LIMIT 1'
+        ).fetchone()
+        if row is None:
+            return 0, None, 0.0
+        return row[0], json.loads(row[1]), row[2]
+
+    def update_rules(self, change, save=None):
+        """Derive a new rule set from the newest one, one process at a time.
+
+        change(rules) gets the newest rules (None before any are published)
+        and returns (new rules, or None to keep them, and a result). New
+        rules are stored as the next version and handed to save before the
+        transaction commits, so rules.json is written in version order too.
+        Returns (version, rules, result).
+        """
+        with self._transaction() as conn:
+            row = conn.execute('SELECT version, rules FROM rule_sets ORDER BY version DESC LIMIT 1').fetchone()
+            version, rules = (row[0], json.loads(row[1])) if row else (0, None)
+            new_rules, result = change(rules)
+            if new_rules is not None:
+                version += 1
+                rules = new_rules
+                conn.execute(
+                    'INSERT INTO rule_sets (version, rules, created) VALUES (?, ?, ?)',
+                    (version, json.dumps(rules), time.time())
+                )
+                conn.execute('DELETE FROM rule_sets WHERE version <= ?', (version - RULE_SET_HISTORY,))
+                if save is not None:
+                    save(rules)
+        return version, rules, result
+
+    @staticmethod
+    def _save_checkpoint(conn, checkpoint):
+        conn.execute(
+            'INSERT INTO tail_checkpoints (path, inode, offset, head_length, head_hash, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET inode = excluded.inode, offset = excluded.offset, '
+            'head_length = excluded.head_length, head_hash = excluded.head_hash, updated = excluded.updated',
+            (*checkpoint, time.time())
+        )
+
+
+STORE = SIEMStore(DB_PATH)
 analysis_runs = deque(maxlen=50)
+# Uploads whose results are kept for repeat uploads of the same content (0 disables)
+UPLOAD_CACHE_SIZE = int(os.environ.get('SIEM_UPLOAD_CACHE_SIZE', '100'))
+UPLOAD_CHUNK_BYTES = 1 << 20
+UploadKey = namedtuple('UploadKey', 'content_hash source rules_version model_version')
 
 # HTML Template for Web Interface
 HTML_TEMPLATE = r'''
@@ -227,6 +1206,21 @@ HTML_TEMPLATE = r'''
         #realtimeStatus {
             margin-top: 10px;
         }
+        .metrics-table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-top: 10px;
+            font-size: 13px;
+        }
+        .metrics-table th, .metrics-table td {
+            padding: 6px 8px;
+            border-bottom: 1px solid #ddd;
+            text-align: left;
+        }
+        .metrics-table td.line {
+            font-family: monospace;
+            word-break: break-all;
+        }
     </style>
 </head>
 <body>
@@ -313,6 +1307,21 @@ HTML_TEMPLATE = r'''
                     <!-- Rules will be populated here -->
                 </div>
             </div>
+
+            <div class="section">
+                <h2>Rule Metrics</h2>
+                <button onclick="loadRuleMetrics()">Refresh</button>
+                <div id="ruleMetricsSummary"></div>
+                <table class="metrics-table">
+                    <thead>
+                        <tr>
+                            <th>Rule</th><th>Evaluations</th><th>Matches</th><th>Total (ms)</th>
+                            <th>Avg (µs)</th><th>p99 (µs)</th><th>Timeouts</th><th>Slowest sampled line</th>
+                        </tr>
+                    </thead>
+                    <tbody id="ruleMetricsBody"></tbody>
+                </table>
+            </div>
         </div>
         
         <!-- Real-time Tab -->
@@ -341,6 +1350,7 @@ HTML_TEMPLATE = r'''
     <script>
         const socket = io();
         let realtimeEnabled = false;
+        let recentLogs = [];
         
         // Socket event handlers
         socket.on('connect', function() {
@@ -348,15 +1358,22 @@ HTML_TEMPLATE = r'''
             document.getElementById('systemStatus').textContent = 'ONLINE';
         });
         
-        socket.on('alert', function(data) {
-            addAlertToUI(data);
-            updateDashboard();
-            playAlertSound();
-        });
-        
-        socket.on('log_update', function(data) {
-            updateLogViewer(data.logs);
+        // Frames carry only what is new since the previous frame
+        socket.on('log_update', function(data, ack) {
+            if (data.resync) {
+                loadLogs();
+                loadAlerts();
+            } else {
+                updateLogViewer(data.logs || []);
+                if (data.alerts && data.alerts.length) {
+                    data.alerts.forEach(addAlertToUI);
+                    playAlertSound();
+                }
+            }
             updateDashboard(data.stats);
+            if (typeof ack === 'function') {
+                ack();
+            }
         });
 
         socket.on('realtime_status', function(data) {
@@ -375,7 +1392,7 @@ HTML_TEMPLATE = r'''
         socket.on('realtime_log', function(data) {
             if (realtimeEnabled) {
                 const realtimeLogs = document.getElementById('realtimeLogs');
-                realtimeLogs.innerHTML = data.log + '\n' + realtimeLogs.innerHTML;
+                realtimeLogs.innerHTML = data.logs.slice().reverse().join('\n') + '\n' + realtimeLogs.innerHTML;
             }
         });
         
@@ -509,7 +1526,9 @@ HTML_TEMPLATE = r'''
                         '<small>' + new Date(alert.timestamp).toLocaleString() + '</small><br>' +
                         alert.description + '<br>' +
                         '<small>Source: ' + alert.source + ' | Log: ' + alert.log_entry.substring(0, 100) + '...</small>' +
+                        formatAlertCount(alert) +
                         formatTipInfo(alert);
+                    alertElement.dataset.alertId = alert.id;
                     container.appendChild(alertElement);
                 });
             });
@@ -519,8 +1538,8 @@ HTML_TEMPLATE = r'''
             fetch('/logs')
             .then(response => response.json())
             .then(logs => {
-                const viewer = document.getElementById('logViewer');
-                viewer.textContent = logs.slice(-50).join('\n');
+                recentLogs = [];
+                updateLogViewer(logs);
             });
         }
         
@@ -538,12 +1557,49 @@ HTML_TEMPLATE = r'''
                         '<strong>' + rule.name + '</strong> (' + rule.id + ')<br>' +
                         '<small>Severity: ' + rule.severity + '</small><br>' +
                         rule.description + '<br>' +
-                        '<small>Pattern: ' + rule.pattern + '</small>';
+                        '<small>Pattern: ' + rule.pattern + '</small>' +
+                        (rule.fields ? '<br><small>Fields: ' + JSON.stringify(rule.fields) + '</small>' : '');
                     container.appendChild(ruleElement);
                 });
             });
         }
         
+        function loadRuleMetrics() {
+            fetch('/api/rules/metrics')
+            .then(response => response.json())
+            .then(metrics => {
+                document.getElementById('ruleMetricsSummary').textContent =
+                    metrics.processes + ' process(es) reporting, 1 in ' + metrics.sample_every +
+                    ' lines timed per rule, ' + metrics.lines_truncated + ' lines truncated';
+                const body = document.getElementById('ruleMetricsBody');
+                body.innerHTML = '';
+
+                // Lines come straight from the logs, so cells are filled as text
+                metrics.rules.forEach(rule => {
+                    const row = document.createElement('tr');
+                    const worst = rule.worst_lines.map(entry => entry.us + ' µs: ' + entry.line);
+                    [
+                        rule.name + ' (' + rule.id + ')', rule.evaluations, rule.matches, rule.total_ms,
+                        rule.avg_us, rule.p99_us, rule.timeouts, worst.length ? worst[0] : ''
+                    ].forEach(value => {
+                        const cell = document.createElement('td');
+                        cell.textContent = value;
+                        row.appendChild(cell);
+                    });
+                    row.lastChild.className = 'line';
+                    row.lastChild.title = worst.join('\n');
+                    body.appendChild(row);
+                });
+            });
+        }
+        
+        function formatAlertCount(alert) {
+            if (!alert.count || alert.count < 2) {
+                return '';
+            }
+            return '<br><small>Seen ' + alert.count + ' times, last ' + new Date(alert.last_seen).toLocaleString() + '</small>';
+        }
+        
         function addAlertToUI(alert) {
             const container = document.getElementById('alertsContainer');
             const severityClass = 'alert-' + alert.severity.toLowerCase();
@@ -554,7 +1610,15 @@ HTML_TEMPLATE = r'''
                 '<small>' + new Date(alert.timestamp).toLocaleString() + '</small><br>' +
                 alert.description + '<br>' +
                 '<small>Source: ' + alert.source + ' | Log: ' + alert.log_entry.substring(0, 100) + '...</small>' +
+                formatAlertCount(alert) +
                 formatTipInfo(alert);
+            alertElement.dataset.alertId = alert.id;
+            
+            // An update to an aggregated alert replaces its card
+            const previous = container.querySelector('[data-alert-id="' + alert.id + '"]');
+            if (previous) {
+                previous.remove();
+            }
             
             // Add to top
             if (container.firstChild) {
@@ -564,9 +1628,9 @@ HTML_TEMPLATE = r'''
             }
         }
         
-        function updateLogViewer(logs) {
-            const viewer = document.getElementById('logViewer');
-            viewer.textContent = logs.slice(-50).join('\n');
+        function updateLogViewer(newLogs) {
+            recentLogs = recentLogs.concat(newLogs).slice(-50);
+            document.getElementById('logViewer').textContent = recentLogs.join('\n');
         }
         
         function updateDashboard(stats) {
@@ -623,6 +1687,7 @@ HTML_TEMPLATE = r'''
             loadAlerts();
             loadLogs();
             loadRules();
+            loadRuleMetrics();
             loadStats();
             switchTab('upload'); // Ensure upload tab is active on load
         });
@@ -731,13 +1796,14 @@ REPORT_TEMPLATE = r'''
         </table>
 
         <h2>Alerts</h2>
-        {% if alerts %}
+        {% if run.alerts_generated %}
         <table>
             <thead>
                 <tr>
                     <th>Timestamp</th>
                     <th>Severity</th>
                     <th>Rule</th>
+                    <th>Count</th>
                     <th>Description</th>
                     <th>Source</th>
                     <th>Log Entry</th>
@@ -750,6 +1816,7 @@ REPORT_TEMPLATE = r'''
                     <td>{{ alert.timestamp }}</td>
                     <td>{{ alert.severity }}</td>
                     <td>{{ alert.rule_name }}</td>
+                    <td>{{ alert.count }}{% if alert.count > 1 %} (last {{ alert.last_seen }}){% endif %}</td>
                     <td>{{ alert.description }}</td>
                     <td>{{ alert.source }}</td>
                     <td>{{ alert.log_entry }}</td>
@@ -822,66 +1889,261 @@ TIP_FEATURES = [
 ]
 
 TIP_BENIGN_LABELS = {"BENIGN", "NORMAL", "NORMAL_TRAFFIC"}
+TIP_PREDICT_CHUNK = 4096
+TIP_KEY_CACHE_SIZE = 4096
+# Files of the trained model, and of the bundle siem_tip_export.py makes from them
+TIP_MODEL_FILES = ('cicids2017_model.h5', 'scaler.pkl', 'label_encoder.pkl')
+TIP_RUNTIME_DIR = 'runtime'
+TIP_MANIFEST = 'manifest.json'
+TIP_BUNDLE_FORMAT = 1
+
+
+def _tip_sigmoid(np, x):
+    return np.exp(-np.logaddexp(0, -x))
+
+
+def _tip_softmax(np, x):
+    shifted = np.exp(x - x.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+# Keras activation name -> NumPy implementation, for the exported runtime
+TIP_ACTIVATIONS = {
+    'linear': lambda np, x: x,
+    'relu': lambda np, x: np.maximum(x, 0),
+    'elu': lambda np, x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    'tanh': lambda np, x: np.tanh(x),
+    'sigmoid': _tip_sigmoid,
+    'softmax': _tip_softmax,
+}
 
 
 def _normalize_feature_key(value):
     return re.sub(r'[^a-z0-9]', '', str(value).lower())
 
 
+class _KerasTIPRuntime:
+    """The trained model as saved: Keras network plus scikit-learn scaler and label encoder"""
+
+    name = 'keras'
+
+    def __init__(self, model_dir):
+        from tensorflow.keras.models import load_model
+        model_path, scaler_path, label_path = (model_dir / name for name in TIP_MODEL_FILES)
+        self._model = load_model(model_path)
+        with open(scaler_path, 'rb') as f:
+            self._scaler = pickle.load(f)
+        with open(label_path, 'rb') as f:
+            self._label_encoder = pickle.load(f)
+
+    def transform(self, matrix):
+        return self._scaler.transform(matrix)
+
+    def forward(self, scaled):
+        return self._model.predict(scaled, verbose=0, batch_size=min(len(scaled), TIP_PREDICT_CHUNK))
+
+    def labels(self, indexes):
+        return self._label_encoder.inverse_transform(indexes)
+
+
+class _NumpyTIPRuntime:
+    """An exported model bundle (see siem_tip_export.py) evaluated with NumPy alone.
+
+    Weights are memory-mapped read-only from the bundle's .npy files, so every
+    worker process shares one copy of them through the page cache.
+    """
+
+    name = 'numpy'
+
+    def __init__(self, bundle_dir):
+        import numpy as np
+        self._np = np
+        self.manifest = json.loads((bundle_dir / TIP_MANIFEST).read_text(encoding='utf-8'))
+        if self.manifest.get('format') != TIP_BUNDLE_FORMAT:
+            raise ValueError(f"unsupported bundle format {self.manifest.get('format')!r}")
+        if self.manifest.get('features') != TIP_FEATURES:
+            raise ValueError("bundle was exported for a different feature list")
+
+        def arrays(files):
+            return {key: np.load(bundle_dir / name, mmap_mode='r') for key, name in files.items()}
+
+        scaler = self.manifest['scaler']
+        if scaler['kind'] not in ('standard', 'minmax'):
+            raise ValueError(f"unsupported scaler {scaler['kind']!r}")
+        self._scaler_kind = scaler['kind']
+        self._scaler = arrays(scaler['arrays'])
+        self._layers = []
+        for layer in self.manifest['layers']:
+            if layer['type'] not in ('dense', 'activation', 'batch_norm'):
+                raise ValueError(f"unsupported layer {layer['type']!r}")
+            activation = layer.get('activation', 'linear')
+            if activation not in TIP_ACTIVATIONS:
+                raise ValueError(f"unsupported activation {activation!r}")
+            self._layers.append((layer['type'], TIP_ACTIVATIONS[activation], layer.get('epsilon'), arrays(layer['arrays'])))
+        self._labels = np.asarray(self.manifest['labels'], dtype=object)
+
+    def transform(self, matrix):
+        if self._scaler_kind == 'standard':
+            return (matrix - self._scaler['mean']) / self._scaler['scale']
+        return matrix * self._scaler['scale'] + self._scaler['min']
+
+    def forward(self, scaled):
+        np = self._np
+        # Keras evaluates the network in float32
+        x = np.asarray(scaled, dtype=np.float32)
+        for kind, activation, epsilon, weights in self._layers:
+            if kind == 'dense':
+                x = x @ weights['kernel']
+                if 'bias' in weights:
+                    x = x + weights['bias']
+            elif kind == 'batch_norm':
+                x = (x - weights['mean']) / np.sqrt(weights['variance'] + np.float32(epsilon))
+                x = x * weights['gamma'] + weights['beta']
+            x = activation(np, x)
+        return x
+
+    def labels(self, indexes):
+        return self._labels[indexes]
+
+
+class _OnnxTIPRuntime(_NumpyTIPRuntime):
+    """A bundle's model.onnx run by ONNX Runtime; scaling and labels as in the NumPy runtime"""
+
+    name = 'onnx'
+
+    def __init__(self, bundle_dir):
+        import onnxruntime
+        super().__init__(bundle_dir)
+        if not self.manifest.get('onnx'):
+            raise FileNotFoundError(f"bundle in {bundle_dir} has no ONNX model")
+        self._session = onnxruntime.InferenceSession(
+            str(bundle_dir / self.manifest['onnx']), providers=['CPUExecutionProvider']
+        )
+        self._input = self._session.get_inputs()[0].name
+
+    def forward(self, scaled):
+        return self._session.run(None, {self._input: self._np.asarray(scaled, dtype=self._np.float32)})[0]
+
+
 class TIPModel:
-    """Optional TIP model integration for structured flow features."""
+    """Optional TIP model integration for structured flow features.
+
+    Nothing is loaded until a row first needs a prediction (see available).
+    SIEM_TIP_RUNTIME picks what runs the model: 'numpy' or 'onnx' use the
+    bundle siem_tip_export.py writes to <model_dir>/runtime, 'keras' the
+    saved model itself (TensorFlow and scikit-learn), and 'auto' (default)
+    the first of onnx, numpy, keras that can load.
+    """
 
     def __init__(self, model_dir=None):
-        self.available = False
         if model_dir is None:
             model_dir = os.environ.get('SIEM_TIP_MODEL_DIR') or (BASE_DIR / '..' / 'TIP_Model' / 'model')
         self.model_dir = Path(model_dir)
         self.model_dir = self.model_dir.resolve()
+        self.enabled = os.environ.get('SIEM_TIP_ENABLED', 'true').lower() in {'1', 'true', 'yes'}
+        self.runtime_choice = os.environ.get('SIEM_TIP_RUNTIME', 'auto').lower()
         self.feature_names = TIP_FEATURES
         self._feature_map = {
             _normalize_feature_key(name): name for name in self.feature_names
         }
-        self._model = None
-        self._scaler = None
-        self._label_encoder = None
+        self._runtime = None
+        self._loaded = None
+        self._load_lock = threading.Lock()
         self._np = None
-        self._load()
+        self._key_cache = {}
+        # Identifies the model files in use; part of the upload result cache key
+        self.version = self._files_version()
+        self.batcher = TIPBatcher(self)
 
-    def _load(self):
-        if os.environ.get('SIEM_TIP_ENABLED', 'true').lower() not in {'1', 'true', 'yes'}:
-            logger.info("TIP model disabled via SIEM_TIP_ENABLED.")
-            return
-        try:
-            import numpy as np
-            from tensorflow.keras.models import load_model
-        except Exception as exc:
-            logger.info("TIP model unavailable (missing dependencies): %s", exc)
-            return
+    @property
+    def available(self):
+        """Whether predictions can be made, loading the runtime on first use"""
+        if self._loaded is None:
+            self._load()
+        return self._loaded
 
-        model_path = self.model_dir / 'cicids2017_model.h5'
-        scaler_path = self.model_dir / 'scaler.pkl'
-        label_path = self.model_dir / 'label_encoder.pkl'
+    @property
+    def loaded(self):
+        """available without loading: None until the first load attempt"""
+        return self._loaded
 
-        if not model_path.exists() or not scaler_path.exists() or not label_path.exists():
-            logger.info("TIP model files not found in %s", self.model_dir)
-            return
+    @property
+    def runtime(self):
+        """Name of the loaded runtime, or None (not loaded yet, or unavailable)"""
+        return self._runtime.name if self._runtime is not None else None
+
+    def _bundle_dir(self):
+        bundle = self.model_dir / TIP_RUNTIME_DIR
+        if self.runtime_choice != 'keras' and (bundle / TIP_MANIFEST).exists():
+            return bundle
+        return None
 
+    def _files_version(self):
+        if not self.enabled:
+            return 'unavailable'
+        bundle = self._bundle_dir()
+        paths = [bundle / TIP_MANIFEST] if bundle else [self.model_dir / name for name in TIP_MODEL_FILES]
         try:
-            self._model = load_model(model_path)
-            with open(scaler_path, 'rb') as f:
-                self._scaler = pickle.load(f)
-            with open(label_path, 'rb') as f:
-                self._label_encoder = pickle.load(f)
+            stats = [(path.name, path.stat().st_size, path.stat().st_mtime_ns) for path in paths]
+        except OSError:
+            return 'unavailable'
+        return hashlib.sha256(json.dumps(stats).encode('utf-8')).hexdigest()[:16]
+
+    def _load(self):
+        with self._load_lock:
+            if self._loaded is not None:
+                return
+            self._loaded = False
+            if not self.enabled:
+                logger.info("TIP model disabled via SIEM_TIP_ENABLED.")
+                return
+            try:
+                import numpy as np
+                runtime = self._open_runtime()
+            except ImportError as exc:
+                logger.info("TIP model unavailable (missing dependencies): %s", exc)
+                return
+            except Exception as exc:
+                logger.error("Failed to load TIP model: %s", exc)
+                return
+            if runtime is None:
+                logger.info("TIP model files not found in %s", self.model_dir)
+                return
             self._np = np
-            self.available = True
-            logger.info("TIP model loaded from %s", self.model_dir)
-        except Exception as exc:
-            logger.error("Failed to load TIP model: %s", exc)
+            self._runtime = runtime
+            self._loaded = True
+            logger.info("TIP model loaded from %s (%s runtime)", self.model_dir, runtime.name)
+
+    def _open_runtime(self):
+        choice = self.runtime_choice
+        if choice not in ('auto', 'onnx', 'numpy', 'keras'):
+            raise ValueError(f"SIEM_TIP_RUNTIME must be auto, onnx, numpy or keras, not {choice!r}")
+        bundle = self._bundle_dir()
+        if bundle is not None:
+            if choice == 'onnx':
+                return _OnnxTIPRuntime(bundle)
+            if choice == 'auto':
+                try:
+                    return _OnnxTIPRuntime(bundle)
+                except (ImportError, FileNotFoundError):
+                    pass
+            return _NumpyTIPRuntime(bundle)
+        if choice in ('auto', 'keras') and all((self.model_dir / name).exists() for name in TIP_MODEL_FILES):
+            return _KerasTIPRuntime(self.model_dir)
+        return None
+
+    def _canonical_feature(self, key):
+        canonical = self._key_cache.get(key)
+        if canonical is None:
+            canonical = self._feature_map.get(_normalize_feature_key(key), '')
+            if len(self._key_cache) < TIP_KEY_CACHE_SIZE:
+                self._key_cache[key] = canonical
+        return canonical
 
     def _extract_features(self, payload):
         normalized = {}
         for key, value in payload.items():
-            canonical = self._feature_map.get(_normalize_feature_key(key))
+            canonical = self._canonical_feature(key)
             if not canonical:
                 continue
             try:
@@ -894,6 +2156,13 @@ class TIPModel:
             return None, missing
         return normalized, None
 
+    def extract_row(self, payload):
+        """Feature values of a payload in model order, or None if any feature is missing."""
+        features, missing = self._extract_features(payload)
+        if missing:
+            return None
+        return [features[name] for name in self.feature_names]
+
     def _parse_payload(self, log_line):
         line = log_line.strip()
         if not line or line[0] not in '{[':
@@ -902,58 +2171,204 @@ class TIPModel:
             payload = json.loads(line)
         except json.JSONDecodeError:
             return None
+        return self.payload_features(payload)
 
+    @staticmethod
+    def payload_features(payload):
+        """The feature mapping carried by a decoded JSON record, if any."""
         if isinstance(payload, dict) and isinstance(payload.get('features'), dict):
             return payload['features']
         if isinstance(payload, dict):
             return payload
         return None
 
-    def predict_from_log_line(self, log_line):
+    def feature_columns(self, header):
+        """Column index of every model feature in a CSV header, or None if one is missing."""
+        positions = {}
+        for index, name in enumerate(header):
+            canonical = self._canonical_feature(name)
+            if canonical:
+                positions[canonical] = index
+        if len(positions) != len(self.feature_names):
+            return None
+        return [positions[name] for name in self.feature_names]
+
+    def row_from_event(self, event):
+        """Feature row from a LogEvent's JSON payload (see parse_log_line), or None"""
+        if event.payload is None:
+            return None
+        features = self.payload_features(event.payload)
+        return self.extract_row(features) if features else None
+
+    def row_from_log_line(self, log_line):
         payload = self._parse_payload(log_line)
         if not payload:
             return None
-        return self.predict(payload)
+        return self.extract_row(payload)
+
+    def predict_from_log_line(self, log_line):
+        """Predict a single JSON log line through the shared micro-batching queue."""
+        if not self.available:
+            return None
+        row = self.row_from_log_line(log_line)
+        if row is None:
+            return None
+        return self.batcher.predict(row)
 
     def predict(self, payload):
         if not self.available:
             return None
 
-        features, missing = self._extract_features(payload)
-        if missing:
+        row = self.extract_row(payload)
+        if row is None:
             return None
+        return self.predict_rows([row])[0]
 
-        values = [features[name] for name in self.feature_names]
-        scaled = self._scaler.transform([values])
-        probs = self._model.predict(scaled, verbose=0)
-        probs = self._np.asarray(probs).reshape(1, -1)
-        predicted_index = int(self._np.argmax(probs, axis=1)[0])
-        label = str(self._label_encoder.inverse_transform([predicted_index])[0])
-        confidence = float(self._np.max(probs))
-        is_malicious = label.upper() not in TIP_BENIGN_LABELS
+    def predict_batch(self, payloads):
+        """Synchronous batch API: one result (or None) per payload, in order."""
+        if not self.available:
+            return [None] * len(payloads)
+        rows = [self.extract_row(payload) if payload else None for payload in payloads]
+        return self.predict_sparse(rows)
 
-        return {
-            'label': label,
-            'confidence': confidence,
-            'is_malicious': is_malicious
-        }
+    def predict_log_lines(self, log_lines):
+        """Synchronous batch API over raw log lines, one result (or None) per line."""
+        if not self.available:
+            return [None] * len(log_lines)
+        return self.predict_sparse([self.row_from_log_line(line) for line in log_lines])
+
+    def predict_sparse(self, rows):
+        """Like predict_rows, but rows may be None (no features) and yield None."""
+        if not self.available:
+            return [None] * len(rows)
+        positions = [i for i, row in enumerate(rows) if row is not None]
+        results = [None] * len(rows)
+        if positions:
+            predictions = self.predict_rows([rows[i] for i in positions])
+            for position, prediction in zip(positions, predictions):
+                results[position] = prediction
+        return results
+
+    def predict_rows(self, rows):
+        """Run the model over feature rows (or a 2-D array) in one vectorized pass per chunk.
+
+        Rows with non-finite values (CICIDS dumps contain Infinity/NaN) cannot be
+        scaled; they get None instead of failing the whole batch.
+        """
+        np = self._np
+        matrix = np.asarray(rows, dtype=np.float64)
+        if matrix.ndim != 2 or not len(matrix):
+            return []
+        results = [None] * len(matrix)
+        finite = np.flatnonzero(np.isfinite(matrix).all(axis=1))
+        for start in range(0, len(finite), TIP_PREDICT_CHUNK):
+            positions = finite[start:start + TIP_PREDICT_CHUNK]
+            chunk = matrix[positions]
+            probs = self._runtime.forward(self._runtime.transform(chunk))
+            probs = np.asarray(probs).reshape(len(chunk), -1)
+            indexes = np.argmax(probs, axis=1)
+            confidences = probs[np.arange(len(chunk)), indexes]
+            labels = self._runtime.labels(indexes)
+            for position, label, confidence in zip(positions, labels, confidences):
+                label = str(label)
+                results[position] = {
+                    'label': label,
+                    'confidence': float(confidence),
+                    'is_malicious': label.upper() not in TIP_BENIGN_LABELS
+                }
+        return results
+
+
+class _PendingPrediction:
+    __slots__ = ('row', 'result', 'error', 'done')
+
+    def __init__(self, row):
+        self.row = row
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class TIPBatcher:
+    """Micro-batching queue in front of TIPModel.predict_rows.
+
+    Callers on any thread or greenlet submit one feature row and block until
+    its result is ready. A single worker collects queued rows and runs one
+    model call either when max_batch rows are waiting or max_wait_ms after
+    the first row of the batch arrived.
+    """
+
+    def __init__(self, model, max_batch=None, max_wait_ms=None):
+        self.model = model
+        self.max_batch = max_batch or int(os.environ.get('SIEM_TIP_BATCH_SIZE', '256'))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.environ.get('SIEM_TIP_BATCH_WAIT_MS', '5'))
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches_run = 0
+        self.rows_predicted = 0
+
+    def predict(self, row):
+        pending = _PendingPrediction(row)
+        self._ensure_worker()
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='tip-batcher', daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.model.predict_rows([pending.row for pending in batch])
+                for pending, result in zip(batch, results):
+                    pending.result = result
+                self.batches_run += 1
+                self.rows_predicted += len(batch)
+            except Exception as exc:
+                for pending in batch:
+                    pending.error = exc
+            finally:
+                for pending in batch:
+                    pending.done.set()
 
 
 TIP_MODEL = TIPModel()
 
 
-def _escape_html(value):
-    text = '' if value is None else str(value)
-    return (text.replace('&', '&amp;')
-                .replace('<', '&lt;')
-                .replace('>', '&gt;')
-                .replace('"', '&quot;')
-                .replace("'", '&#39;'))
+# Template output events buffered per write when streaming a report to disk
+REPORT_BUFFER_EVENTS = int(os.environ.get('SIEM_REPORT_BUFFER_EVENTS', '2000'))
+_REPORT_LOCK = threading.Lock()
 
 
-def _prepare_report_alerts(alerts_list):
-    rows = []
-    for alert in alerts_list:
+def _report_rows(alerts):
+    """Report table rows for alerts, lazily; the template escapes every field."""
+    for alert in alerts:
         tip = alert.get('tip') or {}
         tip_label = tip.get('label') if isinstance(tip, dict) else None
         tip_confidence = tip.get('confidence') if isinstance(tip, dict) else None
@@ -962,17 +2377,18 @@ def _prepare_report_alerts(alerts_list):
         else:
             tip_confidence = ''
 
-        rows.append({
-            'timestamp': _escape_html(alert.get('timestamp', '')),
-            'severity': _escape_html(alert.get('severity', '')),
-            'rule_name': _escape_html(alert.get('rule_name', '')),
-            'description': _escape_html(alert.get('description', '')),
-            'source': _escape_html(alert.get('source', '')),
-            'log_entry': _escape_html(alert.get('log_entry', '')),
-            'tip_label': _escape_html(tip_label) if tip_label else '',
+        yield {
+            'timestamp': alert.get('timestamp', ''),
+            'severity': alert.get('severity', ''),
+            'rule_name': alert.get('rule_name', ''),
+            'count': alert.get('count', 1),
+            'last_seen': alert.get('last_seen', ''),
+            'description': alert.get('description', ''),
+            'source': alert.get('source', ''),
+            'log_entry': alert.get('log_entry', ''),
+            'tip_label': tip_label or '',
             'tip_confidence': tip_confidence
-        })
-    return rows
+        }
 
 
 def _build_severity_rows(alerts_list):
@@ -991,24 +2407,68 @@ def _build_severity_rows(alerts_list):
     return rows
 
 
-def _create_report(run, alerts_list):
+def _report_spool(report_name):
+    return REPORT_DIR / (Path(report_name).stem + '.jsonl')
+
+
+def _spool_report(run, alerts_list):
+    """Record what a run's report needs, to render it when first requested.
+
+    The spool is JSONL: a header line (run, severity rows, rules loaded)
+    followed by one line per alert.
+    """
     report_name = f"siem_report_{run['id']}.html"
-    report_path = REPORT_DIR / report_name
-    alert_rows = _prepare_report_alerts(alerts_list)
-    severity_rows = _build_severity_rows(alerts_list)
-    generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    html = render_template_string(
-        REPORT_TEMPLATE,
-        run=run,
-        alerts=alert_rows,
-        severity_rows=severity_rows,
-        generated_at=generated_at,
-        rules_count=len(RULES)
-    )
-    report_path.write_text(html, encoding='utf-8')
+    header = {'run': run, 'severity_rows': _build_severity_rows(alerts_list), 'rules_count': len(RULES)}
+    with open(_report_spool(report_name), 'w', encoding='utf-8') as spool:
+        spool.write(json.dumps(header) + '\n')
+        for alert in alerts_list:
+            spool.write(json.dumps(alert, default=str) + '\n')
     return report_name
 
 
+def _write_report(report_path, spool_path):
+    """Stream a spooled run through REPORT_TEMPLATE into report_path.
+
+    Alert rows are read from the spool and rendered as the template reaches
+    them, written REPORT_BUFFER_EVENTS template events at a time, so the
+    report is never held in memory whole.
+    """
+    with open(spool_path, 'r', encoding='utf-8') as spool:
+        header = json.loads(spool.readline())
+        stream = app.jinja_env.from_string(REPORT_TEMPLATE).stream(
+            run=header['run'],
+            alerts=_report_rows(json.loads(line) for line in spool),
+            severity_rows=header['severity_rows'],
+            generated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            rules_count=header['rules_count']
+        )
+        stream.enable_buffering(REPORT_BUFFER_EVENTS)
+        partial = report_path.with_name(f".{report_path.name}.{os.getpid()}.tmp")
+        try:
+            stream.dump(str(partial), encoding='utf-8')
+            os.replace(partial, report_path)
+        finally:
+            partial.unlink(missing_ok=True)
+
+
+def _ensure_report(report_name):
+    """Path of a report, rendering it from its spool on first request; None if unknown"""
+    report_path = REPORT_DIR / report_name
+    if report_path.exists():
+        return report_path
+    spool_path = _report_spool(report_name)
+    with _REPORT_LOCK:
+        if report_path.exists():
+            return report_path
+        try:
+            _write_report(report_path, spool_path)
+        except FileNotFoundError:
+            # Another process may have rendered it and removed the spool meanwhile
+            return report_path if report_path.exists() else None
+    spool_path.unlink(missing_ok=True)
+    return report_path
+
+
 def _register_run(run_type, source, logs_processed, alerts_list, filename=None):
     run_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
     run = {
@@ -1019,8 +2479,7 @@ def _register_run(run_type, source, logs_processed, alerts_list, filename=None):
         'alerts_generated': len(alerts_list),
         'filename': filename or ''
     }
-    report_name = _create_report(run, alerts_list)
-    run['report_filename'] = report_name
+    run['report_filename'] = _spool_report(run, alerts_list)
     analysis_runs.append(run)
     return run
 
@@ -1043,97 +2502,2691 @@ def _is_within_path(path, root):
         return False
 
 
-REALTIME_ALLOWED_ROOTS = _build_realtime_roots()
-REALTIME_POLL_INTERVAL = float(os.environ.get('SIEM_REALTIME_POLL_INTERVAL', '0.5'))
-realtime_monitors = {}
-realtime_lock = threading.Lock()
+REALTIME_ALLOWED_ROOTS = _build_realtime_roots()
+REALTIME_POLL_INTERVAL = float(os.environ.get('SIEM_REALTIME_POLL_INTERVAL', '0.5'))
+REALTIME_INOTIFY = os.environ.get('SIEM_REALTIME_INOTIFY', 'true').lower() in {'1', 'true', 'yes'}
+REALTIME_READ_SIZE = 1024 * 1024
+BATCH_EMIT_ALERT_LIMIT = 100
+ANALYSIS_CHUNK_SIZE = int(os.environ.get('SIEM_ANALYSIS_CHUNK_SIZE', '2000'))
+FRAME_LOG_LIMIT = 50
+RECENT_LOG_LINES = int(os.environ.get('SIEM_RECENT_LOG_LINES', '10000'))
+RECENT_LOG_ARENA_BYTES = int(float(os.environ.get('SIEM_RECENT_LOG_ARENA_MB', '4')) * 1024 * 1024)
+RECENT_LOG_MAX_SOURCES = 4096
+# RecentLogs column typecodes: timestamp, source id, line number, arena offset, length
+RECENT_LOG_COLUMNS = ('d', 'I', 'q', 'I', 'I')
+RECENT_LOG_SLOT_BYTES = sum(array(typecode).itemsize for typecode in RECENT_LOG_COLUMNS)
+
+
+class RecentLogs:
+    """Fixed-capacity ring of the newest log lines this process has published.
+
+    Lines are kept column-wise: epoch timestamps (float64), interned source
+    ids, store-wide line numbers (0 when unknown) and the offset and length of
+    each line's UTF-8 bytes in one shared byte arena, RECENT_LOG_SLOT_BYTES
+    (28) per line besides the text itself. A line is never split across the
+    end of the arena (the arena wraps early instead), so entries are read as
+    zero-copy memoryviews; the oldest lines are evicted when the ring or the
+    arena fills. Positions count every line ever appended, so a reader can
+    ask for what arrived since a position it saw before.
+    """
+
+    def __init__(self, capacity=RECENT_LOG_LINES, arena_bytes=RECENT_LOG_ARENA_BYTES):
+        self.capacity = max(int(capacity), 1)
+        self._timestamps, self._sources, self._numbers, self._offsets, self._lengths = (
+            array(typecode, bytes(array(typecode).itemsize * self.capacity)) for typecode in RECENT_LOG_COLUMNS
+        )
+        self._arena = bytearray(max(int(arena_bytes), 1024))
+        self._view = memoryview(self._arena)
+        self._max_line = len(self._arena) // 4
+        self._write = 0
+        self._start = 0
+        self.end = 0
+        self._source_ids = {}
+        self._source_names = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.end - self._start
+
+    def extend(self, timestamp, log_lines, sources, last_number=None):
+        """Append lines published together; last_number is the store's number of the last one"""
+        first_number = last_number - len(log_lines) + 1 if last_number else 0
+        with self._lock:
+            for index, (line, source) in enumerate(zip(log_lines, sources)):
+                data = line.encode('utf-8', errors='replace')[:self._max_line]
+                if self._write + len(data) > len(self._arena):
+                    self._wrap()
+                self._evict(self._write, self._write + len(data))
+                slot = self.end % self.capacity
+                self._arena[self._write:self._write + len(data)] = data
+                self._timestamps[slot] = timestamp
+                self._sources[slot] = self._source_id(source)
+                self._numbers[slot] = first_number + index if first_number else 0
+                self._offsets[slot] = self._write
+                self._lengths[slot] = len(data)
+                self._write += len(data)
+                self.end += 1
+
+    def _wrap(self):
+        # Entries past the write point are the oldest; the space after them is left unused
+        while self._start < self.end and self._offsets[self._start % self.capacity] >= self._write:
+            self._start += 1
+        self._write = 0
+
+    def _evict(self, low, high):
+        if self.end - self._start >= self.capacity:
+            self._start += 1
+        while self._start < self.end:
+            slot = self._start % self.capacity
+            offset = self._offsets[slot]
+            if offset >= high or offset + self._lengths[slot] <= low:
+                break
+            self._start += 1
+
+    def _source_id(self, source):
+        source = str(source)
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            if len(self._source_names) >= RECENT_LOG_MAX_SOURCES:
+                self._compact_sources()
+            source_id = len(self._source_names)
+            self._source_ids[source] = source_id
+            self._source_names.append(source)
+        return source_id
+
+    def _compact_sources(self):
+        """Renumber the sources still referenced by a live entry (caller holds the lock)"""
+        names = []
+        ids = {}
+        for position in range(self._start, self.end):
+            slot = position % self.capacity
+            name = self._source_names[self._sources[slot]]
+            if name not in ids:
+                ids[name] = len(names)
+                names.append(name)
+            self._sources[slot] = ids[name]
+        self._source_names, self._source_ids = names, ids
+
+    def views(self, start, stop):
+        """(timestamp, source, memoryview of the UTF-8 line) for positions [start, stop).
+
+        The caller holds the lock; the views are only valid until the next extend.
+        """
+        for position in range(start, stop):
+            slot = position % self.capacity
+            offset = self._offsets[slot]
+            yield (self._timestamps[slot], self._source_names[self._sources[slot]],
+                   self._view[offset:offset + self._lengths[slot]])
+
+    def _format(self, start, stop):
+        return [
+            SIEMStore.format_log(timestamp, source, str(line, 'utf-8'))
+            for timestamp, source, line in self.views(start, stop)
+        ]
+
+    def tail(self, limit):
+        """The newest limit lines, oldest first, formatted like the live feed"""
+        with self._lock:
+            return self._format(max(self._start, self.end - limit), self.end)
+
+    def since(self, position, limit):
+        """(formatted lines appended after position, newest limit of them; the new end position)"""
+        with self._lock:
+            return self._format(max(self._start, position, self.end - limit), self.end), self.end
+
+    def tail_if_current(self, limit, newest_number):
+        """tail(limit) if it is exactly the store's newest limit lines, else None.
+
+        newest_number is the store's log_count(). Lines this process did not
+        store itself (other web workers, analysis processes) leave gaps in
+        the numbers, and then the caller has to ask the store.
+        """
+        count = min(limit, newest_number)
+        with self._lock:
+            if self.end - self._start < count:
+                return None
+            start = self.end - count
+            expected = newest_number - count + 1
+            for position in range(start, self.end):
+                if self._numbers[position % self.capacity] != expected:
+                    return None
+                expected += 1
+            return self._format(start, self.end)
+
+    def describe(self):
+        with self._lock:
+            lines = self.end - self._start
+            text = sum(self._lengths[position % self.capacity] for position in range(self._start, self.end))
+            return {
+                'lines': lines,
+                'capacity': self.capacity,
+                'arena_bytes': len(self._arena),
+                'text_bytes': text,
+                'sources': len(self._source_names),
+                'bytes_per_line': round((text + RECENT_LOG_SLOT_BYTES * lines) / lines, 1) if lines else 0
+            }
+
+
+RECENT_LOGS = RecentLogs()
+
+
+class UpdateBroadcaster:
+    """Coalesces dashboard updates into at most max_fps Socket.IO frames per second.
+
+    Producers only append to bounded buffers, so ingestion never waits on a
+    client. A background task cuts a frame from whatever arrived since the
+    last one: the new log lines (last FRAME_LOG_LIMIT), the new or updated
+    alerts (last BATCH_EMIT_ALERT_LIMIT, the latest version of each), counts
+    of everything received and one stats snapshot. Log lines are read back
+    from RECENT_LOGS by position, so they are formatted only when they make
+    it into a frame. Frames are delivered per client with an
+    acknowledgement; a client that has not acked its previous frame gets the
+    frames it missed merged into one when it catches up, and a client that
+    falls further behind than the retained history gets {'resync': True}
+    and reloads.
+    """
+
+    def __init__(self, max_fps=None, ack_timeout=None, history=64):
+        if max_fps is None:
+            max_fps = float(os.environ.get('SIEM_WS_MAX_FPS', '4'))
+        if ack_timeout is None:
+            ack_timeout = float(os.environ.get('SIEM_WS_ACK_TIMEOUT', '5'))
+        self.interval = 1.0 / max(max_fps, 0.1)
+        self.ack_timeout = ack_timeout
+        self._lock = threading.Lock()
+        self._log_position = 0
+        self._alerts = OrderedDict()
+        self._logs_received = 0
+        self._alerts_received = 0
+        self._realtime = defaultdict(lambda: deque(maxlen=FRAME_LOG_LIMIT))
+        self._frames = deque(maxlen=history)
+        self._seq = 0
+        self._clients = {}
+        self._started = False
+        self.frames_sent = 0
+        self.frames_merged = 0
+        self.resyncs = 0
+        self.realtime_emits = 0
+
+    def publish(self, timestamp, log_lines, sources, new_alerts=(), last_log=None):
+        """Queue analyzed lines and their alerts for the next frame.
+
+        last_log is the store's number of the last line, when this process stored them.
+        """
+        RECENT_LOGS.extend(timestamp.timestamp(), log_lines, sources, last_log)
+        with self._lock:
+            self._logs_received += len(log_lines)
+            for alert in new_alerts:
+                self._alerts.pop(alert['id'], None)
+                self._alerts[alert['id']] = alert
+            while len(self._alerts) > BATCH_EMIT_ALERT_LIMIT:
+                self._alerts.popitem(last=False)
+            self._alerts_received += len(new_alerts)
+        self._ensure_started()
+
+    def publish_realtime(self, client_ids, lines):
+        """Queue tailed lines for the realtime view of each subscribed client"""
+        lines = lines[-FRAME_LOG_LIMIT:]
+        with self._lock:
+            for client_id in client_ids:
+                self._realtime[client_id].extend(lines)
+        self._ensure_started()
+
+    def add_client(self, client_id):
+        with self._lock:
+            self._clients[client_id] = {'seq': self._seq, 'inflight_since': None}
+        self._ensure_started()
+
+    def remove_client(self, client_id):
+        with self._lock:
+            self._clients.pop(client_id, None)
+            self._realtime.pop(client_id, None)
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as exc:
+                logger.error("Broadcast error: %s", exc)
+
+    def flush(self):
+        """Cut a frame from pending updates and deliver to every ready client"""
+        with self._lock:
+            realtime = {client_id: list(lines) for client_id, lines in self._realtime.items() if lines}
+            for client_id in realtime:
+                self._realtime[client_id].clear()
+            pending = self._logs_received or self._alerts_received
+            if pending:
+                logs, self._log_position = RECENT_LOGS.since(self._log_position, FRAME_LOG_LIMIT)
+                alerts = list(self._alerts.values())
+                logs_received, alerts_received = self._logs_received, self._alerts_received
+                self._alerts.clear()
+                self._logs_received = self._alerts_received = 0
+
+        for client_id, lines in realtime.items():
+            socketio.emit('realtime_log', {'logs': lines}, to=client_id)
+            self.realtime_emits += 1
+
+        if pending:
+            stats = _current_stats()
+            with self._lock:
+                self._seq += 1
+                self._frames.append({
+                    'seq': self._seq,
+                    'logs': logs,
+                    'alerts': alerts,
+                    'logs_received': logs_received,
+                    'alerts_generated': alerts_received,
+                    'stats': stats
+                })
+
+        now = time.monotonic()
+        deliveries = []
+        with self._lock:
+            for client_id, state in self._clients.items():
+                if state['seq'] >= self._seq:
+                    continue
+                if state['inflight_since'] is not None and now - state['inflight_since'] < self.ack_timeout:
+                    continue
+                deliveries.append((client_id, self._frame_since(state['seq'])))
+                state['seq'] = self._seq
+                state['inflight_since'] = now
+
+        for client_id, frame in deliveries:
+            socketio.emit('log_update', frame, to=client_id, callback=lambda *_, sid=client_id: self._acked(sid))
+            self.frames_sent += 1
+
+    def _frame_since(self, seq):
+        """One frame covering every frame after seq (caller holds the lock)"""
+        frames = [frame for frame in self._frames if frame['seq'] > seq]
+        if not frames or frames[0]['seq'] != seq + 1:
+            self.resyncs += 1
+            return {'seq': self._seq, 'resync': True, 'stats': self._frames[-1]['stats']}
+        if len(frames) == 1:
+            return frames[0]
+        self.frames_merged += len(frames) - 1
+        return {
+            'seq': frames[-1]['seq'],
+            'logs': [line for frame in frames for line in frame['logs']][-FRAME_LOG_LIMIT:],
+            'alerts': list({
+                alert['id']: alert for frame in frames for alert in frame['alerts']
+            }.values())[-BATCH_EMIT_ALERT_LIMIT:],
+            'logs_received': sum(frame['logs_received'] for frame in frames),
+            'alerts_generated': sum(frame['alerts_generated'] for frame in frames),
+            'stats': frames[-1]['stats'],
+            'merged': len(frames)
+        }
+
+    def _acked(self, client_id):
+        with self._lock:
+            state = self._clients.get(client_id)
+            if state:
+                state['inflight_since'] = None
+
+    def describe(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'seq': self._seq,
+                'frames_sent': self.frames_sent,
+                'frames_merged': self.frames_merged,
+                'resyncs': self.resyncs,
+                'max_fps': round(1.0 / self.interval, 2)
+            }
+
+
+BROADCASTER = UpdateBroadcaster()
+
+
+def _resolve_realtime_path(raw_path):
+    if not raw_path:
+        return None, 'Log file path is required.'
+
+    candidate = Path(raw_path).expanduser()
+    if not candidate.is_absolute():
+        candidate = (BASE_DIR / raw_path).resolve()
+        if not candidate.exists():
+            candidate = (UPLOAD_DIR / raw_path).resolve()
+        if not candidate.exists():
+            candidate = (LOG_DIR / raw_path).resolve()
+    else:
+        candidate = candidate.resolve()
+
+    if not candidate.exists() or not candidate.is_file():
+        return None, f'Log file not found: {raw_path}'
+
+    if not any(_is_within_path(candidate, root) for root in REALTIME_ALLOWED_ROOTS):
+        return None, 'Log file is outside allowed directories.'
+
+    return candidate, None
+
+
+def _current_stats():
+    counters = STORE.counters()
+    return {
+        'total_logs_processed': counters.get('logs', 0),
+        'total_alerts': counters.get('alerts', 0),
+        'high_severity_alerts': counters.get('alerts:HIGH', 0),
+        'critical_alerts': counters.get('alerts:CRITICAL', 0),
+        'unacknowledged_alerts': counters.get('alerts:unacked', 0),
+        'alert_repeats': counters.get('alert_repeats', 0),
+        'system_status': 'online'
+    }
+
+
+class _Inotify:
+    """Minimal ctypes binding to Linux inotify (non-blocking fd)."""
+
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    DIRECTORY_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path, mask=DIRECTORY_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Pending (wd, mask, name) events; empty when there are none"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        position = 0
+        while position + self._EVENT.size <= len(data):
+            wd, mask, _, name_length = self._EVENT.unpack_from(data, position)
+            position += self._EVENT.size
+            name = data[position:position + name_length].rstrip(b'\0')
+            position += name_length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _TailReader:
+    """One open file being tailed, with the clients subscribed to it."""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.subscribers = set()
+        self.analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
+        self.handle = None
+        self.inode = None
+        self.offset = 0
+        # Lines ending at or before committed are already stored
+        self.committed = 0
+        self.head_length = 0
+        self.head_hash = ''
+        self.lock = threading.Lock()
+
+    def open(self, offset=None):
+        """(Re)open the path; offset None starts at the end of the file"""
+        if self.handle:
+            self.handle.close()
+        self.handle = open(self.path, 'rb')
+        stat = os.fstat(self.handle.fileno())
+        self.inode = stat.st_ino
+        self.offset = stat.st_size if offset is None else min(offset, stat.st_size)
+        self.committed = self.offset
+        self.head_length = 0
+        self.update_head()
+
+    def head_digest(self, length):
+        self.handle.seek(0)
+        return hashlib.sha1(self.handle.read(length)).hexdigest()
+
+    def update_head(self):
+        """Hash the first bytes up to the committed offset, while that is below TAIL_HEAD_BYTES"""
+        if self.head_length < TAIL_HEAD_BYTES:
+            self.head_length = min(self.committed, TAIL_HEAD_BYTES)
+            self.head_hash = self.head_digest(self.head_length)
+
+    def matches(self, checkpoint):
+        """Whether the open file is the one a checkpoint was taken on"""
+        if checkpoint.inode != self.inode or os.fstat(self.handle.fileno()).st_size < checkpoint.offset:
+            return False
+        return self.head_digest(checkpoint.head_length) == checkpoint.head_hash
+
+    def rewind(self):
+        """Start over at the beginning of a truncated, rewritten or new file"""
+        self.offset = self.committed = 0
+        self.head_length = 0
+        self.update_head()
+
+    def checkpoint(self, offset):
+        return TailCheckpoint(self.path, self.inode, offset, self.head_length, self.head_hash)
+
+    def close(self):
+        with self.lock:
+            if self.handle:
+                self.handle.close()
+                self.handle = None
+
+
+class FileTailer:
+    """Shared realtime tailer: one reader per file, however many clients watch it.
+
+    A single background thread waits on inotify events for the watched
+    directories (or polls every REALTIME_POLL_INTERVAL seconds when inotify
+    is unavailable), reads the complete lines appended to each file,
+    analyzes them once and fans them out to every subscribed client. Renamed
+    or recreated files (rotation) are drained before the new file is read
+    from its start; a file that shrinks or whose first bytes change
+    (truncation, rewrite) is re-read from its start.
+
+    Every analyzed chunk commits a checkpoint (inode, byte offset, hash of
+    the first bytes) in the same transaction as its logs and alerts, so a
+    new reader for a file, also after a crash, resumes exactly after the
+    last stored line. A line is identified by the file and the byte offset
+    it ends at: lines at or before the checkpoint are never analyzed again,
+    even when a client asks to start from the beginning.
+    """
+
+    def __init__(self, use_inotify=REALTIME_INOTIFY, poll_interval=REALTIME_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._use_inotify = use_inotify
+        self._inotify = None
+        self._watches = {}
+        self._readers = {}
+        self._client_paths = {}
+        self._lock = threading.Lock()
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify else 'polling'
+
+    def subscribe(self, client_id, path, source, from_start=False):
+        """Attach a client to the reader for path, creating it if needed.
+
+        from_start only applies when the reader is created and replays the
+        already stored part of the file to the client without analyzing it
+        again. Without it a reader resumes from the file's checkpoint, or
+        starts at the end of a file never tailed before. Returns True if a
+        new reader was started.
+        """
+        path = str(path)
+        self.unsubscribe(client_id)
+        with self._lock:
+            reader = self._readers.get(path)
+            created = reader is None
+            if created:
+                reader = _TailReader(path, source)
+                saved = STORE.tail_checkpoint(path)
+                reader.open(0 if saved or from_start else None)
+                if saved and reader.matches(saved):
+                    reader.committed = saved.offset
+                    reader.offset = 0 if from_start else saved.offset
+                elif saved:
+                    logger.info("Tailed file changed since its checkpoint, reading from the start: %s", path)
+                reader.update_head()
+                self._readers[path] = reader
+                self._watch(path)
+            reader.subscribers.add(client_id)
+            self._client_paths[client_id] = path
+            if self._thread is None:
+                self._start()
+        self._wake()
+        return created
+
+    def unsubscribe(self, client_id):
+        with self._lock:
+            path = self._client_paths.pop(client_id, None)
+            reader = self._readers.get(path)
+            if reader is None:
+                return
+            reader.subscribers.discard(client_id)
+            if reader.subscribers:
+                return
+            self._drop_reader(reader)
+        reader.close()
+
+    def _drop_reader(self, reader):
+        """Forget a reader and its directory watch (caller holds the lock and closes the reader)"""
+        self._readers.pop(reader.path, None)
+        for client_id in reader.subscribers:
+            self._client_paths.pop(client_id, None)
+        directory = os.path.dirname(reader.path)
+        if self._inotify and not any(os.path.dirname(path) == directory for path in self._readers):
+            wd = self._watches.pop(directory, None)
+            if wd is not None:
+                self._inotify.rm_watch(wd)
+
+    def _watch(self, path):
+        directory = os.path.dirname(path)
+        if not self._inotify or directory in self._watches:
+            return
+        try:
+            self._watches[directory] = self._inotify.add_watch(directory)
+        except OSError as exc:
+            logger.warning("inotify watch failed for %s (%s); polling instead", directory, exc)
+            self._stop_inotify()
+
+    def _start(self):
+        if self._use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as exc:
+                logger.info("inotify unavailable (%s); polling tailed files", exc)
+        for path in self._readers:
+            self._watch(path)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _stop_inotify(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+            self._watches.clear()
+
+    def _wake(self):
+        os.write(self._wake_write, b'.')
+
+    def _run(self):
+        while True:
+            inotify = self._inotify
+            fds = [self._wake_read] + ([inotify.fd] if inotify else [])
+            # With inotify the timeout is only a safety net for missed events
+            ready, _, _ = select.select(fds, [], [], self.poll_interval * (10 if inotify else 1))
+            if self._wake_read in ready:
+                os.read(self._wake_read, 4096)
+            if inotify and inotify.fd in ready:
+                inotify.read_events()
+            with self._lock:
+                readers = list(self._readers.values())
+            for reader in readers:
+                try:
+                    with reader.lock:
+                        self._poll(reader)
+                except Exception as exc:
+                    logger.error("Real-time monitor error: %s", exc)
+                    with self._lock:
+                        subscribers = list(reader.subscribers)
+                        self._drop_reader(reader)
+                    reader.close()
+                    for client_id in subscribers:
+                        socketio.emit('realtime_status', {'success': False, 'error': str(exc)}, to=client_id)
+
+    def _poll(self, reader):
+        """Follow truncation, read what was appended, then follow rotation"""
+        if reader.handle is None:
+            return  # Closed by its last client meanwhile
+        try:
+            stat = os.stat(reader.path)
+        except FileNotFoundError:
+            stat = None  # Rotated away and not recreated yet
+        if stat is not None and stat.st_ino == reader.inode and (
+                stat.st_size < reader.offset or reader.head_digest(reader.head_length) != reader.head_hash):
+            logger.info("Tailed file truncated: %s", reader.path)
+            reader.rewind()
+        self._drain(reader)
+        if stat is not None and stat.st_ino != reader.inode:
+            logger.info("Tailed file rotated: %s", reader.path)
+            reader.open(0)
+            self._drain(reader)
+
+    def _drain(self, reader):
+        while True:
+            reader.handle.seek(reader.offset)
+            data = reader.handle.read(REALTIME_READ_SIZE)
+            end = data.rfind(b'\n') + 1
+            if not end:
+                if len(data) < REALTIME_READ_SIZE:
+                    return  # Only a partial line so far
+                end = len(data)
+            self._dispatch(reader, data[:end])
+
+    def _dispatch(self, reader, data):
+        """Analyze the complete lines in data (read at reader.offset) and fan them out"""
+        end = reader.offset + len(data)
+        pieces = data.split(b'\n')
+        if data.endswith(b'\n'):
+            pieces.pop()
+        lines = []
+        fresh = []
+        position = reader.offset
+        for raw in pieces:
+            position = min(position + len(raw) + 1, end)
+            line = raw.decode('utf-8', errors='ignore')
+            lines.append(line)
+            if position > reader.committed:
+                fresh.append((line, position))
+        reader.offset = end
+
+        for start in range(0, len(fresh), ANALYSIS_CHUNK_SIZE):
+            chunk = fresh[start:start + ANALYSIS_CHUNK_SIZE]
+            reader.committed = chunk[-1][1]
+            reader.update_head()
+            reader.analyzer.analyze_batch(
+                ((line, reader.source) for line, _ in chunk), checkpoint=reader.checkpoint(reader.committed)
+            )
+        stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            subscribers = list(reader.subscribers)
+        BROADCASTER.publish_realtime(
+            subscribers, [f"[{stamp}] {reader.source}: {line.strip()}" for line in lines if line.strip()]
+        )
+
+    def describe(self):
+        with self._lock:
+            return {
+                'mode': self.mode if self._thread else 'idle',
+                'files': {path: {'subscribers': len(reader.subscribers), 'offset': reader.offset,
+                                 'committed': reader.committed}
+                          for path, reader in self._readers.items()}
+            }
+
+
+TAILER = FileTailer()
+
+
+_CASEFOLD_UNSAFE_ESCAPES = set('xuUN0123456789')
+
+
+def _casefold_pattern(pattern):
+    """Lower-case the literal parts of a regex so it can run case-sensitively on a lower-cased line.
+
+    Returns None when the pattern uses constructs that cannot be folded safely
+    (character codes, inline flags), in which case the caller keeps re.IGNORECASE.
+    """
+    out = []
+    i = 0
+    length = len(pattern)
+    while i < length:
+        char = pattern[i]
+        if char == '\\':
+            if i + 1 < length and pattern[i + 1] in _CASEFOLD_UNSAFE_ESCAPES:
+                return None
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if char == '(' and pattern.startswith('(?', i):
+            if pattern.startswith(('(?P<', '(?P='), i):
+                end = pattern.find('>' if pattern[i + 3] == '<' else ')', i)
+                if end == -1:
+                    return None
+                out.append(pattern[i:end + 1])
+                i = end + 1
+                continue
+            if i + 2 < length and (pattern[i + 2].isalpha() or pattern[i + 2] == '-'):
+                return None
+        out.append(char.lower())
+        i += 1
+    return ''.join(out)
+
+
+PREFILTER_ENABLED = os.environ.get('SIEM_RULE_PREFILTER', 'true').lower() in {'1', 'true', 'yes'}
+_LITERAL_SET_LIMIT = 64
+
+
+def _best_literal_set(candidates):
+    """Pick the most selective alternative set: longest shortest-literal, then fewest literals."""
+    usable = [c for c in candidates if c and '' not in c]
+    if not usable:
+        return None
+    return max(usable, key=lambda c: (min(len(s) for s in c), -len(c)))
+
+
+def _literal_node(op, av):
+    """Return (exact, required) literal sets for a single parsed regex node.
+
+    exact is the finite set of strings the node can match, required is a set of
+    strings of which at least one must appear in any match. Either may be None.
+    """
+    if op is sre_constants.LITERAL:
+        char = chr(av).lower()
+        return ({char}, None) if char.isascii() else (None, None)
+    if op is sre_constants.IN:
+        if len(av) <= _LITERAL_SET_LIMIT and all(item_op is sre_constants.LITERAL for item_op, _ in av):
+            chars = {chr(c).lower() for _, c in av}
+            if all(c.isascii() for c in chars):
+                return chars, None
+        return None, None
+    if op is sre_constants.SUBPATTERN:
+        return _literal_sequence(av[-1])
+    if op is sre_constants.BRANCH:
+        branches = [_literal_sequence(branch) for branch in av[1]]
+        if all(exact is not None for exact, _ in branches):
+            exact = set().union(*(exact for exact, _ in branches))
+            if len(exact) <= _LITERAL_SET_LIMIT:
+                return exact, None
+        required = set()
+        for exact, req in branches:
+            best = _best_literal_set([c for c in (exact, req) if c is not None])
+            if best is None:
+                return None, None
+            required |= best
+        return None, required
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+        low, high, item = av
+        if low == 0:
+            return None, None
+        exact, req = _literal_sequence(item)
+        if low == high == 1:
+            return exact, req
+        return None, _best_literal_set([c for c in (exact, req) if c is not None])
+    if op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return {''}, None
+    return None, None
+
+
+def _literal_sequence(items):
+    candidates = []
+    run = {''}
+    all_exact = True
+    for op, av in items:
+        exact, req = _literal_node(op, av)
+        if exact is not None:
+            joined = {a + b for a in run for b in exact}
+            if len(joined) <= _LITERAL_SET_LIMIT:
+                run = joined
+                continue
+            candidates.append(run)
+            run = exact
+            all_exact = False
+            continue
+        all_exact = False
+        candidates.append(run)
+        run = {''}
+        if req:
+            candidates.append(req)
+    if all_exact:
+        return run, None
+    candidates.append(run)
+    return None, _best_literal_set(candidates)
+
+
+def _required_literals(pattern, flags=0):
+    """Lower-cased substrings of which at least one must occur in any match of pattern.
+
+    Returns None when no such set can be derived; those rules are always evaluated.
+    """
+    try:
+        exact, required = _literal_sequence(sre_parse.parse(pattern, flags))
+    except Exception:
+        return None
+    best = _best_literal_set([c for c in (exact, required) if c is not None])
+    if best is None:
+        return None
+    # A literal that contains another one in the same set adds nothing
+    return frozenset(s for s in best if not any(o != s and o in s for o in best))
+
+
+_REPEAT_OPS = tuple(
+    op for op in (
+        sre_constants.MAX_REPEAT,
+        sre_constants.MIN_REPEAT,
+        getattr(sre_constants, 'POSSESSIVE_REPEAT', None)
+    ) if op is not None
+)
+_ATOMIC_GROUP = getattr(sre_constants, 'ATOMIC_GROUP', None)
+_NEWLINE_CATEGORIES = {
+    sre_constants.CATEGORY_SPACE,
+    sre_constants.CATEGORY_NOT_WORD,
+    sre_constants.CATEGORY_NOT_DIGIT,
+    sre_constants.CATEGORY_LINEBREAK
+}
+
+
+def _is_line_local(items, dotall=False):
+    """True when the parsed pattern can never consume a newline or anchor on string edges.
+
+    Such patterns give the same per-line answer when run with re.MULTILINE over
+    many lines joined by newlines, which is what the batch matcher relies on.
+    """
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            if av == 10:
+                return False
+        elif op is sre_constants.NOT_LITERAL:
+            if av != 10:
+                return False
+        elif op is sre_constants.ANY:
+            if dotall:
+                return False
+        elif op is sre_constants.IN:
+            for item_op, item_av in av:
+                if item_op is sre_constants.NEGATE:
+                    return False
+                if item_op is sre_constants.LITERAL and item_av == 10:
+                    return False
+                if item_op is sre_constants.RANGE and item_av[0] <= 10 <= item_av[1]:
+                    return False
+                if item_op is sre_constants.CATEGORY and item_av in _NEWLINE_CATEGORIES:
+                    return False
+        elif op is sre_constants.AT:
+            if av in (sre_constants.AT_BEGINNING_STRING, sre_constants.AT_END_STRING):
+                return False
+        elif op is sre_constants.SUBPATTERN:
+            add_flags, del_flags = av[1], av[2]
+            inner_dotall = (dotall or bool(add_flags & sre_constants.SRE_FLAG_DOTALL)) \
+                and not del_flags & sre_constants.SRE_FLAG_DOTALL
+            if not _is_line_local(av[-1], inner_dotall):
+                return False
+        elif op is sre_constants.BRANCH:
+            if not all(_is_line_local(branch, dotall) for branch in av[1]):
+                return False
+        elif op in _REPEAT_OPS:
+            if not _is_line_local(av[2], dotall):
+                return False
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if not _is_line_local(av[1], dotall):
+                return False
+        elif op is _ATOMIC_GROUP:
+            if not _is_line_local(av, dotall):
+                return False
+        elif op is sre_constants.GROUPREF_EXISTS:
+            if not all(_is_line_local(branch, dotall) for branch in av[1:] if branch is not None):
+                return False
+        elif op is not sre_constants.GROUPREF:
+            return False
+    return True
+
+
+def _batch_regex(regex):
+    """MULTILINE twin of a compiled rule regex, or None if it is not line-local."""
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+        dotall = bool(parsed.state.flags & sre_constants.SRE_FLAG_DOTALL)
+        if not _is_line_local(list(parsed), dotall):
+            return None
+        return re.compile(regex.pattern, regex.flags | re.MULTILINE)
+    except Exception:
+        return None
+
+
+class LiteralIndex:
+    """Aho-Corasick automaton over rule literals.
+
+    The goto/fail trie is flattened into a DFA at build time, so scanning a line
+    is a single dict lookup per character regardless of how many rules exist.
+    """
+
+    def __init__(self, literal_map):
+        goto = [{}]
+        fail = [0]
+        outputs = [set()]
+        for literal, rule_indexes in literal_map.items():
+            state = 0
+            for char in literal:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    goto.append({})
+                    fail.append(0)
+                    outputs.append(set())
+                    nxt = len(goto) - 1
+                    goto[state][char] = nxt
+                state = nxt
+            outputs[state] |= rule_indexes
+
+        self._delta = [None] * len(goto)
+        self._delta[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            transitions = dict(self._delta[fail[state]])
+            transitions.update(goto[state])
+            self._delta[state] = transitions
+            for char, nxt in goto[state].items():
+                fail[nxt] = self._delta[fail[state]].get(char, 0)
+                outputs[nxt] |= outputs[fail[nxt]]
+                queue.append(nxt)
+        self._outputs = [frozenset(o) for o in outputs]
+
+    def search(self, text):
+        """Return the indexes of every rule with a literal present in text."""
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        found = set()
+        for char in text:
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+# Typed fields of one log line, filled by the first decoder in LOG_DECODERS that
+# recognizes it ('raw' when none does). payload is the decoded JSON object of
+# json/waf lines, kept so the TIP model does not decode the line again.
+LogEvent = namedtuple('LogEvent', 'format src_ip user method path status host program attack payload')
+EVENT_FIELDS = ('format', 'src_ip', 'user', 'method', 'path', 'status', 'host', 'program', 'attack')
+
+# Keys a JSON record may carry each field under, in order of preference
+_JSON_FIELD_KEYS = {
+    'src_ip': ('src_ip', 'ip', 'client_ip', 'source_ip', 'remote_addr', 'clientip'),
+    'user': ('user', 'username', 'user_name', 'account'),
+    'method': ('method', 'http_method'),
+    'path': ('path', 'uri', 'url', 'request_uri'),
+    'status': ('status', 'status_code', 'response_code'),
+    'host': ('host', 'hostname'),
+    'program': ('program', 'app', 'service'),
+    'attack': ('attack', 'attack_type'),
+}
+# <PRI>, then an RFC 3164 or ISO 8601 timestamp, host and program[pid]:
+_SYSLOG_RE = re.compile(
+    r'(?:<\d{1,3}>\d?\s*)?'
+    r'(?:[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d|\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\S*) '
+    r'(\S+) ([\w./-]+)(?:\[\d+\])?: '
+)
+# Apache/Nginx common and combined: host ident user [time] "METHOD path ..." status
+_COMBINED_RE = re.compile(r'(\S+) \S+ (\S+) \[[^\]]+\] "([A-Z]+) (\S+)[^"]*" (\d{3}) ')
+
+
+def _event_text(value):
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    value = str(value)
+    return value if value and value != '-' else None
+
+
+def _event_status(value):
+    try:
+        status = int(value)
+    except (TypeError, ValueError):
+        return None
+    return status if 100 <= status <= 599 else None
+
+
+def _message_user(text):
+    """The user named in free text, as the user search terms find it"""
+    lowered = text.lower()
+    if not any(hint in lowered for hint in _SEARCH_USER_HINTS):
+        return None
+    for regex in _SEARCH_USER_RES:
+        match = regex.search(text)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _decode_json(line):
+    """JSON object lines; the WAF's suspicious.log records come out as format 'waf'"""
+    if line[0] != '{':
+        return None
+    try:
+        payload = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    values = {}
+    for field, keys in _JSON_FIELD_KEYS.items():
+        for key in keys:
+            value = _event_text(payload.get(key))
+            if value is not None:
+                values[field] = value
+                break
+    return LogEvent(
+        'waf' if 'attack' in payload and 'payload_hash' in payload else 'json',
+        values.get('src_ip'), values.get('user'), values.get('method'), values.get('path'),
+        _event_status(values.get('status')), values.get('host'), values.get('program'), values.get('attack'),
+        payload
+    )
+
+
+def _decode_syslog(line):
+    match = _SYSLOG_RE.match(line)
+    if match is None:
+        return None
+    message = line[match.end():]
+    ip = _SEARCH_IP_RE.search(message)
+    return LogEvent(
+        'syslog', ip.group(0) if ip else None, _message_user(message), None, None, None,
+        match.group(1), match.group(2), None, None
+    )
+
+
+def _decode_combined(line):
+    match = _COMBINED_RE.match(line)
+    if match is None:
+        return None
+    host, user, method, path, status = match.groups()
+    return LogEvent('combined', host, _event_text(user), method, path, int(status), None, None, None, None)
+
+
+def _decode_raw(line):
+    ip = _SEARCH_IP_RE.search(line)
+    return LogEvent('raw', ip.group(0) if ip else None, _message_user(line), None, None, None, None, None, None, None)
+
+
+# (name, decoder) pairs tried in order; a decoder returns a LogEvent or None
+LOG_DECODERS = [('json', _decode_json), ('syslog', _decode_syslog), ('combined', _decode_combined)]
+
+
+def register_log_decoder(name, decoder, first=False):
+    """Add a line -> LogEvent (or None) decoder, after the built-in ones unless first"""
+    if first:
+        LOG_DECODERS.insert(0, (name, decoder))
+    else:
+        LOG_DECODERS.append((name, decoder))
+
+
+def parse_log_line(line):
+    """The LogEvent of a stripped, non-empty log line"""
+    for _, decoder in LOG_DECODERS:
+        event = decoder(line)
+        if event is not None:
+            return event
+    return _decode_raw(line)
+
+
+def _complete_events(log_lines, events):
+    """events with the lines that were not parsed (None, or all when events is None) parsed"""
+    if events is None:
+        return [parse_log_line(line) for line in log_lines]
+    if None not in events:
+        return events
+    return [parse_log_line(line) if event is None else event for line, event in zip(log_lines, events)]
+
+
+def event_fields(event):
+    """The fields an event has, as a dict (format always included)"""
+    return {name: value for name, value in zip(EVENT_FIELDS, event) if value is not None}
+
+
+def _field_key(value):
+    return str(value).lower()
+
+
+_FIELD_REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+
+def _field_matcher(field, spec):
+    """(check, keys) for one entry of a rule's "fields".
+
+    check takes the field's _field_key and says whether the spec accepts it;
+    keys is the set of keys it accepts, when that is all it accepts, or None.
+    A list accepts any of its items; IP fields take addresses or CIDR
+    networks; other strings are compared case-insensitively, or full-matched
+    as a case-insensitive regex if they contain regex syntax.
+    """
+    if isinstance(spec, list):
+        if not spec:
+            raise ValueError(f"{field}: empty list")
+        matchers = [_field_matcher(field, item) for item in spec]
+        keys = set()
+        for _, item_keys in matchers:
+            if item_keys is None:
+                keys = None
+                break
+            keys |= item_keys
+        if keys is not None:
+            return keys.__contains__, keys
+        checks = [check for check, _ in matchers]
+        return (lambda key: any(check(key) for check in checks)), None
+    if isinstance(spec, (dict, type(None))):
+        raise ValueError(f"{field}: expected a string, number or list")
+
+    spec = _field_key(spec)
+    if field.endswith('ip') and '/' in spec:
+        network = ipaddress.ip_network(spec, strict=False)
+
+        def in_network(key):
+            try:
+                return ipaddress.ip_address(key) in network
+            except ValueError:
+                return False
+        return in_network, None
+    if field.endswith('ip') or not _FIELD_REGEX_CHARS & set(spec):
+        return spec.__eq__, {spec}
+    try:
+        regex = re.compile(spec, re.IGNORECASE)
+    except re.error as exc:
+        raise ValueError(f"{field}: {exc}") from None
+    return (lambda key: regex.fullmatch(key) is not None), None
+
+
+def _compile_fields(rule):
+    """(check, indexed) for a rule's "fields": check takes a LogEvent and says
+    whether every field matches; indexed is the (field, keys) pair with the
+    fewest exact keys, for the field index, or None.
+
+    Raises ValueError for unknown fields and bad values.
+    """
+    fields = rule['fields']
+    if not isinstance(fields, dict) or not fields:
+        raise ValueError('fields must be a non-empty object')
+    checks = []
+    indexed = None
+    for field, spec in fields.items():
+        if field not in EVENT_FIELDS:
+            raise ValueError(f"unknown field {field!r}; expected one of {', '.join(EVENT_FIELDS)}")
+        check, keys = _field_matcher(field, spec)
+        checks.append((EVENT_FIELDS.index(field), check))
+        if keys is not None and (indexed is None or len(keys) < len(indexed[1])):
+            indexed = (field, keys)
+
+    def matches(event):
+        for position, check in checks:
+            value = event[position]
+            if value is None or not check(_field_key(value)):
+                return False
+        return True
+    return matches, indexed
+
+
+# group_by names that work without a matching capture group in the rule pattern
+_GROUP_BY_EXTRACTORS = {
+    'src_ip': _SEARCH_IP_RE,
+    'ip': _SEARCH_IP_RE,
+    'user': _SEARCH_USER_RES,
+    'username': _SEARCH_USER_RES,
+}
+_GROUP_BY_EVENT_FIELDS = {'ip': 'src_ip', 'username': 'user'}
+
+
+def _group_key_extractor(rule, regex=None, folded=False):
+    """Build a line -> key function for a rule's group_by, or None if it cannot be resolved.
+
+    group_by names a capture group of the rule pattern (by name or number);
+    src_ip/ip/user/username fall back to built-in extractors when the pattern
+    has no such group, and any LogEvent field can be named. Keys are
+    lower-cased like the built-in ones. The extractor's field attribute names
+    the event field that takes precedence over it (see _entity_key).
+
+    regex is the pattern as the RuleEngine compiled it (run on lower-cased
+    lines when folded); without it the pattern is compiled here.
+    """
+    group_by = rule['group_by']
+    if regex is None:
+        try:
+            regex = re.compile(rule.get('pattern', ''), re.IGNORECASE)
+        except re.error:
+            return None
+    group = group_by
+    if isinstance(group, str) and group.isdigit():
+        group = int(group)
+    if group in regex.groupindex or (isinstance(group, int) and 0 < group <= regex.groups):
+        def extract(log_line):
+            match = regex.search(log_line.lower() if folded else log_line)
+            key = match.group(group) if match else None
+            return key.lower() if key else None
+        return extract
+
+    builtin = _GROUP_BY_EXTRACTORS.get(group_by)
+    field = _GROUP_BY_EVENT_FIELDS.get(group_by, group_by)
+    if builtin is None:
+        if field not in EVENT_FIELDS:
+            logger.warning("Rule %s: group_by %r is not a capture group; counting rule-wide", rule.get('id'), group_by)
+            return None
+
+        def extract(log_line):
+            return None
+        extract.field = field
+        return extract
+    regexes = builtin if isinstance(builtin, tuple) else (builtin,)
+
+    def extract(log_line):
+        for candidate in regexes:
+            match = candidate.search(log_line)
+            if match:
+                return (match.group(1) if candidate.groups else match.group(0)).lower()
+        return None
+    extract.entity = builtin
+    extract.field = field
+    return extract
+
+
+def _entity_key(extractor, log_line, event=None):
+    """An extractor's key for a line, preferring the parsed event's field"""
+    field = getattr(extractor, 'field', None)
+    if field is not None and event is not None:
+        value = getattr(event, field)
+        if value is not None:
+            return _field_key(value)
+    return extractor(log_line)
+
+
+RULE_PROFILE_SAMPLE_EVERY = int(os.environ.get('SIEM_RULE_PROFILE_SAMPLE_EVERY', '100'))
+RULE_MAX_LINE_LENGTH = int(os.environ.get('SIEM_RULE_MAX_LINE_LENGTH', '0'))
+RULE_TIMEOUT_MS = float(os.environ.get('SIEM_RULE_TIMEOUT_MS', '0'))
+RULE_METRICS_FLUSH_INTERVAL = 10
+RULE_METRICS_STALE_AFTER = 300
+_WORST_LINE_CHARS = 200
+_HISTOGRAM_STEPS = 4  # duration histogram buckets per doubling
+
+if RULE_TIMEOUT_MS > 0 and timeout_regex is None:
+    logger.warning("SIEM_RULE_TIMEOUT_MS needs the 'regex' package; rule timeouts are not enforced")
+
+
+def _guarded_regex(regex):
+    """Twin of a compiled rule regex from the regex package (searchable with a timeout), or None"""
+    if RULE_TIMEOUT_MS <= 0 or timeout_regex is None:
+        return None
+    flags = timeout_regex.IGNORECASE if regex.flags & re.IGNORECASE else 0
+    try:
+        return timeout_regex.compile(regex.pattern, flags | timeout_regex.VERSION0)
+    except timeout_regex.error:
+        return None
+
+
+def _histogram_quantile(histogram, quantile):
+    """Upper bound in microseconds of the bucket holding the quantile of a duration histogram"""
+    total = sum(histogram.values())
+    if not total:
+        return 0.0
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= quantile * total:
+            return round(2 ** ((bucket + 1) / _HISTOGRAM_STEPS) / 1000, 3)
+    return 0.0
+
+
+class _RuleCounters:
+    __slots__ = ('pattern', 'evaluations', 'matches', 'seconds', 'timeouts', 'histogram', 'worst')
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.evaluations = 0
+        self.matches = 0
+        self.seconds = 0.0
+        self.timeouts = 0
+        self.histogram = defaultdict(int)
+        self.worst = []  # min-heap of (seconds, line length, line prefix)
+
+
+class RuleProfiler:
+    """Per-rule evaluation counts, matches and regex time.
+
+    The engine charges every regex call (or batch scan) of a rule to its
+    counters: lines evaluated, lines matched and elapsed time, two clock
+    reads per rule per batch. Every sample_every-th line is also timed rule
+    by rule on its own; those durations go into a log-scale histogram (for
+    p99) and a short list of the worst offending lines per rule.
+
+    Engines are shared across threads, so each match call counts in locals
+    and merges them once through charge(), under the profiler's lock.
+
+    Counters live in the process that matched; each process publishes them
+    to the store every RULE_METRICS_FLUSH_INTERVAL seconds and snapshot()
+    merges the reports of every process that published recently. Counters
+    start over when a rule's pattern changes.
+    """
+
+    def __init__(self, sample_every=None, worst_lines=5):
+        if sample_every is None:
+            sample_every = RULE_PROFILE_SAMPLE_EVERY
+        self.sample_every = sample_every
+        self.worst_lines = worst_lines
+        self.process = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lines_truncated = 0
+        self._rules = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def track(self, rules):
+        """Counters for each rule id, keeping those whose pattern is unchanged"""
+        with self._lock:
+            current = {}
+            for rule in rules:
+                pattern = rule.get('pattern', '')
+                counters = self._rules.get(rule['id'])
+                if counters is None or counters.pattern != pattern:
+                    counters = _RuleCounters(pattern)
+                current[rule['id']] = counters
+            self._rules = current
+            return current
+
+    def charge(self, charges, lines_truncated=0):
+        """Add the (counters, evaluations, matches, seconds) one match call counted"""
+        with self._lock:
+            self.lines_truncated += lines_truncated
+            for counters, evaluations, matches, seconds in charges:
+                counters.evaluations += evaluations
+                counters.matches += matches
+                counters.seconds += seconds
+
+    def sampled(self, count):
+        """Positions among the next count lines to time rule by rule"""
+        every = self.sample_every
+        if every <= 0:
+            return range(0)
+        with self._lock:
+            start = self._lines
+            self._lines = start + count
+        return range(-start % every, count, every)
+
+    def sample(self, counters, seconds, log_line):
+        bucket = math.floor(math.log2(max(seconds * 1e9, 1.0)) * _HISTOGRAM_STEPS)
+        entry = (seconds, len(log_line), log_line[:_WORST_LINE_CHARS])
+        with self._lock:
+            counters.histogram[bucket] += 1
+            if len(counters.worst) < self.worst_lines:
+                heapq.heappush(counters.worst, entry)
+            elif entry > counters.worst[0]:
+                heapq.heapreplace(counters.worst, entry)
+
+    def timed_out(self, counters, log_line):
+        with self._lock:
+            counters.timeouts += 1
+        self.sample(counters, RULE_TIMEOUT_MS / 1000.0, log_line)
+
+    def report(self):
+        """This process's counters, as published to the store"""
+        with self._lock:
+            return {
+                'process': self.process,
+                'lines_truncated': self.lines_truncated,
+                'rules': {
+                    rule_id: {
+                        'pattern': zlib.crc32(counters.pattern.encode('utf-8')),
+                        'evaluations': counters.evaluations,
+                        'matches': counters.matches,
+                        'seconds': counters.seconds,
+                        'timeouts': counters.timeouts,
+                        'histogram': dict(counters.histogram),
+                        'worst': counters.worst[:]
+                    }
+                    for rule_id, counters in self._rules.items()
+                }
+            }
+
+    def maybe_flush(self, force=False):
+        """Publish this process's counters if the flush interval has passed"""
+        now = time.monotonic()
+        if not force and now - self._flushed < RULE_METRICS_FLUSH_INTERVAL:
+            return
+        self._flushed = now
+        try:
+            STORE.save_rule_metrics(self.process, self.report())
+        except sqlite3.Error as exc:
+            logger.error("Could not publish rule metrics: %s", exc)
+
+    def snapshot(self, rules, shared=True):
+        """Per-rule metrics for rules, costliest first.
+
+        With shared, the reports every process published in the last
+        RULE_METRICS_STALE_AFTER seconds are merged (this one's first
+        refreshed); otherwise only this process's counters are used.
+        """
+        if shared:
+            self.maybe_flush(force=True)
+            reports = STORE.rule_metrics(time.time() - RULE_METRICS_STALE_AFTER)
+        else:
+            reports = [self.report()]
+
+        by_rule = defaultdict(list)
+        for report in reports:
+            for rule_id, data in report['rules'].items():
+                by_rule[rule_id].append(data)
+
+        rows = []
+        for rule in rules:
+            pattern = zlib.crc32(rule.get('pattern', '').encode('utf-8'))
+            parts = [data for data in by_rule.get(rule['id'], ()) if data['pattern'] == pattern]
+            evaluations = sum(data['evaluations'] for data in parts)
+            seconds = sum(data['seconds'] for data in parts)
+            histogram = defaultdict(int)
+            for data in parts:
+                for bucket, count in data['histogram'].items():
+                    histogram[int(bucket)] += count
+            worst = heapq.nlargest(self.worst_lines, (tuple(entry) for data in parts for entry in data['worst']))
+            rows.append({
+                'id': rule['id'],
+                'name': rule.get('name', rule['id']),
+                'evaluations': evaluations,
+                'matches': sum(data['matches'] for data in parts),
+                'timeouts': sum(data['timeouts'] for data in parts),
+                'total_ms': round(seconds * 1000, 3),
+                'avg_us': round(seconds / evaluations * 1e6, 3) if evaluations else 0.0,
+                'p99_us': _histogram_quantile(histogram, 0.99),
+                'samples': sum(histogram.values()),
+                'worst_lines': [
+                    {'us': round(elapsed * 1e6, 1), 'length': length, 'line': line}
+                    for elapsed, length, line in worst
+                ]
+            })
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return {
+            'processes': len(reports),
+            'sample_every': self.sample_every,
+            'max_line_length': RULE_MAX_LINE_LENGTH,
+            'timeout_ms': RULE_TIMEOUT_MS,
+            'timeouts_enforced': RULE_TIMEOUT_MS > 0 and timeout_regex is not None,
+            'lines_truncated': sum(report['lines_truncated'] for report in reports),
+            'rules': rows
+        }
+
+
+RULE_PROFILER = RuleProfiler()
+
+
+PIPELINE_STAGES = ('parse', 'match', 'tip', 'store', 'emit')
+# Upper bounds in seconds of the per-batch stage latency buckets
+PIPELINE_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Sources counted by name; lines from any further sources are counted as 'other'
+PIPELINE_MAX_SOURCES = 200
+
+
+def _resident_memory():
+    """This process's resident set size in bytes (peak size where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+class PipelineMetrics:
+    """Ingest counters and per-stage batch latencies, for /metrics.
+
+    Lines are counted by source where they are stored, and each stage of an
+    analyzed batch (parse, match, tip, store, emit) is timed into a fixed
+    bucket histogram. As with RuleProfiler, every process publishes its
+    report, including its own gauges (memory, websocket clients and frames,
+    tailed files) and ingest queue drops, to the store every
+    RULE_METRICS_FLUSH_INTERVAL seconds, so a scrape answered by any worker
+    covers them all.
+    """
+
+    def __init__(self, process=None):
+        self.process = process or RULE_PROFILER.process
+        self._lines = defaultdict(int)
+        self._stages = {stage: [0] * (len(PIPELINE_STAGE_BUCKETS) + 1) for stage in PIPELINE_STAGES}
+        self._stage_seconds = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def observe(self, stage, seconds):
+        """Record how long one batch spent in a stage"""
+        bucket = bisect.bisect_left(PIPELINE_STAGE_BUCKETS, seconds)
+        with self._lock:
+            self._stages[stage][bucket] += 1
+            self._stage_seconds[stage] += seconds
+
+    def count_lines(self, sources):
+        """Count stored lines by their source"""
+        counts = defaultdict(int)
+        for source in sources:
+            counts[str(source)] += 1
+        with self._lock:
+            for source, count in counts.items():
+                if source not in self._lines and len(self._lines) >= PIPELINE_MAX_SOURCES:
+                    source = 'other'
+                self._lines[source] += count
+
+    def report(self):
+        with self._lock:
+            report = {
+                'process': self.process,
+                'lines': dict(self._lines),
+                'stages': {stage: {'buckets': list(buckets), 'seconds': self._stage_seconds[stage]}
+                           for stage, buckets in self._stages.items()}
+            }
+        broadcast = BROADCASTER.describe()
+        tailed = TAILER.describe()['files']
+        recent = RECENT_LOGS.describe()
+        report['gauges'] = {
+            'resident_memory_bytes': _resident_memory(),
+            'recent_logs_bytes': recent['arena_bytes'] + RECENT_LOG_SLOT_BYTES * recent['capacity'],
+            'recent_logs_lines': recent['lines'],
+            'threshold_keys': THRESHOLDS.describe()['keys'],
+            'websocket_clients': broadcast['clients'],
+            'realtime_monitors': len(tailed),
+            'realtime_subscribers': sum(entry['subscribers'] for entry in tailed.values()),
+            'ingest_queue_depth': INGEST_QUEUE.depth
+        }
+        report['ingest_dropped'] = INGEST_QUEUE.describe()['dropped']
+        report['websocket'] = {
+            'frames_sent': broadcast['frames_sent'],
+            'frames_merged': broadcast['frames_merged'],
+            'resyncs': broadcast['resyncs'],
+            'realtime_emits': BROADCASTER.realtime_emits
+        }
+        return report
+
+    def maybe_flush(self, force=False):
+        """Publish this process's report if the flush interval has passed"""
+        now = time.monotonic()
+        if not force and now - self._flushed < RULE_METRICS_FLUSH_INTERVAL:
+            return
+        self._flushed = now
+        try:
+            STORE.save_pipeline_metrics(self.process, self.report())
+        except sqlite3.Error as exc:
+            logger.error("Could not publish pipeline metrics: %s", exc)
+
+    def reports(self):
+        """Reports of every process that published recently, this one's refreshed first"""
+        self.maybe_flush(force=True)
+        return STORE.pipeline_metrics(time.time() - RULE_METRICS_STALE_AFTER)
+
+
+PIPELINE_METRICS = PipelineMetrics()
+
+
+class RuleEngine:
+    """Immutable, precompiled snapshot of the detection rules.
+
+    Every pattern is compiled once when the engine is built. Patterns are
+    case-folded so a line is lower-cased once and then matched case-sensitively,
+    which lets the regex engine use its literal fast paths instead of
+    re.IGNORECASE. str.lower() only agrees with re.IGNORECASE on ASCII ('İ'
+    lowers to two characters), so non-ASCII lines skip the prefilter and run
+    the re.IGNORECASE patterns. The engine is never mutated; rule changes build
+    a new one.
+
+    In front of the regexes sits a literal prefilter: the substrings every match
+    of a rule must contain are indexed in a LiteralIndex, and a rule's regex only
+    runs when one of its literals occurs in the lower-cased line.
+
+    Rules may also (or only) constrain the fields of the line's LogEvent
+    ("fields": {"status": [500, 503], "src_ip": "10.0.0.0/8"}). A rule with
+    both a pattern and fields must satisfy both. Rules without a pattern
+    never run a regex: those with an exact-valued field are looked up in a
+    field index by the event's value, the rest check every event.
+
+    Regex time is charged per rule to a RuleProfiler. Lines longer than
+    SIEM_RULE_MAX_LINE_LENGTH are matched on their prefix only, and with
+    SIEM_RULE_TIMEOUT_MS (and the regex package) a rule search that runs
+    longer than that counts as no match.
+    """
+
+    def __init__(self, rules, prefilter=None, profiler=None):
+        self.rules = tuple(rules)
+        self.version = hashlib.sha256(
+            json.dumps(self.rules, sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+        self._compiled = []
+        self._batch_regexes = []
+        self._group_keys = {}
+        self._group_entities = {}
+        self._counters = []
+        self._guarded = []
+        self._unfolded = []
+        self._field_checks = {}
+        self._field_rules = []
+        self._field_index = {}
+        self._field_scan = []
+        self._positions = {}
+        self._profiler = profiler if profiler is not None else RULE_PROFILER
+        counters = self._profiler.track(self.rules)
+        literal_map = defaultdict(set)
+        unfiltered = set()
+        for position, rule in enumerate(self.rules):
+            field_check = indexed = compiled = None
+            if rule.get('fields'):
+                try:
+                    field_check, indexed = _compile_fields(rule)
+                except ValueError as exc:
+                    logger.error(f"Error compiling fields of rule {rule.get('id')}: {exc}")
+                    continue
+            if field_check is None or rule.get('pattern'):
+                compiled = self._compile_rule(rule)
+                if compiled is None:
+                    continue
+            self._positions[id(rule)] = position
+            if rule.get('group_by') not in (None, ''):
+                regex, folded = compiled[1:] if compiled else (None, False)
+                extractor = _group_key_extractor(rule, regex, folded)
+                if extractor is not None:
+                    self._group_keys[rule['id']] = extractor
+                    self._group_entities[rule['id']] = getattr(extractor, 'entity', None)
+            if compiled is None:
+                slot = len(self._field_rules)
+                self._field_rules.append((rule, field_check, counters[rule['id']]))
+                if indexed is None:
+                    self._field_scan.append(slot)
+                else:
+                    field, keys = indexed
+                    by_key = self._field_index.setdefault(EVENT_FIELDS.index(field), {})
+                    for key in keys:
+                        by_key.setdefault(key, []).append(slot)
+                continue
+            index = len(self._compiled)
+            self._compiled.append(compiled)
+            _, regex, folded = compiled
+            self._batch_regexes.append(_batch_regex(regex))
+            self._counters.append(counters[rule['id']])
+            self._guarded.append(_guarded_regex(regex))
+            self._unfolded.append(self._unfolded_regexes(rule, regex, folded))
+            if field_check is not None:
+                self._field_checks[index] = field_check
+            literals = _required_literals(regex.pattern, 0 if folded else re.IGNORECASE)
+            if literals is None:
+                unfiltered.add(index)
+                continue
+            for literal in literals:
+                literal_map[literal].add(index)
+
+        if prefilter is None:
+            prefilter = PREFILTER_ENABLED
+        self._unfiltered = frozenset(unfiltered)
+        self._index = LiteralIndex(literal_map) if prefilter and literal_map else None
+        self.prefilter_stats = {
+            'lines_scanned': 0,
+            'lines_without_candidates': 0,
+            'regex_evaluations': 0,
+            'regex_evaluations_skipped': 0,
+            'regex_matches': 0
+        }
+        # Engines are shared by request handlers and the analyzer; each call
+        # counts locally and merges its counts once under this lock
+        self._stats_lock = threading.Lock()
+
+    def _count(self, lines, without_candidates, evaluations, skipped, matches):
+        with self._stats_lock:
+            stats = self.prefilter_stats
+            stats['lines_scanned'] += lines
+            stats['lines_without_candidates'] += without_candidates
+            stats['regex_evaluations'] += evaluations
+            stats['regex_evaluations_skipped'] += skipped
+            stats['regex_matches'] += matches
+
+    def _compile_rule(self, rule):
+        pattern = rule.get('pattern', '')
+        folded = _casefold_pattern(pattern)
+        if folded is not None:
+            try:
+                return rule, re.compile(folded), True
+            except re.error:
+                pass
+        try:
+            return rule, re.compile(pattern, re.IGNORECASE), False
+        except re.error as exc:
+            logger.error(f"Error compiling rule {rule.get('id')}: {exc}")
+            return None
+
+    def _unfolded_regexes(self, rule, regex, folded):
+        """(regex, guarded twin) matching the rule on lines that are not lower-cased"""
+        if folded:
+            try:
+                regex = re.compile(rule.get('pattern', ''), re.IGNORECASE)
+            except re.error:
+                pass
+        return regex, _guarded_regex(regex)
+
+    def group_key(self, rule, log_line, event=None):
+        """The entity a threshold rule counts this line under ('' when not grouped)."""
+        extractor = self._group_keys.get(rule['id'])
+        if extractor is None:
+            return ''
+        return _entity_key(extractor, log_line, event) or ''
+
+    @property
+    def uses_fields(self):
+        """Whether any rule looks at parsed fields"""
+        return bool(self._field_rules or self._field_checks)
+
+    def may_match(self, log_line):
+        """Whether any rule could match the line, judged by the literal prefilter alone."""
+        if self._index is None or self._unfiltered or self._field_rules or not log_line.isascii():
+            return True
+        return bool(self._index.search(log_line.lower()))
+
+    def group_entity(self, rule):
+        """The built-in extractor a rule groups by (see _GROUP_BY_EXTRACTORS), or None"""
+        return self._group_entities.get(rule['id'])
+
+    def _candidates(self, folded_line):
+        """Indexes of the rules the prefilter lets through for a lower-cased line, in order"""
+        if self._index is None:
+            return range(len(self._compiled))
+        candidates = self._index.search(folded_line)
+        if self._unfiltered:
+            candidates |= self._unfiltered
+        return sorted(candidates)
+
+    def _search_guarded(self, index, text, log_line, guarded=None):
+        try:
+            return (guarded or self._guarded[index]).search(text, timeout=RULE_TIMEOUT_MS / 1000.0)
+        except TimeoutError:
+            self._profiler.timed_out(self._counters[index], log_line)
+            return None
+
+    def _match_fields(self, event):
+        """Rules without a pattern whose fields match the event"""
+        slots = self._field_scan
+        for position, by_key in self._field_index.items():
+            value = event[position]
+            if value is not None:
+                slots = slots + by_key.get(_field_key(value), [])
+        perf_counter = time.perf_counter
+        matched = []
+        charges = []
+        for slot in slots:
+            rule, check, counters = self._field_rules[slot]
+            start = perf_counter()
+            hit = check(event)
+            charges.append((counters, 1, 1 if hit else 0, perf_counter() - start))
+            if hit:
+                matched.append(rule)
+        self._profiler.charge(charges)
+        return matched
+
+    def match(self, log_line, event=None):
+        """Return every rule whose pattern and fields match the line, in rule order.
+
+        event is the line's LogEvent; it is parsed here if a rule needs it.
+        """
+        if event is None and self.uses_fields:
+            event = parse_log_line(log_line)
+        matched = self._match_patterns(log_line, event)
+        if self._field_rules:
+            fielded = self._match_fields(event)
+            if fielded:
+                matched.extend(fielded)
+                matched.sort(key=lambda rule: self._positions[id(rule)])
+        return matched
+
+    def _match_patterns(self, log_line, event):
+        truncated = 0
+        if RULE_MAX_LINE_LENGTH and len(log_line) > RULE_MAX_LINE_LENGTH:
+            log_line = log_line[:RULE_MAX_LINE_LENGTH]
+            truncated = 1
+        folded_line = log_line.lower()
+        compiled = self._compiled
+        sampled = self._profiler.sampled(1)
+        ascii_line = log_line.isascii()
+
+        candidates = self._candidates(folded_line) if ascii_line else range(len(compiled))
+        if not candidates:
+            self._count(1, 1, 0, len(compiled), 0)
+            if truncated:
+                self._profiler.charge((), truncated)
+            return []
+
+        perf_counter = time.perf_counter
+        matched = []
+        charges = []
+        for index in candidates:
+            rule, regex, folded = compiled[index]
+            guarded = self._guarded[index]
+            if ascii_line:
+                text = folded_line if folded else log_line
+            else:
+                text = log_line
+                regex, guarded = self._unfolded[index]
+            counters = self._counters[index]
+            start = perf_counter()
+            if guarded is not None:
+                hit = self._search_guarded(index, text, log_line, guarded)
+            else:
+                hit = regex.search(text)
+            elapsed = perf_counter() - start
+            if sampled:
+                self._profiler.sample(counters, elapsed, log_line)
+            hit = hit and (index not in self._field_checks or self._field_checks[index](event))
+            charges.append((counters, 1, 1 if hit else 0, elapsed))
+            if hit:
+                matched.append(rule)
+        self._profiler.charge(charges, truncated)
+        self._count(1, 0, len(candidates), len(compiled) - len(candidates), len(matched))
+        return matched
+
+    def match_batch(self, log_lines, events=None):
+        """Match every rule against a whole batch of stripped lines at once.
+
+        The prefilter runs over each lower-cased line to collect, per rule, the
+        candidate lines. Each rule's candidates are then joined with newlines and
+        scanned by one MULTILINE search loop (skipping to the next line after a
+        hit) instead of one regex call per line. Rules without a pattern take
+        their candidates from the field index. events are the lines' LogEvents
+        (parsed here if a rule needs them). Returns (rule, line_indexes) pairs
+        in rule order.
+        """
+        if self.uses_fields:
+            events = _complete_events(log_lines, events)
+        if any('\n' in line or not line.isascii() for line in log_lines):
+            return self._match_batch_mixed(log_lines, events)
+
+        truncated = 0
+        if RULE_MAX_LINE_LENGTH and any(len(line) > RULE_MAX_LINE_LENGTH for line in log_lines):
+            truncated = sum(len(line) > RULE_MAX_LINE_LENGTH for line in log_lines)
+            log_lines = [line[:RULE_MAX_LINE_LENGTH] for line in log_lines]
+        compiled = self._compiled
+        folded_lines = [line.lower() for line in log_lines]
+
+        all_lines = range(len(log_lines))
+        without_candidates = evaluations = regex_matches = 0
+        if self._index is None:
+            candidates = [all_lines] * len(compiled)
+        else:
+            candidates = [[] for _ in compiled]
+            search = self._index.search
+            for line_index, line in enumerate(folded_lines):
+                found = search(line)
+                if not found:
+                    without_candidates += 1
+                for rule_index in found:
+                    candidates[rule_index].append(line_index)
+            for rule_index in self._unfiltered:
+                candidates[rule_index] = all_lines
+            if self._unfiltered:
+                without_candidates = 0
+
+        perf_counter = time.perf_counter
+        results = []
+        charges = []
+        for rule_index, (rule, regex, folded) in enumerate(compiled):
+            line_indexes = candidates[rule_index]
+            evaluations += len(line_indexes)
+            if not line_indexes:
+                continue
+            lines = folded_lines if folded else log_lines
+            batch_regex = self._batch_regexes[rule_index]
+            start = perf_counter()
+            if self._guarded[rule_index] is not None:
+                hits = [i for i in line_indexes if self._search_guarded(rule_index, lines[i], log_lines[i])]
+            elif batch_regex is None or len(line_indexes) == 1:
+                hits = [i for i in line_indexes if regex.search(lines[i])]
+            elif line_indexes is all_lines:
+                hits = _scan_lines(batch_regex, '\n'.join(lines), _line_starts(lines))
+            else:
+                selected = [lines[i] for i in line_indexes]
+                hits = [line_indexes[i] for i in _scan_lines(
+                    batch_regex, '\n'.join(selected), _line_starts(selected)
+                )]
+            elapsed = perf_counter() - start
+            if hits:
+                regex_matches += len(hits)
+                field_check = self._field_checks.get(rule_index)
+                if field_check is not None:
+                    hits = [i for i in hits if field_check(events[i])]
+            charges.append((self._counters[rule_index], len(line_indexes), len(hits), elapsed))
+            if hits:
+                results.append((rule, hits))
+        self._profiler.charge(charges, truncated)
+        skipped = len(log_lines) * len(compiled) - evaluations
+        self._count(len(log_lines), without_candidates, evaluations, skipped, regex_matches)
+
+        for line_index in self._profiler.sampled(len(log_lines)):
+            self._profile_line(log_lines[line_index], folded_lines[line_index])
+        if self._field_rules:
+            results.extend(self._match_fields_batch(events))
+            results.sort(key=lambda result: self._positions[id(result[0])])
+        return results
+
+    def _match_fields_batch(self, events):
+        """(rule, line_indexes) for the rules without a pattern"""
+        candidates = [[] for _ in self._field_rules]
+        for slot in self._field_scan:
+            candidates[slot] = range(len(events))
+        for position, by_key in self._field_index.items():
+            for line_index, event in enumerate(events):
+                value = event[position]
+                if value is not None:
+                    for slot in by_key.get(_field_key(value), ()):
+                        candidates[slot].append(line_index)
+
+        perf_counter = time.perf_counter
+        results = []
+        charges = []
+        for (rule, check, counters), line_indexes in zip(self._field_rules, candidates):
+            if not line_indexes:
+                continue
+            start = perf_counter()
+            hits = [i for i in line_indexes if check(events[i])]
+            charges.append((counters, len(line_indexes), len(hits), perf_counter() - start))
+            if hits:
+                results.append((rule, hits))
+        self._profiler.charge(charges)
+        return results
+
+    def _profile_line(self, log_line, folded_line):
+        """Time each candidate rule on one line by itself, for the profiler's samples"""
+        perf_counter = time.perf_counter
+        for index in self._candidates(folded_line):
+            _, regex, folded = self._compiled[index]
+            text = folded_line if folded else log_line
+            guarded = self._guarded[index]
+            start = perf_counter()
+            try:
+                if guarded is not None:
+                    guarded.search(text, timeout=RULE_TIMEOUT_MS / 1000.0)
+                else:
+                    regex.search(text)
+            except TimeoutError:
+                pass
+            self._profiler.sample(self._counters[index], perf_counter() - start, log_line)
+
+    def _match_batch_mixed(self, log_lines, events):
+        """match_batch for batches holding multi-line or non-ASCII lines: those
+        are matched one by one, the rest still as a batch."""
+        hits = defaultdict(list)
+        matched = {}
+        batched = []
+        for line_index, line in enumerate(log_lines):
+            if '\n' not in line and line.isascii():
+                batched.append(line_index)
+                continue
+            for rule in self.match(line, events[line_index] if events is not None else None):
+                hits[id(rule)].append(line_index)
+                matched[id(rule)] = rule
+        if batched:
+            results = self.match_batch(
+                [log_lines[i] for i in batched], [events[i] for i in batched] if events is not None else None
+            )
+            for rule, line_indexes in results:
+                hits[id(rule)].extend(batched[i] for i in line_indexes)
+                matched[id(rule)] = rule
+        return [(rule, sorted(hits[id(rule)])) for rule in self.rules if id(rule) in matched]
+
+    def describe_prefilter(self):
+        """Prefilter configuration and hit/miss counters for the health endpoints."""
+        with self._stats_lock:
+            stats = dict(self.prefilter_stats)
+        total = stats['regex_evaluations'] + stats['regex_evaluations_skipped']
+        stats.update({
+            'enabled': self._index is not None,
+            'rules_version': self.version,
+            'rules_compiled': len(self._compiled),
+            'rules_without_literals': len(self._unfiltered),
+            'field_rules': len(self._field_rules),
+            'field_rules_indexed': len(self._field_rules) - len(self._field_scan),
+            'skip_ratio': round(stats['regex_evaluations_skipped'] / total, 4) if total else 0.0
+        })
+        return stats
+
+
+def _line_starts(lines):
+    starts = []
+    offset = 0
+    for line in lines:
+        starts.append(offset)
+        offset += len(line) + 1
+    return starts
+
+
+def _scan_lines(regex, text, starts):
+    """Indexes of the lines (joined in text, starting at starts) the regex matches."""
+    hits = []
+    pos = 0
+    end = len(text)
+    while pos <= end:
+        match = regex.search(text, pos)
+        if match is None:
+            break
+        line_index = bisect.bisect_right(starts, match.start()) - 1
+        hits.append(line_index)
+        if line_index + 1 >= len(starts):
+            break
+        pos = starts[line_index + 1]
+    return hits
+
+
+RULE_ENGINE = RuleEngine(RULES)
+
+
+class ThresholdTracker:
+    """Sliding-window counters for threshold rules, one per (rule id, group key).
+
+    A window is a ring buffer (deque with maxlen=threshold) holding only
+    timestamps: the threshold is reached when the buffer is full and its
+    oldest entry is still inside the time window. Keys are kept in LRU order
+    and the least recently hit ones are evicted beyond max_keys, so memory
+    stays bounded however many distinct entities show up.
+    """
+
+    def __init__(self, max_keys=None):
+        if max_keys is None:
+            max_keys = int(os.environ.get('SIEM_THRESHOLD_MAX_KEYS', '10000'))
+        self.max_keys = max(max_keys, 1)
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def hit(self, rule, key, now, count=1):
+        """Record count events for (rule, key) at time now.
+
+        Returns how many of them (the last ones) saw the threshold reached.
+        """
+        threshold = max(int(rule['threshold']), 1)
+        window_start = now - rule['time_window']
+        slot = (rule['id'], key)
+        with self._lock:
+            window = self._windows.get(slot)
+            if window is None or window.maxlen != threshold:
+                window = deque(maxlen=threshold)
+                self._windows[slot] = window
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._windows.move_to_end(slot)
+            while window and window[0] < window_start:
+                window.popleft()
+            # The j-th new event saw a window of len(window) + j + 1 events
+            alerting = max(count - max(threshold - len(window) - 1, 0), 0)
+            window.extend([now] * min(count, threshold))
+            return alerting
+
+    def describe(self):
+        with self._lock:
+            return {'keys': len(self._windows), 'max_keys': self.max_keys, 'evictions': self.evictions}
+
+
+THRESHOLDS = ThresholdTracker()
+
+
+class StoreThresholdTracker:
+    """ThresholdTracker counterpart kept in the store, for windows no single process sees whole."""
+
+    def hit(self, rule, key, now, count=1):
+        threshold = max(int(rule['threshold']), 1)
+        return STORE.threshold_hit(rule['id'], key, threshold, now - rule['time_window'], now, count)
+
+
+SHARED_THRESHOLDS = StoreThresholdTracker()
+
+ANALYSIS_WORKERS = int(os.environ.get('SIEM_ANALYSIS_WORKERS', '0'))
+ANALYSIS_SHARD_KEY = os.environ.get('SIEM_ANALYSIS_SHARD_KEY', 'src_ip')
+ANALYSIS_TIMEOUT = float(os.environ.get('SIEM_ANALYSIS_TIMEOUT', '60'))
+ANALYSIS_POLL_INTERVAL = 0.02
+ANALYSIS_DEQUEUE_BATCHES = 16
+# Attempts at a batch before it is dead-lettered, and the pause after each failure
+ANALYSIS_MAX_ATTEMPTS = max(int(os.environ.get('SIEM_ANALYSIS_MAX_ATTEMPTS', '3')), 1)
+ANALYSIS_RETRY_DELAY = 0.5
+
+
+class AnalysisPool:
+    """Moves analysis out of the web workers into SIEM_ANALYSIS_WORKERS processes.
+
+    Web workers only split submitted lines by shard, hashing an entity key
+    (SIEM_ANALYSIS_SHARD_KEY, a built-in group_by extractor such as src_ip)
+    or the source for lines without one, and queue one batch per shard in
+    the store. Each analysis process owns one shard, so every line of an
+    entity meets the same in-memory threshold windows; it stores the lines
+    and alerts and posts the alerts back in the same transaction that takes
+    the batch off the queue. The submitting worker waits for the alerts and
+    publishes them to its dashboards as before.
+
+    Threshold rules not grouped by the shard key, and lines without that
+    entity, count in StoreThresholdTracker windows instead, which are correct
+    across shards at the cost of a database round trip per matching batch.
+    With no analysis workers configured everything runs inline as before.
+
+    A batch whose analysis raises stays queued and is retried; after
+    SIEM_ANALYSIS_MAX_ATTEMPTS failures its raw lines move to the
+    ingest_dead_letters table and the submitter gets the error.
+    """
+
+    def __init__(self, shards=ANALYSIS_WORKERS, shard_key=ANALYSIS_SHARD_KEY):
+        self.shards = max(shards, 0)
+        self.shard_key = shard_key
+        self._entity = _GROUP_BY_EXTRACTORS.get(shard_key)
+        self._extract = None
+        if self._entity is not None:
+            self._extract = _group_key_extractor({'id': 'shard', 'pattern': '', 'group_by': shard_key})
+        elif self.shards:
+            logger.warning("Unknown SIEM_ANALYSIS_SHARD_KEY %r; sharding by source", shard_key)
+        # Set in analysis processes to the shard they own
+        self.worker_shard = None
+
+    @property
+    def enabled(self):
+        """Whether this process hands its analysis to the workers"""
+        return self.shards > 0 and self.worker_shard is None
+
+    def shard_of(self, log_line, source):
+        key = None
+        if self._extract:
+            # Threshold rules key on the parsed field only when the analyzer parses (see _parse_events)
+            event = parse_log_line(log_line) if RULE_ENGINE.uses_fields else None
+            key = _entity_key(self._extract, log_line, event)
+        key = key or f"source:{source}"
+        return zlib.crc32(key.encode('utf-8', errors='ignore')) % self.shards
+
+    def thresholds_for(self, rule, key):
+        """The tracker that sees every event of (rule, key) in this process"""
+        if self.worker_shard is None or (key and self._entity is not None
+                                         and RULE_ENGINE.group_entity(rule) is self._entity):
+            return THRESHOLDS
+        return SHARED_THRESHOLDS
+
+    def submit(self, entries, tip_rows=None, checkpoint=None):
+        """Queue (log_line, source) entries and wait for their alerts.
+
+        Returns (log_lines, sources, alerts) for the non-empty lines. If the
+        workers do not finish within SIEM_ANALYSIS_TIMEOUT seconds the alerts
+        collected so far are returned; the rest stay queued. Raises
+        RuntimeError if a batch was dead-lettered.
+        """
+        log_lines = []
+        sources = []
+        batches = defaultdict(lambda: {'entries': [], 'tip_rows': [] if tip_rows is not None else None})
+        for position, (log_line, source) in enumerate(entries):
+            log_line = log_line.strip() if isinstance(log_line, str) else ''
+            if not log_line:
+                continue
+            log_lines.append(log_line)
+            sources.append(source)
+            batch = batches[self.shard_of(log_line, source)]
+            batch['entries'].append((log_line, source))
+            if tip_rows is not None:
+                batch['tip_rows'].append(tip_rows[position])
+
+        ticket = uuid.uuid4().hex
+        STORE.enqueue(ticket, [(shard, json.dumps(batch)) for shard, batch in batches.items()], checkpoint)
+        if not batches:
+            return log_lines, sources, []
+
+        deadline = time.monotonic() + ANALYSIS_TIMEOUT
+        delay = 0.002
+        while True:
+            results = STORE.take_results(ticket, len(batches))
+            if results is not None:
+                break
+            if time.monotonic() > deadline:
+                logger.warning("Analysis workers did not finish batch %s in %ss", ticket, ANALYSIS_TIMEOUT)
+                results = STORE.take_results(ticket, 0)
+                break
+            socketio.sleep(delay)
+            delay = min(delay * 2, ANALYSIS_POLL_INTERVAL)
+        errors = [error for _, error in results if error is not None]
+        if errors:
+            raise RuntimeError(f"Analysis failed for {len(errors)} of {len(batches)} batches: {errors[0]}")
+        return log_lines, sources, [alert for alerts, _ in results for alert in alerts]
+
+    def run_worker(self, shard):
+        """Analyze the batches queued for one shard, forever"""
+        self.worker_shard = shard
+        analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
+        next_expiry = 0
+        logger.info("Analysis worker %d/%d started (shard key %s)", shard, self.shards, self.shard_key)
+        while True:
+            RULE_SET.refresh()
+            if time.time() > next_expiry:
+                longest_window = max((rule.get('time_window', 0) for rule in RULES), default=0)
+                STORE.expire_analysis_state(time.time() - 3600, time.time() - longest_window)
+                next_expiry = time.time() + 60
+
+            items = STORE.dequeue(shard, ANALYSIS_DEQUEUE_BATCHES)
+            if not items:
+                time.sleep(ANALYSIS_POLL_INTERVAL)
+                continue
+            for seq, ticket, payload in items:
+                try:
+                    batch = json.loads(payload)
+                    analyzer.analyze_batch(
+                        [tuple(entry) for entry in batch['entries']], batch['tip_rows'], queue_item=(seq, ticket)
+                    )
+                except Exception as exc:
+                    attempts = STORE.fail_queued(seq, ticket, str(exc) or type(exc).__name__, ANALYSIS_MAX_ATTEMPTS)
+                    if attempts >= ANALYSIS_MAX_ATTEMPTS:
+                        logger.error("Analysis worker %d dead-lettered batch %s after %d attempts: %s",
+                                     shard, seq, attempts, exc)
+                    else:
+                        logger.warning("Analysis worker %d failed batch %s (attempt %d of %d): %s",
+                                       shard, seq, attempts, ANALYSIS_MAX_ATTEMPTS, exc)
+                        # Keep the shard in order: later batches wait for the retry
+                        time.sleep(ANALYSIS_RETRY_DELAY * attempts)
+                        break
+
+    def describe(self):
+        return {
+            'workers': self.shards,
+            'shard_key': self.shard_key,
+            'queue': STORE.queue_depth() if self.shards else {},
+            'dead_letters': STORE.dead_letter_count() if self.shards else 0
+        }
+
+
+ANALYSIS_POOL = AnalysisPool()
+
+
+INGEST_QUEUE_SIZE = int(os.environ.get('SIEM_INGEST_QUEUE_SIZE', '0'))
+INGEST_SHED_POLICY = os.environ.get('SIEM_INGEST_SHED_POLICY', 'reject').lower()
+INGEST_SHED_AT = float(os.environ.get('SIEM_INGEST_SHED_AT', '0.8'))
+INGEST_SHED_POLICIES = ('reject', 'unmatched', 'oldest')
+
+
+class _IngestItem:
+    def __init__(self, entries, wait):
+        self.entries = entries
+        self.wait = wait
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.alerts = []
+        self.logs_processed = 0
+        self.error = None
+
+
+class IngestQueue:
+    """Bounded queue between the ingest endpoints and the analyzer.
+
+    Capacity counts log lines. Requests are queued and answered at once
+    (202) unless they ask to wait for their alerts; consumers drain the
+    queue in the background, merging queued requests that nobody waits on
+    into chunks of up to SIEM_ANALYSIS_CHUNK_SIZE lines. When a request does
+    not fit the request is refused (429 with Retry-After estimated from the
+    drain rate) after applying the shedding policy:
+
+    - reject: shed nothing.
+    - unmatched: once the queue is more than SIEM_INGEST_SHED_AT full, drop
+      lines no rule's literal prefilter matches (the TIP model never sees
+      them).
+    - oldest: drop the oldest queued requests nobody waits on.
+
+    Lines whose analysis raised are counted under dropped['failed'] and the
+    error is handed to requests that wait (500).
+    """
+
+    def __init__(self, capacity=INGEST_QUEUE_SIZE, policy=INGEST_SHED_POLICY, shed_at=INGEST_SHED_AT):
+        if policy not in INGEST_SHED_POLICIES:
+            logger.warning("Unknown SIEM_INGEST_SHED_POLICY %r; using reject", policy)
+            policy = 'reject'
+        self.capacity = max(capacity, 0)
+        self.policy = policy
+        self.shed_at = shed_at
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._started = False
+        self.depth = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.rejected_requests = 0
+        self.dropped = {'rejected': 0, 'shed_unmatched': 0, 'shed_oldest': 0, 'failed': 0}
+        self.last_lag = 0.0
+        self.drain_rate = 0.0
+        # Decayed sums behind drain_rate, so big batches weigh more than small ones
+        self._drained_lines = 0.0
+        self._drain_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def offer(self, entries, wait=False):
+        """Queue (log_line, source) entries.
+
+        Returns (item, shed, retry_after): item is None when the request was
+        refused, shed counts lines dropped by the shedding policy.
+        """
+        entries = [(line, source) for line, source in entries if isinstance(line, str) and line.strip()]
+        with self._cond:
+            shed = 0
+            if self.policy == 'unmatched' and self.depth + len(entries) > self.capacity * self.shed_at:
+                kept = [entry for entry in entries if RULE_ENGINE.may_match(entry[0])]
+                shed = len(entries) - len(kept)
+                self.dropped['shed_unmatched'] += shed
+                entries = kept
+            if self.policy == 'oldest':
+                while self.depth + len(entries) > self.capacity:
+                    victim = next((queued for queued in self._items if not queued.wait), None)
+                    if victim is None:
+                        break
+                    self._items.remove(victim)
+                    self.depth -= len(victim.entries)
+                    self.dropped['shed_oldest'] += len(victim.entries)
+                    victim.done.set()
+            if self.depth + len(entries) > self.capacity:
+                self.rejected_requests += 1
+                self.dropped['rejected'] += len(entries)
+                return None, shed, self.retry_after()
+
+            item = _IngestItem(entries, wait)
+            if entries:
+                self._items.append(item)
+                self.depth += len(entries)
+                self.enqueued += len(entries)
+                self._cond.notify()
+            else:
+                item.done.set()
+        self._ensure_started()
+        return item, shed, 0
+
+    def retry_after(self):
+        """Seconds until the queued lines should be drained, at least 1"""
+        if self.drain_rate <= 0:
+            return 1
+        return max(int(math.ceil(self.depth / self.drain_rate)), 1)
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        # One consumer is enough when analysis runs inline (it is CPU bound);
+        # with the analysis pool each consumer mostly waits on a shard
+        for _ in range(max(ANALYSIS_POOL.shards, 1)):
+            socketio.start_background_task(self._consume)
+
+    def _take(self):
+        """The next request, merged with following ones when nobody waits on them"""
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            batch = [self._items.popleft()]
+            lines = len(batch[0].entries)
+            while (not batch[0].wait and self._items and not self._items[0].wait
+                   and lines + len(self._items[0].entries) <= ANALYSIS_CHUNK_SIZE):
+                batch.append(self._items.popleft())
+                lines += len(batch[-1].entries)
+            return batch, lines
+
+    def _consume(self):
+        while True:
+            batch, lines = self._take()
+            started = time.monotonic()
+            analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
+            error = None
+            try:
+                alerts = analyzer.analyze_batch([entry for item in batch for entry in item.entries])
+            except Exception as exc:
+                logger.error("Ingest queue analysis error, dropped %d lines: %s", lines, exc)
+                alerts = []
+                error = str(exc) or type(exc).__name__
+            finished = time.monotonic()
+            with self._cond:
+                self.depth -= lines
+                if error is None:
+                    self.processed += lines
+                else:
+                    self.dropped['failed'] += lines
+                self.last_lag = started - batch[0].enqueued
+                self._drained_lines = 0.8 * self._drained_lines + lines
+                self._drain_seconds = 0.8 * self._drain_seconds + max(finished - started, 1e-6)
+                self.drain_rate = self._drained_lines / self._drain_seconds
+            for item in batch:
+                item.error = error
+                if item.wait:
+                    item.alerts = alerts
+                    item.logs_processed = analyzer.logs_processed
+                item.done.set()
+            # Let the HTTP side run between chunks
+            socketio.sleep(0)
+
+    def describe(self):
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'capacity': self.capacity,
+                'policy': self.policy,
+                'depth': self.depth,
+                'requests_queued': len(self._items),
+                'lag_seconds': round(time.monotonic() - self._items[0].enqueued, 3) if self._items else 0.0,
+                'last_lag_seconds': round(self.last_lag, 3),
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'rejected_requests': self.rejected_requests,
+                'dropped': dict(self.dropped),
+                'drain_rate': round(self.drain_rate, 1)
+            }
+
+
+INGEST_QUEUE = IngestQueue()
+
+
+def _run_analysis_worker(shard):
+    ANALYSIS_POOL.run_worker(shard)
+
+
+def run_analysis_workers(count=ANALYSIS_WORKERS):
+    """Run one analysis process per shard and restart any that exit"""
+    context = multiprocessing.get_context('spawn')
+    processes = {}
+    while True:
+        for shard in range(count):
+            process = processes.get(shard)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logger.warning("Analysis worker %d exited with %s; restarting", shard, process.exitcode)
+            process = context.Process(
+                target=_run_analysis_worker, args=(shard,), name=f"siem-analysis-{shard}", daemon=True
+            )
+            process.start()
+            processes[shard] = process
+        time.sleep(1)
+
+
+def _set_rules(rules, engine=None):
+    """Swap in a new rule set and its compiled engine."""
+    global RULES, RULE_ENGINE
+    if engine is None:
+        engine = RuleEngine(rules)
+    RULES = rules
+    RULE_ENGINE = engine
+    logger.info("Rule engine rebuilt: %d rules (version %s)", len(engine.rules), engine.version)
+
+
+def _save_rules_file(rules):
+    path = BASE_DIR / 'rules.json'
+    partial = path.with_name(f".{path.name}.{os.getpid()}.part")
+    try:
+        with open(partial, 'w') as f:
+            json.dump({'rules': rules}, f, indent=4)
+        os.replace(partial, path)
+    except Exception as e:
+        partial.unlink(missing_ok=True)
+        logger.error(f"Failed to save rules: {e}")
+
+
+RULES_POLL_INTERVAL = float(os.environ.get('SIEM_RULES_POLL_INTERVAL', '2'))
+
+
+class RuleSetWatcher:
+    """Keeps this process on the newest published rule set.
+
+    Every rule change is stored as the next numbered version (see
+    SIEMStore.update_rules), whichever process made it, and a hand edit of
+    rules.json is published the same way once its mtime moves. refresh()
+    sits on the ingest path and looks at the store at most every
+    RULES_POLL_INTERVAL seconds; a newer version is compiled on a
+    background thread while analysis carries on with the current engine,
+    then swapped in with one assignment.
+    """
+
+    def __init__(self, path=BASE_DIR / 'rules.json', poll_interval=RULES_POLL_INTERVAL):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._file_mtime = None
+        self._next_check = 0.0
+        self._building = None
+        self._lock = threading.Lock()
+
+    def refresh(self, wait=False):
+        """Pick up a newer rule set, if any; wait=True installs it before returning"""
+        now = time.monotonic()
+        if not wait and now < self._next_check:
+            return
+        self._next_check = now + self.poll_interval
+        try:
+            self._publish_file_edits()
+            latest = STORE.rules_version()
+        except sqlite3.Error as exc:
+            logger.error("Rule set check failed: %s", exc)
+            return
+        with self._lock:
+            if latest <= self.version or (self._building is not None and not wait):
+                return
+            self._building = latest
+        if wait:
+            self._load()
+        else:
+            threading.Thread(target=self._load, name='rule-compiler', daemon=True).start()
+
+    def _load(self):
+        try:
+            version, rules, _ = STORE.rule_set()
+            self.install(version, rules)
+        except Exception as exc:
+            logger.error("Failed to load rule set: %s", exc)
+        finally:
+            with self._lock:
+                self._building = None
+
+    def install(self, version, rules):
+        """Compile rules outside any lock and swap them in, unless a newer version got there first"""
+        engine = RULE_ENGINE if RULE_ENGINE.rules == tuple(rules) else RuleEngine(rules)
+        with self._lock:
+            if version <= self.version:
+                return False
+            self.version = version
+            _set_rules(rules, engine)
+        return True
+
+    def _publish_file_edits(self):
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        starting = self._file_mtime is None
+        self._file_mtime = mtime
+        if starting and STORE.rule_set()[2] >= mtime:
+            # The file predates the stored rules; they were written through the API
+            return
+        try:
+            with open(self.path) as f:
+                rules = json.load(f)['rules']
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.error("Ignoring unreadable %s: %s", self.path, exc)
+            return
+        version, _, changed = STORE.update_rules(
+            lambda current: (rules, True) if rules != current else (None, False)
+        )
+        if changed:
+            logger.info("Published %s as rule set version %d", self.path.name, version)
+
+    def describe(self):
+        return {'version': self.version, 'rules': len(RULES), 'engine_version': RULE_ENGINE.version}
+
 
+RULE_SET = RuleSetWatcher()
+# Adopt the newest stored rule set; the first process to start publishes rules.json
+RULE_SET.refresh(wait=True)
 
-def _resolve_realtime_path(raw_path):
-    if not raw_path:
-        return None, 'Log file path is required.'
 
-    candidate = Path(raw_path).expanduser()
-    if not candidate.is_absolute():
-        candidate = (BASE_DIR / raw_path).resolve()
-        if not candidate.exists():
-            candidate = (UPLOAD_DIR / raw_path).resolve()
-        if not candidate.exists():
-            candidate = (LOG_DIR / raw_path).resolve()
-    else:
-        candidate = candidate.resolve()
+JSON_READ_SIZE = 64 * 1024
+_JSON_DECODER = json.JSONDecoder()
 
-    if not candidate.exists() or not candidate.is_file():
-        return None, f'Log file not found: {raw_path}'
 
-    if not any(_is_within_path(candidate, root) for root in REALTIME_ALLOWED_ROOTS):
-        return None, 'Log file is outside allowed directories.'
+def _iter_json_records(f):
+    """Incrementally decode a JSON array, a single JSON value or JSONL from a text file.
 
-    return candidate, None
+    Yields (text, value) per array element / top-level value, reading the file
+    JSON_READ_SIZE characters at a time. Array elements are re-serialized;
+    top-level values keep their source text unless it spans lines. Once the
+    input stops being valid JSON the remaining content is yielded line by line,
+    as (line, value) for lines holding a JSON object or array and (line, None)
+    otherwise, so one bad line costs no more than a line's worth of buffering.
+    """
+    buffer = ''
+    pos = 0
+    eof = False
+    in_array = None
+    decoded_any = False
 
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ',')):
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                return
+            chunk = f.read(JSON_READ_SIZE)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            continue
 
-def _current_stats():
-    return {
-        'total_logs_processed': len(log_entries),
-        'total_alerts': len(alerts),
-        'high_severity_alerts': len([a for a in alerts if a['severity'] == 'HIGH']),
-        'critical_alerts': len([a for a in alerts if a['severity'] == 'CRITICAL']),
-        'system_status': 'online'
-    }
+        if in_array is None:
+            in_array = buffer[pos] == '['
+            if in_array:
+                pos += 1
+                continue
+        elif in_array and buffer[pos] == ']':
+            return
 
+        try:
+            value, end = _JSON_DECODER.raw_decode(buffer, pos)
+        except json.JSONDecodeError as exc:
+            # Only an error on the buffer's last line can be a record cut off by
+            # the read; anything before a newline is malformed input
+            if eof or buffer.find('\n', exc.pos) != -1:
+                break
+            value, end = None, None
+        if end is None or (end == len(buffer) and not eof):
+            # The record may continue past the buffered text
+            if not eof:
+                chunk = f.read(JSON_READ_SIZE)
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                eof = not chunk
+                continue
+            if end is None:
+                break
 
-def _stop_realtime_monitor(client_id):
-    with realtime_lock:
-        monitor = realtime_monitors.pop(client_id, None)
-    if monitor:
-        monitor['stop_event'].set()
+        text = buffer[pos:end]
+        if in_array or '\n' in text:
+            text = json.dumps(value)
+        yield text, value
+        decoded_any = True
+        pos = end
 
+    # Not JSON from here on: fall back to plain lines
+    rest = buffer[pos:]
+    if in_array and not decoded_any:
+        rest = '[' + rest
+    lines = rest.split('\n')
+    partial = lines.pop()
+    for line in lines:
+        yield line, _json_line_value(line)
+    for line in f:
+        line = partial + line
+        yield line, _json_line_value(line)
+        partial = ''
+    if partial:
+        yield partial, _json_line_value(partial)
 
-def _tail_realtime_file(client_id, file_path, source, from_start, stop_event):
-    analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
-    try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            if not from_start:
-                f.seek(0, os.SEEK_END)
-
-            while not stop_event.is_set():
-                line = f.readline()
-                if not line:
-                    try:
-                        if os.path.getsize(file_path) < f.tell():
-                            f.seek(0, os.SEEK_END)
-                    except OSError:
-                        pass
-                    stop_event.wait(REALTIME_POLL_INTERVAL)
-                    continue
 
-                analyzer.analyze_log_line(line, source)
-                socketio.emit(
-                    'realtime_log',
-                    {'log': f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {source}: {line.strip()}"},
-                    to=client_id
-                )
-                socketio.emit('log_update', {'logs': log_entries[-50:], 'stats': _current_stats()})
-    except Exception as exc:
-        logger.error("Real-time monitor error: %s", exc)
-        socketio.emit('realtime_status', {'success': False, 'error': str(exc)}, to=client_id)
-
-
-def _start_realtime_monitor(client_id, file_path, source, from_start):
-    _stop_realtime_monitor(client_id)
-    stop_event = threading.Event()
-    thread = threading.Thread(
-        target=_tail_realtime_file,
-        args=(client_id, file_path, source, from_start, stop_event),
-        daemon=True
-    )
-    with realtime_lock:
-        realtime_monitors[client_id] = {
-            'stop_event': stop_event,
-            'thread': thread,
-            'file_path': str(file_path)
-        }
-    thread.start()
+def _json_line_value(line):
+    """The JSON object or array on a line, or None"""
+    stripped = line.strip()
+    if stripped[:1] not in ('{', '['):
+        return None
+    try:
+        return json.loads(stripped)
+    except ValueError:
+        return None
 
 
 class SIEMAnalyzer:
@@ -1146,70 +5199,222 @@ class SIEMAnalyzer:
         
     def analyze_log_line(self, log_line, source="unknown"):
         """Analyze a single log line for security threats"""
+        RULE_SET.refresh()
+        if ANALYSIS_POOL.enabled:
+            return self.analyze_batch([(log_line, source)])
+        engine = RULE_ENGINE
         log_line = log_line.strip()
         if not log_line:
             return None
             
         self.logs_processed += 1
-        log_entries.append(f"[{datetime.now()}] {source}: {log_line}")
+        now = datetime.now()
+        timestamp = now.isoformat()
         
         detected_alerts = []
-        tip_result = self._evaluate_tip(log_line)
+        event = self._parse_events([log_line], engine)[0]
+        tip_result = self._evaluate_tip(event)
         
-        for rule in RULES:
-            if self._check_rule(rule, log_line, source):
-                alert = self._create_alert(rule, log_line, source, tip_result)
+        for rule in engine.match(log_line, event):
+            if self._check_rule(rule, log_line, source, event, engine):
+                alert = self._create_alert(rule, log_line, source, tip_result, timestamp=timestamp, event=event)
                 detected_alerts.append(alert)
 
         if not detected_alerts and tip_result and tip_result.get('is_malicious'):
-            detected_alerts.append(self._create_tip_alert(log_line, source, tip_result))
+            detected_alerts.append(self._create_tip_alert(log_line, source, tip_result, timestamp=timestamp, event=event))
 
-        return detected_alerts
+        return self._record(now, [log_line], [source], detected_alerts)
     
-    def _check_rule(self, rule, log_line, source):
-        """Check if a log line matches a detection rule"""
+    def _check_rule(self, rule, log_line, source, event=None, engine=None):
+        """Check whether a rule that matched the line should raise an alert"""
         try:
-            # Check for pattern match
-            if re.search(rule['pattern'], log_line, re.IGNORECASE):
-                
-                # For threshold-based rules, check time window
-                if 'threshold' in rule and 'time_window' in rule:
-                    rule_id = rule['id']
-                    current_time = time.time()
-                    window_start = current_time - rule['time_window']
-                    event_store[rule_id].append((current_time, log_line))
-                    
-                    # Remove old events
-                    while (event_store[rule_id] and 
-                           event_store[rule_id][0][0] < window_start):
-                        event_store[rule_id].popleft()
-                    
-                    # Check threshold
-                    if len(event_store[rule_id]) >= rule['threshold']:
-                        return True
-                    if rule.get('alert_on_match'):
-                        return True
-                    return False
-                
-                return True
+            # Threshold rules count per (rule, group key) within the time window
+            if 'threshold' in rule and 'time_window' in rule and not rule.get('alert_on_match'):
+                key = (engine or RULE_ENGINE).group_key(rule, log_line, event)
+                return ANALYSIS_POOL.thresholds_for(rule, key).hit(rule, key, time.time()) > 0
+
+            return True
         except Exception as e:
             logger.error(f"Error checking rule {rule['id']}: {e}")
-        
+
         return False
 
-    def _evaluate_tip(self, log_line):
-        if not self.tip_model or not self.tip_model.available:
+    def _check_rule_batch(self, rule, line_indexes, log_lines, events, engine=None):
+        """Batch form of _check_rule: the line indexes (in order) that should raise an alert"""
+        if 'threshold' not in rule or 'time_window' not in rule or rule.get('alert_on_match'):
+            return line_indexes
+
+        engine = engine or RULE_ENGINE
+        by_key = defaultdict(list)
+        for line_index in line_indexes:
+            by_key[engine.group_key(rule, log_lines[line_index], events[line_index])].append(line_index)
+
+        current_time = time.time()
+        alerting = []
+        for key, indexes in by_key.items():
+            fired = ANALYSIS_POOL.thresholds_for(rule, key).hit(rule, key, current_time, count=len(indexes))
+            if fired:
+                alerting.extend(indexes[len(indexes) - fired:])
+        alerting.sort()
+        return alerting
+
+    def analyze_batch(self, entries, tip_rows=None, checkpoint=None, queue_item=None):
+        """Analyze an iterable of (log_line, source) pairs as one batch.
+
+        The batch is normalized once, every rule is matched against the whole
+        batch and threshold windows advance once per rule. Alerts are not
+        emitted one by one; the caller publishes a single aggregated update.
+
+        Lines are parsed once into LogEvents (see _parse_events), which the
+        field rules, threshold group keys, the TIP model and the alerts share.
+        tip_rows
+        optionally carries a precomputed TIP feature row (or None) per entry,
+        so structured inputs skip building it from the event.
+        checkpoint (a TailCheckpoint) and queue_item (an ingest queue batch
+        being analyzed by a worker) are committed with the batch. When the
+        analysis pool is enabled the batch is handed to it instead.
+
+        The whole batch runs against one rule engine, even if a rule set
+        reload swaps in a newer one meanwhile (see RuleSetWatcher).
+        """
+        RULE_SET.refresh()
+        if ANALYSIS_POOL.enabled:
+            return self._submit(entries, tip_rows, checkpoint)
+        engine = RULE_ENGINE
+        log_lines = []
+        sources = []
+        kept_rows = []
+        for position, (log_line, source) in enumerate(entries):
+            log_line = log_line.strip() if isinstance(log_line, str) else ''
+            if log_line:
+                log_lines.append(log_line)
+                sources.append(source)
+                if tip_rows is not None:
+                    kept_rows.append(tip_rows[position])
+        if not log_lines:
+            if checkpoint is not None or queue_item is not None:
+                STORE.append(datetime.now(), [], [], checkpoint=checkpoint, queue_item=queue_item)
+            return []
+
+        now = datetime.now()
+        self.logs_processed += len(log_lines)
+        started = time.perf_counter()
+        events = self._parse_events(log_lines, engine)
+        parsed = time.perf_counter()
+        PIPELINE_METRICS.observe('parse', parsed - started)
+
+        if tip_rows is not None:
+            tip_results = self._evaluate_tip_rows(kept_rows)
+        else:
+            tip_results = self._evaluate_tip_batch(events)
+        started = time.perf_counter()
+        PIPELINE_METRICS.observe('tip', started - parsed)
+        fired = defaultdict(list)
+        for rule, line_indexes in engine.match_batch(log_lines, events):
+            for line_index in self._check_rule_batch(rule, line_indexes, log_lines, events, engine):
+                fired[line_index].append(rule)
+
+        timestamp = now.isoformat()
+        batch_alerts = []
+        for line_index, log_line in enumerate(log_lines):
+            tip_result = tip_results[line_index]
+            rules = fired.get(line_index)
+            if rules:
+                for rule in rules:
+                    batch_alerts.append(self._create_alert(
+                        rule, log_line, sources[line_index], tip_result, timestamp=timestamp,
+                        event=events[line_index]
+                    ))
+            elif tip_result and tip_result.get('is_malicious'):
+                batch_alerts.append(self._create_tip_alert(
+                    log_line, sources[line_index], tip_result, timestamp=timestamp, event=events[line_index]
+                ))
+        PIPELINE_METRICS.observe('match', time.perf_counter() - started)
+        return self._record(now, log_lines, sources, batch_alerts, checkpoint=checkpoint, queue_item=queue_item)
+
+    def _submit(self, entries, tip_rows, checkpoint):
+        """analyze_batch through the analysis pool"""
+        log_lines, sources, alerts = ANALYSIS_POOL.submit(entries, tip_rows, checkpoint)
+        self.logs_processed += len(log_lines)
+        self.alerts_generated += len(alerts)
+        if log_lines:
+            started = time.perf_counter()
+            BROADCASTER.publish(datetime.now(), log_lines, sources, alerts)
+            PIPELINE_METRICS.observe('emit', time.perf_counter() - started)
+        return alerts
+
+    def _record(self, now, log_lines, sources, new_alerts, checkpoint=None, queue_item=None):
+        """Persist analyzed lines with their alerts, then queue them for the dashboards.
+
+        Returns the alerts as stored, repeats folded into aggregates (see SIEMStore.append).
+        """
+        started = time.perf_counter()
+        last_log, alerts = STORE.append(
+            now, log_lines, sources, new_alerts, checkpoint=checkpoint, queue_item=queue_item
+        )
+        stored = time.perf_counter()
+        PIPELINE_METRICS.observe('store', stored - started)
+        PIPELINE_METRICS.count_lines(sources)
+        RULE_PROFILER.maybe_flush()
+        PIPELINE_METRICS.maybe_flush()
+        self.alerts_generated += len(alerts)
+        if queue_item is None:
+            BROADCASTER.publish(now, log_lines, sources, alerts, last_log)
+        # Only new alerts are logged; updates to an open aggregate would repeat them
+        created = {id(alert) for alert in new_alerts}
+        for alert in alerts:
+            if id(alert) in created:
+                repeats = f" (x{alert['count']})" if alert['count'] > 1 else ''
+                logger.warning(f"ALERT {alert['id']}: {alert['rule_name']} - {alert['log_entry']}{repeats}")
+        if queue_item is None:
+            PIPELINE_METRICS.observe('emit', time.perf_counter() - stored)
+        return alerts
+
+    def _parse_events(self, log_lines, engine=None):
+        """The LogEvent of each line, or None where nothing would read it.
+
+        Every line is parsed while a rule matches on fields; otherwise only
+        JSON lines are, for the TIP model, and alerts parse their own line.
+        """
+        if (engine or RULE_ENGINE).uses_fields:
+            return [parse_log_line(line) for line in log_lines]
+        if not self._tip_enabled():
+            return [None] * len(log_lines)
+        return [parse_log_line(line) if line[0] == '{' else None for line in log_lines]
+
+    def _evaluate_tip_batch(self, events):
+        if not self._tip_enabled():
+            return [None] * len(events)
+        return self._evaluate_tip_rows([
+            self.tip_model.row_from_event(event) if event is not None else None for event in events
+        ])
+
+    def _evaluate_tip_rows(self, rows):
+        # The model loads when the first row with features arrives
+        if not self._tip_enabled() or all(row is None for row in rows) or not self.tip_model.available:
+            return [None] * len(rows)
+        try:
+            return self.tip_model.predict_sparse(rows)
+        except Exception as exc:
+            logger.error("TIP evaluation error: %s", exc)
+            return [None] * len(rows)
+
+    def _evaluate_tip(self, event):
+        if not self._tip_enabled() or event is None:
             return None
         try:
-            return self.tip_model.predict_from_log_line(log_line)
+            row = self.tip_model.row_from_event(event)
+            if row is None or not self.tip_model.available:
+                return None
+            return self.tip_model.batcher.predict(row)
         except Exception as exc:
             logger.error("TIP evaluation error: %s", exc)
             return None
 
-    def _create_tip_alert(self, log_line, source, tip_result):
+    def _create_tip_alert(self, log_line, source, tip_result, timestamp=None, event=None):
         alert = {
-            'id': f"ALERT-{len(alerts)+1:06d}",
-            'timestamp': datetime.now().isoformat(),
+            'id': None,
+            'timestamp': timestamp or datetime.now().isoformat(),
             'rule_id': 'TIP-MODEL',
             'rule_name': 'TIP Model',
             'severity': 'HIGH',
@@ -1219,18 +5424,20 @@ class SIEMAnalyzer:
             'acknowledged': False,
             'tip': tip_result
         }
-
-        alerts.append(alert)
-        self.alerts_generated += 1
-        socketio.emit('alert', alert)
-        logger.warning(f"ALERT {alert['id']}: TIP Model - {log_line}")
+        self._attach_fields(alert, log_line, event)
         return alert
+
+    @staticmethod
+    def _attach_fields(alert, log_line, event):
+        fields = event_fields(event if event is not None else parse_log_line(log_line))
+        if len(fields) > 1:
+            alert['fields'] = fields
     
-    def _create_alert(self, rule, log_line, source, tip_result=None):
-        """Create an alert object"""
+    def _create_alert(self, rule, log_line, source, tip_result=None, timestamp=None, event=None):
+        """Create an alert object; the store assigns its id when it is recorded"""
         alert = {
-            'id': f"ALERT-{len(alerts)+1:06d}",
-            'timestamp': datetime.now().isoformat(),
+            'id': None,
+            'timestamp': timestamp or datetime.now().isoformat(),
             'rule_id': rule['id'],
             'rule_name': rule['name'],
             'severity': rule['severity'],
@@ -1242,15 +5449,7 @@ class SIEMAnalyzer:
 
         if tip_result:
             alert['tip'] = tip_result
-        
-        alerts.append(alert)
-        self.alerts_generated += 1
-        
-        # Broadcast alert via WebSocket
-        socketio.emit('alert', alert)
-        
-        # Log the alert
-        logger.warning(f"ALERT {alert['id']}: {rule['name']} - {log_line}")
+        self._attach_fields(alert, log_line, event)
         
         return alert
     
@@ -1269,52 +5468,101 @@ class SIEMAnalyzer:
             logger.error(f"Error analyzing file {file_path}: {e}")
             return []
 
+    def _analyze_lines(self, lines, source):
+        """Feed an iterable of lines through analyze_batch in ANALYSIS_CHUNK_SIZE chunks"""
+        found = {}
+        chunk = []
+        for line in lines:
+            chunk.append((line, source))
+            if len(chunk) >= ANALYSIS_CHUNK_SIZE:
+                self._collect(found, self.analyze_batch(chunk))
+                chunk = []
+        if chunk:
+            self._collect(found, self.analyze_batch(chunk))
+        return list(found.values())
+
+    def _analyze_records(self, records, source):
+        """Feed (text, tip_row) records through analyze_batch in ANALYSIS_CHUNK_SIZE chunks"""
+        found = {}
+        chunk = []
+        rows = []
+        for text, row in records:
+            chunk.append((text, source))
+            rows.append(row)
+            if len(chunk) >= ANALYSIS_CHUNK_SIZE:
+                self._collect(found, self.analyze_batch(chunk, tip_rows=rows))
+                chunk = []
+                rows = []
+        if chunk:
+            self._collect(found, self.analyze_batch(chunk, tip_rows=rows))
+        return list(found.values())
+
+    @staticmethod
+    def _collect(found, alerts):
+        # A later chunk may update an aggregate alert found earlier; keep its latest version
+        for alert in alerts:
+            found[alert['id']] = alert
+
+    def _tip_enabled(self):
+        """Whether TIP features are worth extracting; the model itself may not load"""
+        return bool(self.tip_model and self.tip_model.enabled and self.tip_model.loaded is not False)
+
     def _analyze_text_file(self, file_path, source):
-        file_alerts = []
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                line_alerts = self.analyze_log_line(line, source)
-                if line_alerts:
-                    file_alerts.extend(line_alerts)
+            file_alerts = self._analyze_lines(f, source)
         logger.info(f"Analyzed file {file_path}: {self.logs_processed} logs, {len(file_alerts)} alerts")
         return file_alerts
 
     def _analyze_csv_file(self, file_path, source):
-        file_alerts = []
         with open(file_path, 'r', newline='', encoding='utf-8', errors='ignore') as f:
-            reader = csv.DictReader(f)
-            if not reader.fieldnames:
+            raw_lines = []
+
+            def tracked_lines():
+                for line in f:
+                    raw_lines.append(line)
+                    yield line
+
+            reader = csv.reader(tracked_lines())
+            header = next(reader, None)
+            if not header:
                 return self._analyze_text_file(file_path, source)
-            for row in reader:
-                line_alerts = self.analyze_log_line(json.dumps(row), source)
-                if line_alerts:
-                    file_alerts.extend(line_alerts)
+            raw_lines.clear()
+            columns = self.tip_model.feature_columns(header) if self._tip_enabled() else None
+
+            def records():
+                for row in reader:
+                    text = ''.join(raw_lines)
+                    raw_lines.clear()
+                    if not row:
+                        continue
+                    if '\n' in text.rstrip('\r\n'):
+                        # Quoted newlines: keep the record on one line
+                        text = json.dumps(row)
+                    features = None
+                    if columns is not None:
+                        try:
+                            features = [float(row[index]) for index in columns]
+                        except (ValueError, IndexError):
+                            features = None
+                    yield text, features
+
+            file_alerts = self._analyze_records(records(), source)
         logger.info(f"Analyzed CSV file {file_path}: {self.logs_processed} logs, {len(file_alerts)} alerts")
         return file_alerts
 
     def _analyze_json_file(self, file_path, source):
-        file_alerts = []
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            raw = f.read().strip()
-        if not raw:
-            return file_alerts
+        tip_enabled = self._tip_enabled()
 
-        try:
-            payload = json.loads(raw)
-        except json.JSONDecodeError:
-            return self._analyze_text_file(file_path, source)
-
-        if isinstance(payload, list):
-            for entry in payload:
-                line_alerts = self.analyze_log_line(json.dumps(entry), source)
-                if line_alerts:
-                    file_alerts.extend(line_alerts)
-        elif isinstance(payload, dict):
-            line_alerts = self.analyze_log_line(json.dumps(payload), source)
-            if line_alerts:
-                file_alerts.extend(line_alerts)
-        else:
-            return self._analyze_text_file(file_path, source)
+        def records(stream):
+            for text, value in stream:
+                row = None
+                if tip_enabled and isinstance(value, dict):
+                    features = self.tip_model.payload_features(value)
+                    row = self.tip_model.extract_row(features) if features else None
+                yield text, row
+
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            file_alerts = self._analyze_records(records(_iter_json_records(f)), source)
 
         logger.info(f"Analyzed JSON file {file_path}: {self.logs_processed} logs, {len(file_alerts)} alerts")
         return file_alerts
@@ -1325,9 +5573,37 @@ def index():
     """Serve the main HTML interface"""
     return render_template_string(HTML_TEMPLATE)
 
+def _save_upload(file, path):
+    """Stream an uploaded file to path, returning the SHA-256 of its content"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_BYTES), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def _cached_upload(key):
+    """The earlier (run, alerts) for an UploadKey, if its report is still on disk"""
+    if not UPLOAD_CACHE_SIZE:
+        return None
+    cached = STORE.cached_upload(key)
+    if cached is None:
+        return None
+    report_name = cached[0]['report_filename']
+    if not (REPORT_DIR / report_name).exists() and not _report_spool(report_name).exists():
+        return None
+    return cached
+
+
 @app.route('/upload', methods=['POST'])
 def upload_log_file():
-    """Handle log file upload"""
+    """Handle log file upload.
+
+    Content is hashed as it is saved. A repeat upload of the same content
+    from the same source, under the same rules and TIP model, returns the
+    earlier run ("cached": true) without keeping the copy or analyzing it.
+    """
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'No file uploaded'})
     
@@ -1337,29 +5613,45 @@ def upload_log_file():
     if file.filename == '':
         return jsonify({'success': False, 'error': 'No file selected'})
     
+    partial = None
     try:
         # Save uploaded file
         safe_name = Path(file.filename).name
         filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_name}"
         filepath = UPLOAD_DIR / filename
-        file.save(str(filepath))
+        partial = UPLOAD_DIR / f".{filename}.{os.getpid()}.part"
+        RULE_SET.refresh(wait=True)
+        key = UploadKey(_save_upload(file, partial), source, RULE_ENGINE.version, TIP_MODEL.version)
+
+        cached = _cached_upload(key)
+        if cached is not None:
+            run, alerts_found = cached
+            analysis_runs.append(run)
+            return jsonify({
+                'success': True,
+                'cached': True,
+                'filename': run['filename'],
+                'logs_processed': run['logs_processed'],
+                'alerts_generated': run['alerts_generated'],
+                'alerts': alerts_found,
+                'report_url': f"/report/{run['report_filename']}",
+                'stats': _current_stats()
+            })
+        os.replace(partial, filepath)
         
         # Analyze file
         analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
         alerts_found = analyzer.analyze_log_file(filepath, source)
         run = _register_run('upload', source, analyzer.logs_processed, alerts_found, filename)
-        
-        # Update WebSocket clients
-        socketio.emit('log_update', {
-            'logs': log_entries[-50:],  # Last 50 logs
-            'stats': _current_stats()
-        })
+        if UPLOAD_CACHE_SIZE:
+            STORE.cache_upload(key, run, alerts_found, UPLOAD_CACHE_SIZE)
         
         return jsonify({
             'success': True,
+            'cached': False,
             'filename': filename,
             'logs_processed': analyzer.logs_processed,
-            'alerts_generated': analyzer.alerts_generated,
+            'alerts_generated': len(alerts_found),
             'alerts': alerts_found,
             'report_url': f"/report/{run['report_filename']}",
             'stats': _current_stats()
@@ -1368,6 +5660,9 @@ def upload_log_file():
     except Exception as e:
         logger.error(f"Upload error: {e}")
         return jsonify({'success': False, 'error': str(e)})
+    finally:
+        if partial is not None:
+            partial.unlink(missing_ok=True)
 
 @app.route('/analyze', methods=['POST'])
 def analyze_log_text():
@@ -1377,21 +5672,10 @@ def analyze_log_text():
     source = data.get('source', 'manual')
     
     analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
-    alerts_found = []
-    
-    for line in logs.split('\n'):
-        line_alerts = analyzer.analyze_log_line(line, source)
-        if line_alerts:
-            alerts_found.extend(line_alerts)
+    alerts_found = analyzer.analyze_batch((line, source) for line in logs.split('\n'))
 
     run = _register_run('manual', source, analyzer.logs_processed, alerts_found)
     
-    # Update WebSocket clients
-    socketio.emit('log_update', {
-        'logs': log_entries[-50:],
-        'stats': _current_stats()
-    })
-    
     return jsonify({
         'success': True,
         'logs_processed': analyzer.logs_processed,
@@ -1404,16 +5688,18 @@ def analyze_log_text():
 @app.route('/alerts')
 def get_alerts():
     """Get all alerts"""
-    return jsonify(alerts[-100:])  # Last 100 alerts
+    return jsonify(STORE.recent_alerts(100))  # Last 100 alerts
 
 @app.route('/logs')
 def get_logs():
-    """Get recent logs"""
-    return jsonify(log_entries[-100:])  # Last 100 logs
+    """Get recent logs, from memory while this process stored the newest ones"""
+    logs = RECENT_LOGS.tail_if_current(100, STORE.log_count())  # Last 100 logs
+    return jsonify(logs if logs is not None else STORE.recent_logs(100))
 
 @app.route('/rules')
 def get_rules():
     """Get detection rules"""
+    RULE_SET.refresh(wait=True)
     return jsonify(RULES)
 
 @app.route('/stats')
@@ -1426,13 +5712,68 @@ def get_stats():
 # API Endpoints for Laravel Backend Integration
 # =============================================================================
 
+def _wants_wait(data):
+    value = data.get('wait', request.args.get('wait', ''))
+    return str(value).lower() in {'1', 'true', 'yes'}
+
+
+def _queue_ingest(entries, wait):
+    """Hand ingest entries to INGEST_QUEUE and build the response"""
+    if len(entries) > INGEST_QUEUE.capacity:
+        return jsonify({
+            'success': False,
+            'error': f"Batch exceeds the ingest queue capacity ({INGEST_QUEUE.capacity} lines)"
+        }), 413
+
+    item, shed, retry_after = INGEST_QUEUE.offer(entries, wait)
+    if item is None:
+        response = jsonify({
+            'success': False,
+            'error': 'Ingest queue full',
+            'queue_depth': INGEST_QUEUE.depth,
+            'queue_capacity': INGEST_QUEUE.capacity,
+            'retry_after': retry_after
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    if wait and item.done.wait(ANALYSIS_TIMEOUT):
+        if item.error is not None:
+            return jsonify({
+                'success': False,
+                'error': f"Analysis failed: {item.error}",
+                'logs_dropped': len(item.entries),
+                'shed': shed
+            }), 500
+        return jsonify({
+            'success': True,
+            'processed': True,
+            'logs_processed': item.logs_processed,
+            'alerts_generated': len(item.alerts),
+            'alerts': item.alerts,
+            'shed': shed
+        })
+    return jsonify({
+        'success': True,
+        'queued': True,
+        'accepted': len(item.entries),
+        'shed': shed,
+        'queue_depth': INGEST_QUEUE.depth,
+        'queue_capacity': INGEST_QUEUE.capacity
+    }), 202
+
+
 @app.route('/api/ingest', methods=['POST'])
 def api_ingest_log():
     """
     Ingest a single log entry for real-time analysis.
     
     POST /api/ingest
-    Body: { "log": "log entry", "source": "source_name", "metadata": {...} }
+    Body: { "log": "log entry", "source": "source_name", "metadata": {...}, "wait": true }
+
+    With the ingest queue enabled the entry is queued (202) unless "wait"
+    asks for its alerts; a full queue answers 429.
     """
     data = request.get_json(silent=True) or {}
     log_entry = data.get('log', '')
@@ -1441,16 +5782,13 @@ def api_ingest_log():
     
     if not log_entry:
         return jsonify({'success': False, 'error': 'Log entry is required'}), 400
+
+    if INGEST_QUEUE.enabled:
+        return _queue_ingest([(log_entry, source)], _wants_wait(data))
     
     analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
     alerts_found = analyzer.analyze_log_line(log_entry, source)
     
-    # Update WebSocket clients
-    socketio.emit('log_update', {
-        'logs': log_entries[-50:],
-        'stats': _current_stats()
-    })
-    
     return jsonify({
         'success': True,
         'processed': True,
@@ -1465,7 +5803,10 @@ def api_ingest_batch():
     Ingest multiple log entries in batch.
     
     POST /api/ingest/batch
-    Body: { "logs": ["log1", "log2", ...] or [{"log": "...", "source": "..."}], "default_source": "api_batch" }
+    Body: { "logs": ["log1", "log2", ...] or [{"log": "...", "source": "..."}], "default_source": "api_batch",
+            "wait": true }
+
+    Queued like /api/ingest when the ingest queue is enabled.
     """
     data = request.get_json(silent=True) or {}
     logs = data.get('logs', [])
@@ -1474,29 +5815,18 @@ def api_ingest_batch():
     if not logs:
         return jsonify({'success': False, 'error': 'Logs array is required'}), 400
     
-    analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
-    all_alerts = []
-    
+    entries = []
     for log_item in logs:
         if isinstance(log_item, str):
-            log_entry = log_item
-            source = default_source
+            entries.append((log_item, default_source))
         elif isinstance(log_item, dict):
-            log_entry = log_item.get('log', '')
-            source = log_item.get('source', default_source)
-        else:
-            continue
-        
-        if log_entry:
-            line_alerts = analyzer.analyze_log_line(log_entry, source)
-            if line_alerts:
-                all_alerts.extend(line_alerts)
+            entries.append((log_item.get('log', ''), log_item.get('source', default_source)))
+
+    if INGEST_QUEUE.enabled:
+        return _queue_ingest(entries, _wants_wait(data))
     
-    # Update WebSocket clients
-    socketio.emit('log_update', {
-        'logs': log_entries[-50:],
-        'stats': _current_stats()
-    })
+    analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
+    all_alerts = analyzer.analyze_batch(entries)
     
     return jsonify({
         'success': True,
@@ -1506,6 +5836,92 @@ def api_ingest_batch():
     })
 
 
+ALERT_STATES = {'all': None, 'unacknowledged': False, 'acknowledged': True}
+
+
+@app.route('/api/alerts')
+def api_list_alerts():
+    """
+    List alerts, newest first.
+    
+    GET /api/alerts?state=unacknowledged|acknowledged|all[&severity=HIGH][&rule_id=RULE001][&source=api]
+        [&from=timestamp][&to=timestamp][&limit=100][&before=ALERT-000123]
+    Pass the returned next id as before to get the following page.
+    """
+    args = request.args
+    state = args.get('state', 'all').lower()
+    if state not in ALERT_STATES:
+        return jsonify({'success': False, 'error': f"state must be one of {', '.join(ALERT_STATES)}"}), 400
+    try:
+        since = _parse_search_time(args.get('from'))
+        until = _parse_search_time(args.get('to'))
+        limit = min(max(int(args.get('limit', 100)), 1), SEARCH_MAX_LIMIT)
+    except (TypeError, ValueError) as exc:
+        return jsonify({'success': False, 'error': f'Invalid alert filter: {exc}'}), 400
+
+    alerts, next_id = STORE.list_alerts(
+        acknowledged=ALERT_STATES[state],
+        severity=args.get('severity'),
+        rule_id=args.get('rule_id'),
+        source=args.get('source'),
+        since=since,
+        until=until,
+        limit=limit,
+        before=args.get('before')
+    )
+    return jsonify({'alerts': alerts, 'next': next_id, 'limit': limit})
+
+
+@app.route('/api/alerts/acknowledge', methods=['POST'])
+def api_acknowledge_alerts():
+    """
+    Acknowledge alerts in bulk.
+    
+    POST /api/alerts/acknowledge
+    Body: { "ids": ["ALERT-000001", ...] } or filters for every open alert they match:
+          { "severity": "LOW", "rule_id": "RULE006", "source": "api", "from": "timestamp", "to": "timestamp" }
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) > SEARCH_MAX_LIMIT:
+            return jsonify({'success': False, 'error': f'ids must be a list of at most {SEARCH_MAX_LIMIT}'}), 400
+        acknowledged = STORE.acknowledge_alerts(ids)
+        found = {alert['id'] for alert in acknowledged}
+        return jsonify({
+            'success': True,
+            'acknowledged': len(acknowledged),
+            'not_found': [alert_id for alert_id in ids if alert_id not in found]
+        })
+
+    filters = {key: data.get(key) for key in ('severity', 'rule_id', 'source')}
+    try:
+        since = _parse_search_time(data.get('from'))
+        until = _parse_search_time(data.get('to'))
+    except (TypeError, ValueError) as exc:
+        return jsonify({'success': False, 'error': f'Invalid alert filter: {exc}'}), 400
+    if not any(filters.values()) and since is None and until is None:
+        # An empty body should not acknowledge everything
+        return jsonify({'success': False, 'error': 'Give ids or at least one filter'}), 400
+    return jsonify({
+        'success': True,
+        'acknowledged': STORE.acknowledge_matching(since=since, until=until, **filters)
+    })
+
+
+@app.route('/api/alerts/<alert_id>')
+def api_get_alert(alert_id):
+    """
+    Get one alert by ID.
+    
+    GET /api/alerts/{alert_id}
+    """
+    alert = STORE.get_alert(alert_id)
+    if alert:
+        return jsonify(alert)
+    return jsonify({'success': False, 'error': 'Alert not found'}), 404
+
+
 @app.route('/api/alerts/<alert_id>/acknowledge', methods=['POST'])
 def api_acknowledge_alert(alert_id):
     """
@@ -1513,14 +5929,13 @@ def api_acknowledge_alert(alert_id):
     
     POST /api/alerts/{alert_id}/acknowledge
     """
-    for alert in alerts:
-        if alert.get('id') == alert_id:
-            alert['acknowledged'] = True
-            return jsonify({
-                'success': True,
-                'message': 'Alert acknowledged',
-                'alert': alert
-            })
+    alert = STORE.acknowledge_alert(alert_id)
+    if alert:
+        return jsonify({
+            'success': True,
+            'message': 'Alert acknowledged',
+            'alert': alert
+        })
     
     return jsonify({'success': False, 'error': 'Alert not found'}), 404
 
@@ -1530,49 +5945,25 @@ def api_alert_trends():
     """
     Get alert trends over time.
     
-    GET /api/alerts/trends?period=24h
+    GET /api/alerts/trends?period=24h[&rule_id=RULE001][&source=api]
     """
     period = request.args.get('period', '24h')
     
     # Calculate time boundaries based on period
-    now = datetime.now()
-    if period == '1h':
-        start_time = now - timedelta(hours=1)
-        bucket_format = '%Y-%m-%d %H:%M'
-    elif period == '6h':
-        start_time = now - timedelta(hours=6)
-        bucket_format = '%Y-%m-%d %H:00'
-    elif period == '24h':
-        start_time = now - timedelta(hours=24)
-        bucket_format = '%Y-%m-%d %H:00'
-    elif period == '7d':
-        start_time = now - timedelta(days=7)
-        bucket_format = '%Y-%m-%d'
-    elif period == '30d':
-        start_time = now - timedelta(days=30)
-        bucket_format = '%Y-%m-%d'
-    else:
-        start_time = now - timedelta(hours=24)
-        bucket_format = '%Y-%m-%d %H:00'
+    window, granularity = TREND_PERIODS.get(period, TREND_PERIODS['24h'])
+    start_time = datetime.now() - window
     
-    # Group alerts by time bucket
+    # Group rolled-up alert counts by time bucket
     trends = defaultdict(lambda: {'total': 0, 'critical': 0, 'high': 0, 'medium': 0, 'low': 0})
     
-    for alert in alerts:
-        alert_time_str = alert.get('timestamp', '')
-        try:
-            alert_time = datetime.fromisoformat(alert_time_str.replace('Z', '+00:00'))
-            if alert_time.tzinfo:
-                alert_time = alert_time.replace(tzinfo=None)
-        except (ValueError, AttributeError):
-            continue
-        
-        if alert_time >= start_time:
-            bucket = alert_time.strftime(bucket_format)
-            severity = alert.get('severity', 'MEDIUM').lower()
-            trends[bucket]['total'] += 1
-            if severity in trends[bucket]:
-                trends[bucket][severity] += 1
+    rows = STORE.alert_trends(
+        start_time, granularity, rule_id=request.args.get('rule_id'), source=request.args.get('source')
+    )
+    for bucket, severity, count in rows:
+        severity = severity.lower()
+        trends[bucket]['total'] += count
+        if severity in trends[bucket]:
+            trends[bucket][severity] += count
     
     # Convert to list format
     trend_data = [
@@ -1586,39 +5977,53 @@ def api_alert_trends():
     })
 
 
+def _parse_search_time(value):
+    """Epoch seconds from an ISO-8601 string or a number; None when not given"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return parsed.timestamp()
+
+
 @app.route('/api/logs/search', methods=['POST'])
 def api_search_logs():
     """
     Search logs with filters.
     
     POST /api/logs/search
-    Body: { "query": "search term", "source": "source_filter", "from": "timestamp", "to": "timestamp", "limit": 100 }
+    Body: { "query": "search term", "source": "source_filter", "ip": "10.0.0.5", "user": "admin",
+            "from": "timestamp", "to": "timestamp", "limit": 100, "page": 1 | "offset": 0, "order": "asc" }
+    Query words, IPs and usernames are matched as whole tokens; total counts every match.
     """
     data = request.get_json(silent=True) or {}
-    query = data.get('query', '').lower()
-    source_filter = data.get('source')
-    from_time = data.get('from')
-    to_time = data.get('to')
-    limit = data.get('limit', 100)
-    
-    results = []
-    
-    for log in log_entries:
-        # Apply query filter
-        if query and query not in log.lower():
-            continue
-        
-        # Apply source filter
-        if source_filter and source_filter not in log:
-            continue
-        
-        results.append(log)
-        
-        if len(results) >= limit:
-            break
-    
+    query = str(data.get('query') or '')
+    try:
+        from_time = _parse_search_time(data.get('from'))
+        to_time = _parse_search_time(data.get('to'))
+        limit = min(max(int(data.get('limit', 100)), 1), SEARCH_MAX_LIMIT)
+        page = max(int(data.get('page', 1)), 1)
+        offset = max(int(data.get('offset', (page - 1) * limit)), 0)
+    except (TypeError, ValueError) as exc:
+        return jsonify({'success': False, 'error': f'Invalid search parameter: {exc}'}), 400
+
+    total, results = STORE.search_logs(
+        query,
+        source=data.get('source'),
+        ip=data.get('ip'),
+        user=data.get('user'),
+        since=from_time,
+        until=to_time,
+        limit=limit,
+        offset=offset,
+        newest_first=str(data.get('order', 'asc')).lower() == 'desc'
+    )
+
     return jsonify({
-        'total': len(results),
+        'total': total,
+        'offset': offset,
+        'limit': limit,
         'logs': results
     })
 
@@ -1629,36 +6034,39 @@ def api_save_rule():
     Create or update a detection rule.
     
     POST /api/rules
-    Body: { "id": "RULE_ID", "name": "Rule Name", "pattern": "regex", "severity": "HIGH", "description": "...", "threshold": 5, "time_window": 300 }
+    Body: { "id": "RULE_ID", "name": "Rule Name", "pattern": "regex", "severity": "HIGH", "description": "...", "threshold": 5, "time_window": 300, "group_by": "src_ip" }
+
+    "fields" matches parsed log fields (see EVENT_FIELDS) instead of, or as
+    well as, the pattern: { ..., "fields": { "status": [500, 503], "src_ip": "10.0.0.0/8" } }
     """
-    global RULES
     data = request.get_json(silent=True) or {}
     
-    required_fields = ['id', 'name', 'pattern', 'severity', 'description']
+    required_fields = ['id', 'name', 'severity', 'description']
+    if not data.get('fields'):
+        required_fields.insert(2, 'pattern')
     for field in required_fields:
         if not data.get(field):
             return jsonify({'success': False, 'error': f'{field} is required'}), 400
     
     # Validate regex pattern
     try:
-        re.compile(data['pattern'])
+        re.compile(data.get('pattern') or '')
     except re.error as e:
         return jsonify({'success': False, 'error': f'Invalid regex pattern: {e}'}), 400
     
-    # Check if rule exists
-    existing_rule = None
-    for i, rule in enumerate(RULES):
-        if rule['id'] == data['id']:
-            existing_rule = i
-            break
-    
     new_rule = {
         'id': data['id'],
         'name': data['name'],
-        'pattern': data['pattern'],
+        'pattern': data.get('pattern') or '',
         'severity': data['severity'].upper(),
         'description': data['description']
     }
+    if data.get('fields'):
+        new_rule['fields'] = data['fields']
+        try:
+            _compile_fields(new_rule)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f'Invalid fields: {e}'}), 400
     
     # Add optional fields
     if data.get('threshold'):
@@ -1667,25 +6075,35 @@ def api_save_rule():
         new_rule['time_window'] = int(data['time_window'])
     if data.get('alert_on_match'):
         new_rule['alert_on_match'] = bool(data['alert_on_match'])
+    if data.get('group_by'):
+        new_rule['group_by'] = data['group_by']
+        if _group_key_extractor(new_rule) is None:
+            return jsonify({
+                'success': False,
+                'error': (
+                    "group_by must name a capture group of the pattern or one of "
+                    f"{sorted(set(_GROUP_BY_EXTRACTORS) | set(EVENT_FIELDS))}"
+                )
+            }), 400
     
-    if existing_rule is not None:
-        RULES[existing_rule] = new_rule
-        action = 'updated'
-    else:
-        RULES.append(new_rule)
-        action = 'created'
-    
-    # Save rules to file
-    try:
-        with open(BASE_DIR / 'rules.json', 'w') as f:
-            json.dump({'rules': RULES}, f, indent=4)
-    except Exception as e:
-        logger.error(f"Failed to save rules: {e}")
+    def upsert(rules):
+        rules = list(rules or [])
+        for i, rule in enumerate(rules):
+            if rule['id'] == new_rule['id']:
+                rules[i] = new_rule
+                return rules, 'updated'
+        rules.append(new_rule)
+        return rules, 'created'
+
+    # Other workers pick the new version up from the store (see RuleSetWatcher)
+    version, rules, action = STORE.update_rules(upsert, save=_save_rules_file)
+    RULE_SET.install(version, rules)
     
     return jsonify({
         'success': True,
         'message': f'Rule {action} successfully',
-        'rule': new_rule
+        'rule': new_rule,
+        'version': version
     })
 
 
@@ -1696,28 +6114,155 @@ def api_delete_rule(rule_id):
     
     DELETE /api/rules/{rule_id}
     """
-    global RULES
-    
-    for i, rule in enumerate(RULES):
-        if rule['id'] == rule_id:
-            deleted_rule = RULES.pop(i)
-            
-            # Save rules to file
-            try:
-                with open(BASE_DIR / 'rules.json', 'w') as f:
-                    json.dump({'rules': RULES}, f, indent=4)
-            except Exception as e:
-                logger.error(f"Failed to save rules: {e}")
-            
-            return jsonify({
-                'success': True,
-                'message': 'Rule deleted successfully',
-                'rule': deleted_rule
-            })
+    def remove(rules):
+        rules = list(rules or [])
+        for i, rule in enumerate(rules):
+            if rule['id'] == rule_id:
+                return rules[:i] + rules[i + 1:], rule
+        return None, None
+
+    version, rules, deleted_rule = STORE.update_rules(remove, save=_save_rules_file)
+    if deleted_rule is not None:
+        RULE_SET.install(version, rules)
+        return jsonify({
+            'success': True,
+            'message': 'Rule deleted successfully',
+            'rule': deleted_rule,
+            'version': version
+        })
     
     return jsonify({'success': False, 'error': 'Rule not found'}), 404
 
 
+@app.route('/api/rules/prefilter')
+def api_rules_prefilter():
+    """
+    Literal prefilter counters for the current rule engine.
+    
+    GET /api/rules/prefilter
+    """
+    return jsonify(RULE_ENGINE.describe_prefilter())
+
+
+@app.route('/api/rules/metrics')
+def api_rules_metrics():
+    """
+    Per-rule evaluations, matches, regex time (total, average, p99) and the
+    slowest sampled lines, merged across worker processes.
+    
+    GET /api/rules/metrics
+    """
+    RULE_SET.refresh()
+    metrics = RULE_PROFILER.snapshot(RULE_ENGINE.rules)
+    metrics['rules_version'] = RULE_ENGINE.version
+    metrics['rule_set_version'] = RULE_SET.version
+    return jsonify(metrics)
+
+
+def _metric_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _render_metrics():
+    """Prometheus text exposition (format 0.0.4) of the pipeline, merged across processes"""
+    reports = PIPELINE_METRICS.reports()
+    out = []
+
+    def family(name, kind, help_text, samples):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            out.append(f"{name}{suffix}{_metric_labels(labels)} {value}")
+
+    lines = defaultdict(int)
+    for report in reports:
+        for source, count in report['lines'].items():
+            lines[source] += count
+    family('siem_lines_ingested_total', 'counter', 'Log lines stored, by source.',
+           [('', {'source': source}, count) for source, count in sorted(lines.items())])
+
+    samples = []
+    for stage in PIPELINE_STAGES:
+        buckets = [0] * (len(PIPELINE_STAGE_BUCKETS) + 1)
+        seconds = 0.0
+        for report in reports:
+            data = report['stages'].get(stage)
+            if data:
+                buckets = [total + count for total, count in zip(buckets, data['buckets'])]
+                seconds += data['seconds']
+        cumulative = 0
+        for bound, count in zip(PIPELINE_STAGE_BUCKETS + (float('inf'),), buckets):
+            cumulative += count
+            samples.append(('_bucket', {'stage': stage, 'le': '+Inf' if bound == float('inf') else bound}, cumulative))
+        samples.append(('_sum', {'stage': stage}, round(seconds, 6)))
+        samples.append(('_count', {'stage': stage}, cumulative))
+    family('siem_stage_duration_seconds', 'histogram', 'Time one analyzed batch spent in each pipeline stage.', samples)
+
+    counters = STORE.counters()
+    family('siem_alerts_total', 'counter', 'Alerts stored, by severity (repeats folded into aggregates excluded).',
+           [('', {'severity': name.split(':', 1)[1]}, value) for name, value in sorted(counters.items())
+            if name.startswith('alerts:') and name != 'alerts:unacked'])
+    family('siem_alert_repeats_total', 'counter', 'Alert occurrences folded into an open aggregate.',
+           [('', {}, counters.get('alert_repeats', 0))])
+    family('siem_alerts_unacknowledged', 'gauge', 'Stored alerts not yet acknowledged.',
+           [('', {}, counters.get('alerts:unacked', 0))])
+
+    depth = STORE.queue_depth()
+    family('siem_analysis_queue_batches', 'gauge', 'Batches waiting for each analysis worker shard.',
+           [('', {'shard': shard}, entry['batches']) for shard, entry in sorted(depth.items())])
+    family('siem_analysis_queue_lag_seconds', 'gauge', 'Age of the oldest batch waiting for each shard.',
+           [('', {'shard': shard}, entry['lag_seconds']) for shard, entry in sorted(depth.items())])
+
+    dropped = defaultdict(int)
+    for report in reports:
+        for reason, count in report.get('ingest_dropped', {}).items():
+            dropped[reason] += count
+    family('siem_ingest_lines_dropped_total', 'counter',
+           'Lines the ingest queue refused, shed or failed to analyze, by reason.',
+           [('', {'reason': reason}, count) for reason, count in sorted(dropped.items())])
+
+    gauges = (
+        ('ingest_queue_depth', 'siem_ingest_queue_lines', 'Lines waiting in the in-process ingest queue.'),
+        ('websocket_clients', 'siem_websocket_clients', 'Connected dashboard clients.'),
+        ('realtime_monitors', 'siem_realtime_monitors', 'Files tailed for realtime monitoring.'),
+        ('realtime_subscribers', 'siem_realtime_subscribers', 'Clients subscribed to tailed files.'),
+        ('threshold_keys', 'siem_threshold_keys', 'Threshold windows held in memory.'),
+        ('recent_logs_lines', 'siem_recent_logs_lines', 'Lines held in the recent log ring.'),
+        ('recent_logs_bytes', 'siem_recent_logs_bytes', 'Memory reserved by the recent log ring.'),
+        ('resident_memory_bytes', 'siem_process_resident_memory_bytes', 'Resident memory of the process.'),
+    )
+    for key, name, help_text in gauges:
+        family(name, 'gauge', help_text,
+               [('', {'process': report['process']}, report['gauges'].get(key, 0)) for report in reports])
+
+    websocket = (
+        ('frames_sent', 'siem_websocket_frames_sent_total', 'log_update frames emitted.'),
+        ('frames_merged', 'siem_websocket_frames_merged_total', 'Frames merged into a catch-up frame.'),
+        ('resyncs', 'siem_websocket_resyncs_total', 'Clients told to reload after falling behind.'),
+        ('realtime_emits', 'siem_websocket_realtime_emits_total', 'realtime_log messages emitted.'),
+    )
+    for key, name, help_text in websocket:
+        family(name, 'counter', help_text,
+               [('', {'process': report['process']}, report['websocket'].get(key, 0)) for report in reports])
+    return '\n'.join(out) + '\n'
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus metrics for the ingest pipeline, covering every worker process.
+    
+    GET /metrics
+    """
+    return app.response_class(_render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/api/health')
 def api_health():
     """
@@ -1730,7 +6275,21 @@ def api_health():
         'service': 'siem',
         'version': '1.0.0',
         'timestamp': datetime.now().isoformat(),
-        'stats': _current_stats()
+        'stats': _current_stats(),
+        'rule_engine': RULE_ENGINE.describe_prefilter(),
+        'rule_set': RULE_SET.describe(),
+        'thresholds': THRESHOLDS.describe(),
+        'broadcast': BROADCASTER.describe(),
+        'recent_logs': RECENT_LOGS.describe(),
+        'realtime': TAILER.describe(),
+        'analysis': ANALYSIS_POOL.describe(),
+        'ingest_queue': INGEST_QUEUE.describe(),
+        'tip': {
+            'available': TIP_MODEL.loaded,
+            'runtime': TIP_MODEL.runtime,
+            'batches_run': TIP_MODEL.batcher.batches_run,
+            'rows_predicted': TIP_MODEL.batcher.rows_predicted
+        }
     })
 
 
@@ -1740,16 +6299,17 @@ def get_latest_report():
     if not analysis_runs:
         return jsonify({'success': False, 'error': 'No reports available'}), 404
     report_name = analysis_runs[-1].get('report_filename', '')
+    if _ensure_report(report_name) is None:
+        return jsonify({'success': False, 'error': 'Report not found'}), 404
     return send_from_directory(REPORT_DIR, report_name)
 
 @app.route('/report/<report_name>')
 def get_report(report_name):
-    """Serve a report file by name"""
+    """Serve a report file by name, rendering it on first request"""
     safe_name = Path(report_name).name
     if not safe_name.endswith('.html'):
         return jsonify({'success': False, 'error': 'Invalid report name'}), 400
-    report_path = REPORT_DIR / safe_name
-    if not report_path.exists():
+    if _ensure_report(safe_name) is None:
         return jsonify({'success': False, 'error': 'Report not found'}), 404
     return send_from_directory(REPORT_DIR, safe_name)
 
@@ -1758,6 +6318,7 @@ def get_report(report_name):
 def handle_connect():
     """Handle client connection"""
     logger.info(f"Client connected: {request.sid}")
+    BROADCASTER.add_client(request.sid)
     emit('connected', {'message': 'Connected to SIEM server'})
 
 @socketio.on('start_realtime')
@@ -1774,25 +6335,31 @@ def handle_start_realtime(data):
         emit('realtime_status', {'success': False, 'error': error})
         return
 
-    _start_realtime_monitor(request.sid, resolved_path, source, from_start)
+    try:
+        created = TAILER.subscribe(request.sid, resolved_path, source, from_start)
+    except OSError as exc:
+        emit('realtime_status', {'success': False, 'error': str(exc)})
+        return
     emit('realtime_status', {
         'success': True,
         'file_path': str(resolved_path),
         'source': source,
-        'from_start': from_start
+        'from_start': from_start,
+        'shared': not created
     })
 
 @socketio.on('stop_realtime')
 def handle_stop_realtime():
     """Stop real-time log monitoring"""
     logger.info(f"Stopping real-time monitoring for client {request.sid}")
-    _stop_realtime_monitor(request.sid)
+    TAILER.unsubscribe(request.sid)
     emit('realtime_status', {'success': True, 'stopped': True})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Cleanup on client disconnect"""
-    _stop_realtime_monitor(request.sid)
+    TAILER.unsubscribe(request.sid)
+    BROADCASTER.remove_client(request.sid)
 
 def generate_sample_logs():
     """Generate sample logs for testing"""
@@ -1809,18 +6376,27 @@ def generate_sample_logs():
         "Brute force attack detected from 198.51.100.23"
     ]
     
+    if STORE.counters().get('logs'):
+        return
     analyzer = SIEMAnalyzer(tip_model=TIP_MODEL)
     for log in sample_logs:
         analyzer.analyze_log_line(log, "sample")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simple SIEM Tool')
+    parser.add_argument('--analysis-workers', action='store_true',
+                        help='run the SIEM_ANALYSIS_WORKERS analysis processes instead of the web server')
+    args = parser.parse_args()
+    if args.analysis_workers:
+        run_analysis_workers()
+
     logger.info("Starting Simple SIEM Tool...")
     logger.info(f"Loaded {len(RULES)} detection rules")
     
     # Generate some sample logs for demo
     generate_sample_logs()
     
-    logger.info(f"Generated {len(alerts)} sample alerts")
+    logger.info(f"Stored alerts: {_current_stats()['total_alerts']}")
     logger.info("Server running on http://localhost:5000")
     
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,9 @@
+# tests/conftest.py
+import pytest
+import siem_bench
+
+
+@pytest.fixture(scope="session")
+def siem(tmp_path_factory):
+    """siem_tool, imported once for the whole session against a throwaway store"""
+    return siem_bench.load_siem(tmp_path_factory.mktemp("siem") / "siem.db")
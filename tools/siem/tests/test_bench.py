@@ -0,0 +1,67 @@
+# tests/test_bench.py
+import json
+import siem_bench
+
+
+def test_synthetic_corpus_is_deterministic():
+    assert siem_bench.synthetic_corpus(500, seed=3) == siem_bench.synthetic_corpus(500, seed=3)
+    assert siem_bench.synthetic_corpus(500, seed=3) != siem_bench.synthetic_corpus(500, seed=4)
+    assert all(source == "synthetic" for _, source in siem_bench.synthetic_corpus(50))
+
+
+def test_file_corpus_reads_directories(tmp_path):
+    (tmp_path / "auth.log").write_text("Failed login for admin\n\nsecond line\n")
+    (tmp_path / "web.log").write_text("GET / HTTP/1.1 200\n")
+    entries = siem_bench.file_corpus([tmp_path])
+    assert entries == [
+        ("Failed login for admin", "auth"),
+        ("second line", "auth"),
+        ("GET / HTTP/1.1 200", "web"),
+    ]
+
+
+def test_replay_reports_throughput_and_rule_cost(siem):
+    report = siem_bench.run_benchmark(siem, siem_bench.synthetic_corpus(2000), runs=2, chunk_size=500)
+    assert report["lines"] == 2000
+    assert report["runs"] == 2
+    assert report["alerts"] > 0
+    assert report["lines_per_sec"] > 0 and report["alerts_per_sec"] > 0
+    assert report["rule_cost"], "expected per-rule cost rows"
+    assert sum(row["matches"] for row in report["rule_cost"]) > 0
+    # Costliest rule first
+    costs = [row["total_ms"] for row in report["rule_cost"]]
+    assert costs == sorted(costs, reverse=True)
+
+
+def test_line_mode_replays_every_line(siem):
+    report = siem_bench.run_benchmark(siem, siem_bench.synthetic_corpus(300), runs=1, mode="line")
+    assert report["mode"] == "line"
+    assert report["chunk_size"] == 1
+    assert sum(row["evaluations"] for row in report["rule_cost"]) > 0
+
+
+def test_compare_allows_drop_within_tolerance():
+    ok, messages = siem_bench.compare({"lines_per_sec": 950.0}, {"lines_per_sec": 1000.0}, 10)
+    assert ok
+    assert messages[-1].startswith("ok")
+
+
+def test_compare_fails_on_regression_and_notes_corpus_change():
+    baseline = {"lines_per_sec": 1000.0, "lines": 100}
+    ok, messages = siem_bench.compare({"lines_per_sec": 800.0, "lines": 200}, baseline, 10)
+    assert not ok
+    assert any("lines differs" in message for message in messages)
+    assert messages[-1].startswith("REGRESSION")
+
+
+def test_main_exit_status_follows_baseline(siem, tmp_path):
+    fast = tmp_path / "fast.json"
+    fast.write_text(json.dumps({"lines_per_sec": 1e12}))
+    slow = tmp_path / "slow.json"
+    slow.write_text(json.dumps({"lines_per_sec": 1.0}))
+    saved = tmp_path / "saved.json"
+
+    args = ["--synthetic", "300", "--runs", "1"]
+    assert siem_bench.main(args + ["--baseline", str(fast)]) == 1
+    assert siem_bench.main(args + ["--baseline", str(slow), "--save-baseline", str(saved)]) == 0
+    assert json.loads(saved.read_text())["lines"] == 300
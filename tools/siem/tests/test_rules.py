@@ -0,0 +1,178 @@
+# tests/test_rules.py
+import re
+import threading
+import pytest
+import siem_bench
+
+
+# Lines from generate_sample_logs, plus case and Unicode variants the prefilter lower-cases
+SAMPLE_LOGS = [
+    "Failed login attempt for user 'admin' from IP 192.168.1.100",
+    "User 'john' logged in successfully",
+    "Firewall blocked SQL injection attempt: ' OR '1'='1",
+    "Multiple failed logins detected from IP 10.0.0.5",
+    "File upload attempted: malicious.php",
+    "Port scan detected from 203.0.113.10",
+    "Authentication failure for user 'root'",
+    "XSS attempt detected: <script>alert('xss')</script>",
+    "Admin accessed sensitive configuration file",
+    "Brute force attack detected from 198.51.100.23",
+]
+VARIANTS = SAMPLE_LOGS + [line.upper() for line in SAMPLE_LOGS] + [line.swapcase() for line in SAMPLE_LOGS] + [
+    "FAİLED LOGİN for user 'İsmail'",
+    "ROOT Kernel ACCESS granted",
+    "STRAßE admin Login",
+    "",
+]
+
+# Patterns the MULTILINE batch scan must not let run across the joined lines
+NON_LOCAL_RULES = [
+    {"id": "ANCHORS", "name": "anchors", "pattern": r"^failed.*from ip [\d.]+$", "severity": "LOW"},
+    {"id": "SPACE", "name": "whitespace", "pattern": r"detected\s+from", "severity": "LOW"},
+    {"id": "NEGATED", "name": "negated class", "pattern": r"user '[^']*' from", "severity": "LOW"},
+    {"id": "DOTALL", "name": "dotall", "pattern": r"(?s)admin.*root", "severity": "LOW"},
+    {"id": "TAIL", "name": "line end", "pattern": r"successfully$", "severity": "LOW"},
+]
+
+
+def reference_match(rules, line):
+    """Rule ids a plain re.IGNORECASE search of each pattern matches"""
+    return [rule["id"] for rule in rules if re.search(rule["pattern"], line, re.IGNORECASE)]
+
+
+def pattern_rules(siem):
+    return [rule for rule in siem.RULES if rule.get("pattern") and not rule.get("fields")]
+
+
+@pytest.mark.parametrize("prefilter", [True, False])
+def test_engine_matches_like_plain_regexes(siem, prefilter):
+    rules = pattern_rules(siem) + NON_LOCAL_RULES
+    engine = siem.RuleEngine(rules, prefilter=prefilter, profiler=siem.RuleProfiler())
+    for line in VARIANTS:
+        assert [rule["id"] for rule in engine.match(line)] == reference_match(rules, line), line
+
+
+@pytest.mark.parametrize("prefilter", [True, False])
+def test_batch_matches_like_plain_regexes(siem, prefilter):
+    rules = pattern_rules(siem) + NON_LOCAL_RULES
+    engine = siem.RuleEngine(rules, prefilter=prefilter, profiler=siem.RuleProfiler())
+    lines = VARIANTS + [line for line, _ in siem_bench.synthetic_corpus(500, seed=5)]
+
+    expected = {(rule_id, index) for index, line in enumerate(lines) for rule_id in reference_match(rules, line)}
+    got = {(rule["id"], index) for rule, indexes in engine.match_batch(lines) for index in indexes}
+    assert got == expected
+    # Lines with embedded newlines take the per-line path
+    multiline = ["admin\nroot login", "Port scan\ndetected"]
+    got = {(rule["id"], index) for rule, indexes in engine.match_batch(multiline) for index in indexes}
+    assert got == {(rule_id, index) for index, line in enumerate(multiline) for rule_id in reference_match(rules, line)}
+
+
+def test_prefilter_skips_regexes_and_counts_consistently(siem):
+    rules = pattern_rules(siem)
+    profiler = siem.RuleProfiler(sample_every=7)
+    engine = siem.RuleEngine(rules, prefilter=True, profiler=profiler)
+    lines = [line for line, _ in siem_bench.synthetic_corpus(200, seed=6)]
+
+    def work():
+        for _ in range(20):
+            engine.match_batch(lines)
+            for line in lines[:20]:
+                engine.match(line)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = engine.describe_prefilter()
+    scanned = 4 * 20 * (len(lines) + 20)
+    assert stats["lines_scanned"] == scanned
+    assert stats["regex_evaluations"] + stats["regex_evaluations_skipped"] == scanned * stats["rules_compiled"]
+    assert stats["regex_evaluations_skipped"] > 0
+    # The profiler's per-rule counters saw every evaluation and match too
+    per_rule = profiler.report()["rules"].values()
+    assert sum(counters["evaluations"] for counters in per_rule) == stats["regex_evaluations"]
+    assert sum(counters["matches"] for counters in per_rule) == stats["regex_matches"]
+
+
+def test_threshold_window_counts_batches_and_expires(siem):
+    tracker = siem.ThresholdTracker(max_keys=10)
+    rule = {"id": "T", "threshold": 3, "time_window": 60}
+    assert [tracker.hit(rule, "a", now) for now in (0, 1)] == [0, 0]
+    assert tracker.hit(rule, "a", 2) == 1
+    # Five at once on a fresh key: the third, fourth and fifth reach the threshold
+    assert tracker.hit(rule, "b", 0, count=5) == 3
+    # The window slid past the earlier hits
+    assert tracker.hit(rule, "a", 100) == 0
+
+
+def test_threshold_keys_are_evicted_least_recently_used_first(siem):
+    tracker = siem.ThresholdTracker(max_keys=2)
+    rule = {"id": "T", "threshold": 2, "time_window": 60}
+    tracker.hit(rule, "a", 0)
+    tracker.hit(rule, "b", 0)
+    tracker.hit(rule, "a", 1)
+    tracker.hit(rule, "c", 1)
+    assert tracker.describe() == {"keys": 2, "max_keys": 2, "evictions": 1}
+    # a survived with its count, b starts over
+    assert tracker.hit(rule, "a", 2) == 1
+    assert tracker.hit(rule, "b", 2) == 0
+
+
+def test_group_keys_are_case_insensitive(siem):
+    rules = [
+        {"id": "GRP-CAPTURE", "name": "capture", "pattern": r"failed login for (?P<who>\w+)", "severity": "LOW",
+         "threshold": 3, "time_window": 60, "group_by": "who"},
+        {"id": "GRP-BUILTIN", "name": "builtin", "pattern": r"failed login", "severity": "LOW",
+         "threshold": 3, "time_window": 60, "group_by": "username"},
+    ]
+    engine = siem.RuleEngine(rules, profiler=siem.RuleProfiler())
+    analyzer = siem.SIEMAnalyzer(tip_model=siem.TIP_MODEL)
+    lines = [f"{text} from 10.0.0.1" for text in (
+        "Failed login for Admin", "FAILED LOGIN for ADMIN", "failed login for admin", "Failed login for bob"
+    )]
+    events = [siem.parse_log_line(line) for line in lines]
+
+    assert {engine.group_key(rules[0], line) for line in lines[:3]} == {"admin"}
+    for rule in rules:
+        # The three admin lines share one window; bob's single line stays below the threshold
+        assert analyzer._check_rule_batch(rule, list(range(len(lines))), lines, events, engine=engine) == [2]
+
+
+def test_batch_ingest_raises_the_alerts_line_analysis_would(siem, monkeypatch):
+    monkeypatch.setattr(siem, "THRESHOLDS", siem.ThresholdTracker())
+    analyzer = siem.SIEMAnalyzer(tip_model=siem.TIP_MODEL)
+    expected = {
+        (alert["log_entry"], alert["rule_id"])
+        for line in SAMPLE_LOGS for alert in analyzer.analyze_log_line(line, "ingest-single") or ()
+    }
+    assert expected
+
+    monkeypatch.setattr(siem, "THRESHOLDS", siem.ThresholdTracker())
+    response = siem.app.test_client().post("/api/ingest/batch", json={
+        "logs": SAMPLE_LOGS[:5] + [{"log": line, "source": "ingest-batch"} for line in SAMPLE_LOGS[5:]],
+        "default_source": "ingest-batch",
+    })
+    body = response.get_json()
+    assert response.status_code == 200 and body["logs_processed"] == len(SAMPLE_LOGS)
+    assert {(alert["log_entry"], alert["rule_id"]) for alert in body["alerts"]} == expected
+    assert {alert["source"] for alert in body["alerts"]} == {"ingest-batch"}
+
+
+def test_queued_ingest_reports_analysis_failures(siem, monkeypatch):
+    queue = siem.IngestQueue(capacity=100)
+    monkeypatch.setattr(siem, "INGEST_QUEUE", queue)
+
+    def fail(self, entries, **kwargs):
+        raise RuntimeError("analyzer down")
+
+    monkeypatch.setattr(siem.SIEMAnalyzer, "analyze_batch", fail)
+    response = siem.app.test_client().post("/api/ingest/batch", json={"logs": SAMPLE_LOGS[:3], "wait": True})
+    body = response.get_json()
+    assert response.status_code == 500
+    assert not body["success"] and body["logs_dropped"] == 3 and "analyzer down" in body["error"]
+
+    stats = queue.describe()
+    assert stats["dropped"]["failed"] == 3 and stats["processed"] == 0
+    assert 'siem_ingest_lines_dropped_total{reason="failed"} 3' in siem._render_metrics()
@@ -0,0 +1,213 @@
+# tests/test_store.py
+import time
+import threading
+from datetime import datetime, timedelta
+import pytest
+
+
+# Midday, so a few minutes either way stay in today's partitions
+NOON = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+
+def make_alert(rule_id, log_entry, severity="HIGH", source="auth", when=NOON):
+    return {
+        "id": None, "timestamp": when.isoformat(), "rule_id": rule_id, "rule_name": rule_id, "severity": severity,
+        "description": "", "log_entry": log_entry, "source": source, "acknowledged": False,
+    }
+
+
+def test_repeated_alerts_fold_into_the_first(siem, tmp_path):
+    store = siem.SIEMStore(tmp_path / "store.db", aggregate_window=300)
+    _, stored = store.append(NOON, [], [], [
+        make_alert("R1", "Failed login from 10.0.0.1"),
+        make_alert("R1", "Failed login from 10.0.0.2"),
+        make_alert("R1", "Failed login from 10.0.0.2", source="web"),
+    ])
+    assert [alert["count"] for alert in stored] == [2, 1]
+    first = stored[0]
+
+    # Numbers are masked in the fingerprint, so a later repeat updates the same alert
+    later = NOON + timedelta(seconds=60)
+    _, again = store.append(later, [], [], [make_alert("R1", "Failed login from 10.0.0.3", when=later)])
+    assert len(again) == 1
+    assert again[0]["id"] == first["id"]
+    assert again[0]["count"] == 3
+    assert again[0]["first_seen"] == first["first_seen"]
+    assert again[0]["last_seen"] == later.isoformat()
+    assert store.get_alert(first["id"])["count"] == 3
+
+    counters = store.counters()
+    assert counters["alerts"] == 2
+    assert counters["alert_repeats"] == 2
+    # Rollups still count every occurrence
+    trends = store.alert_trends(NOON - timedelta(minutes=5), "minute", rule_id="R1")
+    assert sum(count for _, _, count in trends) == 4
+
+
+def test_aggregation_window_and_acknowledgement_start_new_alerts(siem, tmp_path):
+    store = siem.SIEMStore(tmp_path / "store.db", aggregate_window=300)
+    _, (first,) = store.append(NOON, [], [], [make_alert("R1", "Port scan from 10.0.0.1")])
+
+    # Past the window: a new alert
+    late = NOON + timedelta(seconds=301)
+    _, (second,) = store.append(late, [], [], [make_alert("R1", "Port scan from 10.0.0.1", when=late)])
+    assert second["id"] != first["id"] and second["count"] == 1
+
+    # An acknowledged alert is closed; its repeats open a new one
+    store.acknowledge_alerts([second["id"]])
+    _, (third,) = store.append(late, [], [], [make_alert("R1", "Port scan from 10.0.0.1", when=late)])
+    assert third["id"] not in (first["id"], second["id"])
+
+
+def test_aggregation_disabled_stores_every_alert(siem, tmp_path):
+    store = siem.SIEMStore(tmp_path / "store.db", aggregate_window=0)
+    _, stored = store.append(NOON, [], [], [make_alert("R1", "Failed login from 10.0.0.1") for _ in range(3)])
+    assert len({alert["id"] for alert in stored}) == 3
+    assert store.counters()["alerts"] == 3
+
+
+def test_alert_registry_pages_and_acknowledges(siem, tmp_path):
+    store = siem.SIEMStore(tmp_path / "store.db")
+    severities = ["HIGH", "LOW", "HIGH", "LOW", "CRITICAL"]
+    _, stored = store.append(NOON, [], [], [
+        make_alert(f"R{i}", "Brute force attack detected", severity=severity) for i, severity in enumerate(severities)
+    ])
+    ids = [alert["id"] for alert in stored]
+    assert store.get_alert(ids[2])["rule_id"] == "R2"
+    assert store.get_alert("ALERT-999999") is None
+
+    # Newest first, two at a time
+    pages, before = [], None
+    while True:
+        alerts, before = store.list_alerts(limit=2, before=before)
+        pages.append([alert["id"] for alert in alerts])
+        if before is None:
+            break
+    assert pages == [ids[:2:-1], ids[2:0:-1], ids[:1]]
+
+    assert [alert["id"] for alert in store.acknowledge_alerts([ids[0], "ALERT-999999", ids[1]])] == [ids[0], ids[1]]
+    store.acknowledge_alerts([ids[0]])  # already acknowledged: not counted twice
+    assert store.counters()["alerts:unacked"] == 3
+    assert store.acknowledge_matching(severity="LOW") == 1
+    open_alerts, _ = store.list_alerts(acknowledged=False)
+    assert [alert["id"] for alert in open_alerts] == [ids[4], ids[2]]
+    assert store.counters()["alerts:unacked"] == 2
+    assert store.get_alert(ids[3])["acknowledged"]
+
+
+def test_alert_registry_is_backfilled_and_follows_retention(siem, tmp_path):
+    path = tmp_path / "store.db"
+    store = siem.SIEMStore(path, alert_retention_days=5)
+    old = datetime.now() - timedelta(days=10)
+    _, (expired,) = store.append(old, [], [], [make_alert("OLD", "Port scan detected", when=old)])
+    _, (current,) = store.append(NOON, [], [], [make_alert("NEW", "Port scan detected")])
+    assert store.counters()["alerts:unacked"] == 2
+
+    # Stores created before the registry existed get it built on open
+    conn = store._connection()
+    conn.execute("DROP TABLE alert_ids")
+    conn.execute("UPDATE counters SET value = 0 WHERE name = 'alerts:unacked'")
+    reopened = siem.SIEMStore(path, alert_retention_days=5)
+    assert reopened.get_alert(current["id"])["rule_id"] == "NEW"
+    # Opening also enforced retention: the old partition and its open alert are gone
+    assert reopened.get_alert(expired["id"]) is None
+    assert reopened.counters()["alerts:unacked"] == 1
+
+
+def test_logs_persist_across_store_instances_until_retention(siem, tmp_path):
+    path = tmp_path / "store.db"
+    store = siem.SIEMStore(path, log_retention_days=3)
+    store.append(datetime.now() - timedelta(days=5), ["old line"], ["auth"])
+    last, _ = store.append(NOON, ["first line", "second line"], ["auth", "web"])
+    assert last == 3
+
+    reopened = siem.SIEMStore(path, log_retention_days=3)
+    assert [line.split("] ", 1)[1] for line in reopened.recent_logs(10)] == ["auth: first line", "web: second line"]
+    # Lifetime totals survive the dropped partition
+    assert reopened.log_count() == 3
+
+
+@pytest.fixture
+def search_store(siem, tmp_path):
+    """A store with matching lines on three days, two hours apart on each"""
+    store = siem.SIEMStore(tmp_path / "store.db", log_retention_days=0)
+    for days_ago in (2, 1, 0):
+        for hour in (10, 12):
+            when = NOON.replace(hour=hour) - timedelta(days=days_ago)
+            store.append(when, [
+                f"Failed login for user admin from 10.0.{days_ago}.{hour}",
+                f"GET /index.html 200 from 10.0.{days_ago}.{hour}",
+            ], ["auth", "web"])
+    return store
+
+
+def messages(lines):
+    return [line.split("] ", 1)[1] for line in lines]
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_search_pages_across_partitions(search_store, indexed):
+    search_store.search_indexed = search_store.search_indexed and indexed
+    total, everything = search_store.search_logs("failed login", limit=100)
+    assert total == 6
+    assert messages(everything)[0] == "auth: Failed login for user admin from 10.0.2.10"
+
+    pages = [search_store.search_logs("failed login", limit=4, offset=offset)[1] for offset in (0, 4)]
+    assert [len(page) for page in pages] == [4, 2]
+    assert pages[0] + pages[1] == everything
+
+    total, newest = search_store.search_logs("failed login", limit=1, newest_first=True)
+    assert total == 6 and messages(newest) == ["auth: Failed login for user admin from 10.0.0.12"]
+    assert search_store.search_logs(ip="10.0.1.12", source="web")[0] == 1
+    assert search_store.search_logs(user="admin")[0] == 6
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_search_prunes_by_time(search_store, indexed):
+    search_store.search_indexed = search_store.search_indexed and indexed
+    yesterday = NOON - timedelta(days=1)
+    since = yesterday.replace(hour=11).timestamp()
+    until = NOON.replace(hour=11).timestamp()
+    total, lines = search_store.search_logs("failed", since=since, until=until)
+    assert total == 2
+    assert messages(lines) == [
+        "auth: Failed login for user admin from 10.0.1.12",
+        "auth: Failed login for user admin from 10.0.0.10",
+    ]
+    assert search_store.search_logs("failed", since=NOON.timestamp() + 1)[0] == 0
+
+
+def test_failed_batches_are_retried_then_dead_lettered(siem, tmp_path):
+    store = siem.SIEMStore(tmp_path / "store.db")
+    payload = '{"entries": [["Port scan detected from 10.0.0.1", "fw"]], "tip_rows": null}'
+    store.enqueue("t1", [(0, payload)])
+    (seq, _, _), = store.dequeue(0, 10)
+
+    # Below the limit the batch stays queued for another attempt
+    assert [store.fail_queued(seq, "t1", "boom", max_attempts=3) for _ in range(2)] == [1, 2]
+    assert store.dequeue(0, 10) == [(seq, "t1", payload)]
+    assert store.take_results("t1", 1) is None
+
+    assert store.fail_queued(seq, "t1", "boom", max_attempts=3) == 3
+    assert store.dequeue(0, 10) == []
+    assert store.dead_letter_count() == 1
+    # The submitter sees the failure, not an empty alert list
+    assert store.take_results("t1", 1) == [([], "boom")]
+
+
+def test_submit_raises_when_a_batch_was_dead_lettered(siem, tmp_path, monkeypatch):
+    store = siem.SIEMStore(tmp_path / "store.db")
+    monkeypatch.setattr(siem, "STORE", store)
+    pool = siem.AnalysisPool(shards=1)
+
+    def worker():
+        while not (items := store.dequeue(0, 1)):
+            time.sleep(0.01)
+        (seq, ticket, _), = items
+        store.fail_queued(seq, ticket, "analyzer down", max_attempts=1)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    with pytest.raises(RuntimeError, match="analyzer down"):
+        pool.submit([("Port scan detected from 10.0.0.1", "fw")])
+    thread.join()
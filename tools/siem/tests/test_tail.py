@@ -0,0 +1,60 @@
+# tests/test_tail.py
+import time
+
+
+def stored_lines(siem, source):
+    _, lines = siem.STORE.search_logs(source=source, limit=1000)
+    return [line.split(": ", 1)[1] for line in lines]
+
+
+def wait_for_checkpoint(siem, path, offset, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        saved = siem.STORE.tail_checkpoint(path)
+        if saved is not None and saved.offset == offset:
+            return saved
+        time.sleep(0.02)
+    raise AssertionError(f"checkpoint never reached offset {offset}")
+
+
+def tail(siem, path, source, client, from_start=False):
+    tailer = siem.FileTailer(use_inotify=False, poll_interval=0.02)
+    tailer.subscribe(client, path, source, from_start=from_start)
+    return tailer
+
+
+def test_tailed_lines_are_stored_exactly_once_across_restarts(siem, tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("line 1\nline 2\n")
+
+    tailer = tail(siem, path, "tail-restart", "c1", from_start=True)
+    wait_for_checkpoint(siem, str(path), path.stat().st_size)
+    with open(path, "a") as f:
+        f.write("line 3\npartial")
+    wait_for_checkpoint(siem, str(path), len("line 1\nline 2\nline 3\n"))
+    tailer.unsubscribe("c1")
+
+    # While nobody tails it the partial line is completed and more arrive
+    with open(path, "a") as f:
+        f.write(" line 4\nline 5\n")
+    # A new reader resumes from the checkpoint, even when asked to start over
+    tailer = tail(siem, path, "tail-restart", "c2", from_start=True)
+    wait_for_checkpoint(siem, str(path), path.stat().st_size)
+    tailer.unsubscribe("c2")
+    assert stored_lines(siem, "tail-restart") == ["line 1", "line 2", "line 3", "partial line 4", "line 5"]
+
+
+def test_rewritten_file_is_read_from_the_start(siem, tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("first 1\nfirst 2\n")
+    tailer = tail(siem, path, "tail-rewrite", "c1", from_start=True)
+    wait_for_checkpoint(siem, str(path), path.stat().st_size)
+    tailer.unsubscribe("c1")
+
+    # Same inode, different first bytes: the checkpoint no longer applies
+    with open(path, "w") as f:
+        f.write("second 1\nsecond 2\nsecond 3\n")
+    tailer = tail(siem, path, "tail-rewrite", "c2")
+    wait_for_checkpoint(siem, str(path), path.stat().st_size)
+    tailer.unsubscribe("c2")
+    assert stored_lines(siem, "tail-rewrite") == ["first 1", "first 2", "second 1", "second 2", "second 3"]
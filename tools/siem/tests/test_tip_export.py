@@ -0,0 +1,130 @@
+# tests/test_tip_export.py
+import json
+import pytest
+import siem_tip_export
+
+np = pytest.importorskip("numpy")
+
+
+class Dense:
+    def __init__(self, name, kernel, bias, activation):
+        self.name = name
+        self._weights = [kernel, bias]
+        self._config = {"activation": activation, "use_bias": True}
+
+    def get_config(self):
+        return self._config
+
+    def get_weights(self):
+        return self._weights
+
+
+class BatchNormalization(Dense):
+    def __init__(self, name, width):
+        self.name = name
+        self._weights = [np.full(width, 2.0), np.full(width, 0.5), np.full(width, 0.1), np.full(width, 4.0)]
+        self._config = {"epsilon": 1e-3, "center": True, "scale": True}
+
+
+class Conv1D(Dense):
+    def __init__(self):
+        self.name = "conv"
+        self._weights = []
+        self._config = {}
+
+
+def make_network(siem, seed=0):
+    """(scaler, layers, labels) of a small random dense classifier over the TIP features"""
+    rng = np.random.default_rng(seed)
+    width = len(siem.TIP_FEATURES)
+    scaler = ({"kind": "standard"}, {"mean": rng.uniform(0, 1000, width), "scale": rng.uniform(1, 500, width)})
+    layers = [
+        siem_tip_export.layer_spec(Dense("hidden", rng.standard_normal((width, 16)), rng.standard_normal(16), "relu"),
+                                   siem.TIP_ACTIVATIONS),
+        siem_tip_export.layer_spec(BatchNormalization("norm", 16), siem.TIP_ACTIVATIONS),
+        siem_tip_export.layer_spec(Dense("out", rng.standard_normal((16, 3)), rng.standard_normal(3), "softmax"),
+                                   siem.TIP_ACTIVATIONS),
+    ]
+    return scaler, layers, ["BENIGN", "DDoS", "PortScan"]
+
+
+def reference_probs(scaler, layers, rows):
+    """Straightforward float64 forward pass to check the runtime against"""
+    x = (rows - scaler[1]["mean"]) / scaler[1]["scale"]
+    for spec, arrays in layers:
+        if spec["type"] == "dense":
+            x = x @ arrays["kernel"] + arrays["bias"]
+        else:
+            x = (x - arrays["mean"]) / np.sqrt(arrays["variance"] + spec["epsilon"]) * arrays["gamma"] + arrays["beta"]
+        if spec.get("activation") == "relu":
+            x = np.maximum(x, 0)
+        elif spec.get("activation") == "softmax":
+            x = np.exp(x - x.max(axis=1, keepdims=True))
+            x = x / x.sum(axis=1, keepdims=True)
+    return x
+
+
+def test_layer_spec_rejects_unsupported_layers(siem):
+    assert siem_tip_export.layer_spec(type("Dropout", (), {"get_config": lambda self: {}, "get_weights": lambda self: []})(),
+                                      siem.TIP_ACTIVATIONS) is None
+    with pytest.raises(ValueError, match="Conv1D"):
+        siem_tip_export.layer_spec(Conv1D(), siem.TIP_ACTIVATIONS)
+    with pytest.raises(ValueError, match="swish"):
+        siem_tip_export.layer_spec(Dense("d", np.ones((2, 2)), np.ones(2), "swish"), siem.TIP_ACTIVATIONS)
+
+
+def test_numpy_runtime_matches_reference(siem, tmp_path):
+    scaler, layers, labels = make_network(siem)
+    siem_tip_export.write_bundle(tmp_path / "runtime", siem.TIP_FEATURES, scaler, layers, labels)
+    runtime = siem._NumpyTIPRuntime(tmp_path / "runtime")
+
+    rows = siem_tip_export.sample_rows(tmp_path / "runtime", 500, seed=1)
+    probs = runtime.forward(runtime.transform(rows))
+    assert np.allclose(probs, reference_probs(scaler, layers, rows), atol=1e-4)
+    assert list(runtime.labels(np.array([2, 0]))) == ["PortScan", "BENIGN"]
+    # Weights are memory-mapped, not copied into each process
+    assert isinstance(runtime._layers[0][3]["kernel"], np.memmap)
+
+
+def test_compare_flags_a_bundle_that_drifted(siem, tmp_path):
+    scaler, layers, labels = make_network(siem)
+    siem_tip_export.write_bundle(tmp_path / "good", siem.TIP_FEATURES, scaler, layers, labels)
+    drifted = [(spec, {key: value + 0.05 for key, value in arrays.items()}) for spec, arrays in layers]
+    siem_tip_export.write_bundle(tmp_path / "bad", siem.TIP_FEATURES, scaler, drifted, labels)
+    good = siem._NumpyTIPRuntime(tmp_path / "good")
+    rows = siem_tip_export.sample_rows(tmp_path / "good", 300)
+
+    assert siem_tip_export.compare(good, siem._NumpyTIPRuntime(tmp_path / "good"), rows, 1e-6)["ok"]
+    report = siem_tip_export.compare(good, siem._NumpyTIPRuntime(tmp_path / "bad"), rows, 1e-4)
+    assert not report["ok"]
+    assert report["max_abs_diff"] > 1e-4
+
+
+def test_tip_model_loads_bundle_lazily(siem, tmp_path, monkeypatch):
+    monkeypatch.setenv("SIEM_TIP_ENABLED", "true")
+    monkeypatch.setenv("SIEM_TIP_RUNTIME", "numpy")
+    scaler, layers, labels = make_network(siem)
+    siem_tip_export.write_bundle(tmp_path / siem.TIP_RUNTIME_DIR, siem.TIP_FEATURES, scaler, layers, labels)
+
+    model = siem.TIPModel(tmp_path)
+    assert model.loaded is None and model.runtime is None
+    assert model.version != "unavailable"
+
+    rows = siem_tip_export.sample_rows(tmp_path / siem.TIP_RUNTIME_DIR, 50, seed=2)
+    results = model.predict_sparse([None] + rows.tolist())
+    assert model.loaded and model.runtime == "numpy"
+    assert results[0] is None
+    expected = reference_probs(scaler, layers, rows)
+    assert [result["label"] for result in results[1:]] == [labels[i] for i in expected.argmax(axis=1)]
+    assert all(result["is_malicious"] == (result["label"] != "BENIGN") for result in results[1:])
+
+    payload = json.dumps(dict(zip(siem.TIP_FEATURES, rows[0].tolist())))
+    assert model.row_from_event(siem.parse_log_line(payload)) == pytest.approx(rows[0].tolist())
+
+
+def test_tip_model_without_files_is_unavailable(siem, tmp_path, monkeypatch):
+    monkeypatch.setenv("SIEM_TIP_RUNTIME", "numpy")
+    model = siem.TIPModel(tmp_path)
+    assert model.version == "unavailable"
+    assert not model.available
+    assert model.loaded is False
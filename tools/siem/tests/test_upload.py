@@ -0,0 +1,36 @@
+# tests/test_upload.py
+import io
+import json
+
+
+class CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_json_reader_decodes_arrays_and_multiline_values(siem, monkeypatch):
+    monkeypatch.setattr(siem, "JSON_READ_SIZE", 8)
+    assert list(siem._iter_json_records(io.StringIO('[1, {"a": "bcdefghij"}, 3]'))) == [
+        ("1", 1), ('{"a": "bcdefghij"}', {"a": "bcdefghij"}), ("3", 3)
+    ]
+    assert list(siem._iter_json_records(io.StringIO('{"a":\n 1}\n{"b": 2}'))) == [
+        ('{"a": 1}', {"a": 1}), ('{"b": 2}', {"b": 2})
+    ]
+
+
+def test_json_reader_falls_back_at_a_malformed_line_without_buffering_the_file(siem, monkeypatch):
+    monkeypatch.setattr(siem, "JSON_READ_SIZE", 1024)
+    records = [{"i": i, "msg": "Failed login for user admin"} for i in range(5000)]
+    f = CountingReader("not json {\n" + "".join(json.dumps(record) + "\n" for record in records))
+
+    stream = siem._iter_json_records(f)
+    assert next(stream) == ("not json {", None)
+    assert f.reads == 1, "a malformed line must not pull the rest of the file into the buffer"
+    rest = list(stream)
+    # Later lines are still decoded as records
+    assert [value for _, value in rest] == records